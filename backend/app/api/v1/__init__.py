@@ -1,6 +1,8 @@
 from fastapi import APIRouter
-from app.api.v1 import resume, payment
+from app.api.v1 import admin, documents, resume, payment
 
 api_router = APIRouter(prefix="/api/v1")
+api_router.include_router(documents.router)
 api_router.include_router(resume.router)
 api_router.include_router(payment.router)
+api_router.include_router(admin.router)
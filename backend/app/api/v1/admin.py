@@ -0,0 +1,84 @@
+"""
+Admin profiling endpoints.
+
+All routes need ``Authorization: Bearer <ADMIN_TOKEN>`` and answer 404
+while ``ADMIN_TOKEN`` is unset. Profiles describe the worker process that
+serves the request.
+"""
+import asyncio
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import get_settings
+from app.services import profiler
+
+settings = get_settings()
+
+
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix="/admin/profile", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/cpu", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = Query(10.0, gt=0),
+    hz: int = Query(100, gt=0),
+):
+    """Sample every thread for `seconds` and return collapsed stacks.
+
+    Feed the output to flamegraph.pl or speedscope.
+    """
+    if seconds > settings.PROFILE_MAX_SECONDS or hz > settings.PROFILE_MAX_HZ:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.PROFILE_MAX_SECONDS:g} seconds at {settings.PROFILE_MAX_HZ} Hz",
+        )
+    try:
+        stacks = await asyncio.to_thread(profiler.sample_cpu, seconds, hz)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profiler.format_collapsed(stacks))
+
+
+@router.get("/loop")
+async def loop_stalls():
+    """Recent event loop stalls, newest last, with the blocking task and stack."""
+    monitor = profiler.get_monitor()
+    if monitor is None:
+        raise HTTPException(status_code=409, detail="Loop monitor is not running")
+    return {
+        "interval_seconds": monitor.interval,
+        "threshold_seconds": monitor.stall_threshold,
+        "stalls": list(monitor.stalls),
+    }
+
+
+@router.post("/heap/snapshots")
+async def take_heap_snapshot(top: int = Query(25, gt=0, le=500)):
+    """Take a tracemalloc snapshot, starting tracing on the first call."""
+    return await asyncio.to_thread(profiler.get_heap_profiler().snapshot, top)
+
+
+@router.get("/heap/snapshots/{base}/diff/{target}")
+async def diff_heap_snapshots(base: int, target: int, top: int = Query(25, gt=0, le=500)):
+    """Largest allocation changes from snapshot `base` to `target`."""
+    stats = await asyncio.to_thread(profiler.get_heap_profiler().diff, base, target, top)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return {"base": base, "target": target, "stats": stats}
+
+
+@router.delete("/heap", status_code=204)
+async def stop_heap_tracing():
+    """Stop tracemalloc and drop the kept snapshots."""
+    profiler.get_heap_profiler().stop()
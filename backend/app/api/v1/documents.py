@@ -0,0 +1,211 @@
+"""
+Resume documents: server-side CRUD with JSON Patch saves.
+
+Every response carries the document version as an ``ETag``; a save sends
+it back in ``If-Match`` and gets ``412`` if the document changed since.
+Earlier versions can be listed, fetched and restored under ``/versions``.
+"""
+from datetime import datetime
+from typing import Any, Optional
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Response
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.jsonpatch import JsonPatchError
+from app.services import document_service, version_history
+
+router = APIRouter(prefix="/resume/documents", tags=["documents"])
+
+
+class DocumentCreate(BaseModel):
+    title: str = Field("Untitled Resume", max_length=255)
+    template_id: str = Field("modern", max_length=50)
+    data: dict[str, Any] = Field(default_factory=dict)
+
+
+class DocumentSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    template_id: str
+    version: int
+    updated_at: Optional[datetime] = None
+
+
+class DocumentResponse(DocumentSummary):
+    data: dict[str, Any]
+    created_at: Optional[datetime] = None
+
+
+class DocumentSaved(BaseModel):
+    id: int
+    version: int
+
+
+class VersionSummary(BaseModel):
+    version: int
+    created_at: Optional[datetime] = None
+
+
+class VersionResponse(VersionSummary):
+    title: str
+    template_id: str
+    data: dict[str, Any]
+
+
+def _etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _conflict(e: document_service.VersionConflict) -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail={"error": "version_conflict", "current_version": e.current_version},
+        headers={"ETag": _etag(e.current_version)},
+    )
+
+
+def _parse_if_match(if_match: Optional[str]) -> int:
+    if if_match is None:
+        raise HTTPException(status_code=428, detail="If-Match with the document version is required")
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a document version")
+
+
+@router.post("", response_model=DocumentResponse, status_code=201)
+async def create_document(
+    request: DocumentCreate,
+    response: Response,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create a resume document."""
+    try:
+        resume = await document_service.create_document(
+            db, x_device_id, request.title, request.template_id, request.data
+        )
+    except document_service.InvalidDocument as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    response.headers["ETag"] = _etag(resume.version)
+    return resume
+
+
+@router.get("", response_model=list[DocumentSummary])
+async def list_documents(
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """List the device's resume documents (without their data)."""
+    return await document_service.list_documents(db, x_device_id)
+
+
+@router.get("/{document_id}", response_model=DocumentResponse)
+async def get_document(
+    document_id: int,
+    response: Response,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a resume document."""
+    resume = await document_service.get_document(db, x_device_id, document_id)
+    if resume is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    response.headers["ETag"] = _etag(resume.version)
+    return resume
+
+
+@router.patch("/{document_id}", response_model=DocumentSaved)
+async def save_document(
+    document_id: int,
+    response: Response,
+    patch: list[dict[str, Any]] = Body(..., media_type="application/json-patch+json"),
+    if_match: Optional[str] = Header(None),
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Save changes as an RFC 6902 JSON Patch against the If-Match version.
+
+    Paths address ``/title``, ``/template_id`` and ``/data/...``, e.g.
+    ``[{"op": "replace", "path": "/data/personalInfo/name", "value": "Ada"}]``.
+    """
+    expected = _parse_if_match(if_match)
+    try:
+        version = await document_service.patch_document(db, x_device_id, document_id, expected, patch)
+    except document_service.VersionConflict as e:
+        raise _conflict(e)
+    except (JsonPatchError, document_service.InvalidDocument) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if version is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    response.headers["ETag"] = _etag(version)
+    return DocumentSaved(id=document_id, version=version)
+
+
+@router.get("/{document_id}/versions", response_model=list[VersionSummary])
+async def list_versions(
+    document_id: int,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """List saved versions of a document, newest first."""
+    if await document_service.get_document(db, x_device_id, document_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return [
+        VersionSummary(version=row.version, created_at=row.created_at)
+        for row in await version_history.list_versions(db, document_id)
+    ]
+
+
+@router.get("/{document_id}/versions/{version}", response_model=VersionResponse)
+async def get_version(
+    document_id: int,
+    version: int,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a document as it was at an earlier version."""
+    found = None
+    if await document_service.get_document(db, x_device_id, document_id) is not None:
+        found = await version_history.get_version(db, document_id, version)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    document, created_at = found
+    return VersionResponse(version=version, created_at=created_at, **document)
+
+
+@router.post("/{document_id}/versions/{version}/restore", response_model=DocumentSaved)
+async def restore_version(
+    document_id: int,
+    version: int,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Save an earlier version as the document's new current version."""
+    expected = _parse_if_match(if_match)
+    try:
+        new_version = await document_service.restore_version(db, x_device_id, document_id, version, expected)
+    except document_service.VersionConflict as e:
+        raise _conflict(e)
+    if new_version is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    response.headers["ETag"] = _etag(new_version)
+    return DocumentSaved(id=document_id, version=new_version)
+
+
+@router.delete("/{document_id}", status_code=204)
+async def delete_document(
+    document_id: int,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Delete a resume document."""
+    if not await document_service.delete_document(db, x_device_id, document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return Response(status_code=204)
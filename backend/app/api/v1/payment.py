@@ -5,19 +5,16 @@ Based on creem-payment skill template.
 import hmac
 import hashlib
 import json
-import httpx
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from dataclasses import dataclass
+from fastapi import APIRouter, Depends, HTTPException, Request, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import Optional
 
 from app.core.config import get_settings
 from app.core.database import get_db
-from app.models.token import GenerationToken, PaymentTransaction
-from app.services import token_service
-from app.metrics import payment_success, payment_revenue
+from app.core.http import etag_matches
+from app.services import creem_client, webhook_inbox
 
 settings = get_settings()
 
@@ -29,13 +26,6 @@ PRODUCTS = {
 }
 
 
-def get_creem_api_base():
-    """Use test API for test keys, production API for live keys."""
-    if settings.CREEM_API_KEY.startswith("creem_test_"):
-        return "https://test-api.creem.io/v1"
-    return "https://api.creem.io/v1"
-
-
 router = APIRouter(prefix="/payment", tags=["payment"])
 
 
@@ -59,27 +49,55 @@ class CreateCheckoutResponse(BaseModel):
     session_id: str
 
 
-@router.get("/products", response_model=list[Product])
-async def get_products():
-    """Get available product packages."""
-    products = []
-    for sku, info in PRODUCTS.items():
-        discount = None
-        if len(PRODUCTS) > 1:
-            per_unit_prices = {k: v["price"] / v["generations"] for k, v in PRODUCTS.items()}
-            max_per_unit = max(per_unit_prices.values())
-            this_per_unit = per_unit_prices[sku]
-            if this_per_unit < max_per_unit:
-                discount = int(((max_per_unit - this_per_unit) / max_per_unit) * 100)
-        
-        products.append(Product(
+@dataclass(frozen=True)
+class Catalog:
+    """The product list, serialized once, with its ETag."""
+    body: bytes
+    etag: str
+
+
+def build_catalog(products: dict = PRODUCTS) -> Catalog:
+    """Serialize the products with their discount relative to the priciest per-generation SKU."""
+    per_unit_prices = {sku: info["price"] / info["generations"] for sku, info in products.items()}
+    max_per_unit = max(per_unit_prices.values(), default=0)
+    catalog = [
+        Product(
             sku=sku,
             name=info["name"],
             price_cents=info["price"],
             generations=info["generations"],
-            discount_percent=discount,
-        ))
-    return products
+            discount_percent=(
+                int(((max_per_unit - per_unit_prices[sku]) / max_per_unit) * 100)
+                if per_unit_prices[sku] < max_per_unit else None
+            ),
+        )
+        for sku, info in products.items()
+    ]
+    body = TypeAdapter(list[Product]).dump_json(catalog)
+    return Catalog(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+_catalog = build_catalog()
+
+
+def reload_catalog() -> Catalog:
+    """Rebuild the served catalog after PRODUCTS changes."""
+    global _catalog
+    _catalog = build_catalog()
+    return _catalog
+
+
+@router.get("/products", response_model=list[Product])
+async def get_products(if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
+    """Get available product packages.
+
+    Served from the prebuilt catalog; clients revalidate with If-None-Match.
+    """
+    catalog = _catalog
+    headers = {"ETag": catalog.etag, "Cache-Control": "public, max-age=300"}
+    if etag_matches(if_none_match, catalog.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
 
 
 @router.post("/create-checkout", response_model=CreateCheckoutResponse)
@@ -90,57 +108,29 @@ async def create_checkout(
     """Create a Creem checkout session."""
     if request.product_sku not in PRODUCTS:
         raise HTTPException(status_code=400, detail="Invalid product SKU")
-    
-    # Parse product IDs from settings
-    try:
-        creem_product_ids = json.loads(settings.CREEM_PRODUCT_IDS) if settings.CREEM_PRODUCT_IDS else {}
-    except:
-        creem_product_ids = {}
-    
-    creem_product_id = creem_product_ids.get(request.product_sku)
-    if not creem_product_id:
-        raise HTTPException(status_code=400, detail="Product not configured in Creem")
 
     product = PRODUCTS[request.product_sku]
-
     try:
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "product_id": creem_product_id,
-                "success_url": request.success_url,
-                "metadata": {
-                    "product_sku": request.product_sku,
-                    "device_id": request.device_id,
-                    "generations": str(product["generations"]),
-                },
-            }
-            if request.optional_email:
-                payload["customer"] = {"email": request.optional_email}
-
-            response = await client.post(
-                f"{get_creem_api_base()}/checkouts",
-                headers={
-                    "Content-Type": "application/json",
-                    "x-api-key": settings.CREEM_API_KEY,
-                },
-                json=payload,
-                timeout=30.0,
-            )
-
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Creem API error: {response.text}",
-                )
-
-            data = response.json()
-            return CreateCheckoutResponse(
-                checkout_url=data["checkout_url"],
-                session_id=data["id"],
-            )
-
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=500, detail=f"Payment service error: {str(e)}")
+        data = await creem_client.create_checkout(
+            request.product_sku,
+            request.device_id,
+            product["generations"],
+            request.success_url,
+            request.optional_email,
+        )
+    except creem_client.CreemUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Payment service is temporarily unavailable",
+            headers={"Retry-After": str(max(int(e.retry_after), 1))},
+        )
+    except creem_client.CreemError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    return CreateCheckoutResponse(
+        checkout_url=data["checkout_url"],
+        session_id=data["id"],
+    )
 
 
 def verify_creem_signature(payload: bytes, signature: str, secret: str) -> bool:
@@ -155,7 +145,11 @@ async def creem_webhook(
     creem_signature: str = Header(None, alias="creem-signature"),
     db: AsyncSession = Depends(get_db),
 ):
-    """Handle Creem webhook events."""
+    """Receive Creem webhook events.
+
+    Events are stored in the webhook inbox and acknowledged immediately;
+    the inbox worker grants tokens and records transactions.
+    """
     payload = await request.body()
 
     if settings.CREEM_WEBHOOK_SECRET:
@@ -168,43 +162,8 @@ async def creem_webhook(
         event = json.loads(payload.decode("utf-8"))
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    if not isinstance(event, dict):
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
 
-    event_type = event.get("eventType")
-
-    if event_type == "checkout.completed":
-        await _handle_checkout_completed(event, db)
-
+    await webhook_inbox.enqueue(db, payload, event)
     return {"received": True}
-
-
-async def _handle_checkout_completed(event: dict, db: AsyncSession):
-    """Handle successful checkout — add tokens + record transaction."""
-    obj = event.get("object", {})
-    metadata = obj.get("metadata", {})
-    order = obj.get("order", {})
-
-    product_sku = metadata.get("product_sku")
-    device_id = metadata.get("device_id")
-    generations = int(metadata.get("generations", 1))
-    amount_cents = order.get("amount", 0)
-
-    # Add tokens to device
-    await token_service.add_tokens(db, device_id, generations)
-
-    # Record transaction
-    transaction = PaymentTransaction(
-        checkout_id=obj.get("id"),
-        device_id=device_id,
-        product_sku=product_sku,
-        amount_cents=amount_cents,
-        currency=order.get("currency", "USD"),
-        status="completed",
-        tokens_granted=generations,
-        completed_at=datetime.utcnow(),
-    )
-    db.add(transaction)
-    await db.commit()
-    
-    # Update metrics
-    payment_success.labels(tool="resume-builder", product_sku=product_sku).inc()
-    payment_revenue.labels(tool="resume-builder").inc(amount_cents)
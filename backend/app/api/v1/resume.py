@@ -1,13 +1,22 @@
+import asyncio
+import json
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel
-from typing import Optional
-from app.core.database import get_db
-from app.services import llm_service, token_service
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Callable, Optional
+from app.core import tracing
+from app.core.config import get_settings
+from app.core.database import get_db, get_session_factory
+from app.core.http import etag_matches
+from app.services import document_service, llm_service, pdf_cache, pdf_service, token_service
 from app.metrics import (
-    core_function_calls, tokens_consumed, free_trial_used
+    core_function_calls, tokens_consumed, free_trial_used, pdf_cache_requests
 )
 
+settings = get_settings()
+
 router = APIRouter(prefix="/resume", tags=["resume"])
 
 
@@ -24,6 +33,25 @@ class GenerateResponse(BaseModel):
     source: str  # "paid" or "free"
 
 
+class BatchGenerateRequest(BaseModel):
+    job_title: str
+    sections: list[str] = Field(default=["experience", "summary", "skills"], min_length=1, max_length=10)
+    context: Optional[str] = ""
+    language: str = "en"
+
+
+class SectionResult(BaseModel):
+    section: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchGenerateResponse(BaseModel):
+    results: list[SectionResult]
+    tokens_remaining: int
+    source: str  # "paid", "free" or "mixed"
+
+
 class CoverLetterRequest(BaseModel):
     job_title: str
     company: str
@@ -38,6 +66,27 @@ class TokenStatusResponse(BaseModel):
     can_generate: bool
 
 
+async def _reserve(
+    db: AsyncSession,
+    device_id: str,
+    count: int = 1,
+    detail: str = "Daily free limit reached. Purchase tokens to continue."
+) -> token_service.Reservation:
+    """Debit generations up front, or fail with 402."""
+    reservation = await token_service.reserve_generations(db, device_id, count)
+    if reservation is None:
+        raise HTTPException(status_code=402, detail=detail)
+    return reservation
+
+
+def _record_usage(function: str, reservation: token_service.Reservation):
+    core_function_calls.labels(tool="resume-builder", function=function).inc()
+    if reservation.paid:
+        tokens_consumed.labels(tool="resume-builder").inc(reservation.paid)
+    if reservation.free:
+        free_trial_used.labels(tool="resume-builder").inc(reservation.free)
+
+
 @router.post("/generate", response_model=GenerateResponse)
 async def generate_content(
     request: GenerateRequest,
@@ -46,13 +95,8 @@ async def generate_content(
 ):
     """Generate resume content using AI."""
     
-    # Check if can generate
-    can_gen, source = await token_service.can_generate(db, x_device_id)
-    if not can_gen:
-        raise HTTPException(
-            status_code=402,
-            detail="Daily free limit reached. Purchase tokens to continue."
-        )
+    # Reserve a generation (released if the LLM call fails)
+    reservation = await _reserve(db, x_device_id)
     
     # Generate content
     try:
@@ -63,25 +107,68 @@ async def generate_content(
             language=request.language
         )
     except Exception as e:
+        await token_service.release_generations(db, reservation)
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
     
-    # Consume token
-    await token_service.use_generation(db, x_device_id)
+    await token_service.confirm_generations(db, reservation)
     
     # Update metrics
-    core_function_calls.labels(tool="resume-builder", function="generate").inc()
-    if source == "paid":
-        tokens_consumed.labels(tool="resume-builder").inc()
-    else:
-        free_trial_used.labels(tool="resume-builder").inc()
-    
-    # Get remaining tokens
-    token = await token_service.get_or_create_token(db, x_device_id)
+    _record_usage("generate", reservation)
     
     return GenerateResponse(
         content=content,
-        tokens_remaining=token.tokens_remaining,
-        source=source
+        tokens_remaining=reservation.tokens_remaining,
+        source=reservation.source
+    )
+
+
+@router.post("/generate-batch", response_model=BatchGenerateResponse)
+async def generate_batch(
+    request: BatchGenerateRequest,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Generate several resume sections concurrently in one request.
+    
+    All sections are reserved in one transaction up front; sections that
+    fail are released together and reported individually instead of
+    failing the batch.
+    """
+    
+    reservation = await _reserve(
+        db, x_device_id, len(request.sections),
+        detail="Not enough generations left for this batch. Purchase tokens to continue."
+    )
+    
+    semaphore = asyncio.Semaphore(settings.LLM_BATCH_CONCURRENCY)
+    
+    async def generate_section(section: str) -> SectionResult:
+        async with semaphore:
+            try:
+                content = await llm_service.generate_resume_content(
+                    job_title=request.job_title,
+                    section=section,
+                    context=request.context or "",
+                    language=request.language
+                )
+            except Exception as e:
+                return SectionResult(section=section, error=f"Generation failed: {str(e)}")
+        return SectionResult(section=section, content=content)
+    
+    results = await asyncio.gather(*(generate_section(section) for section in request.sections))
+    failed = sum(1 for result in results if result.error is not None)
+    if failed:
+        await token_service.release_generations(db, reservation, failed)
+    if failed == len(results):
+        raise HTTPException(status_code=500, detail=results[0].error)
+    
+    await token_service.confirm_generations(db, reservation)
+    _record_usage("generate_batch", reservation)
+    
+    return BatchGenerateResponse(
+        results=results,
+        tokens_remaining=reservation.tokens_remaining,
+        source=reservation.source
     )
 
 
@@ -93,12 +180,7 @@ async def generate_cover_letter(
 ):
     """Generate cover letter using AI."""
     
-    can_gen, source = await token_service.can_generate(db, x_device_id)
-    if not can_gen:
-        raise HTTPException(
-            status_code=402,
-            detail="Daily free limit reached. Purchase tokens to continue."
-        )
+    reservation = await _reserve(db, x_device_id)
     
     try:
         content = await llm_service.generate_cover_letter(
@@ -108,23 +190,110 @@ async def generate_cover_letter(
             language=request.language
         )
     except Exception as e:
+        await token_service.release_generations(db, reservation)
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
     
-    await token_service.use_generation(db, x_device_id)
+    await token_service.confirm_generations(db, reservation)
     
-    core_function_calls.labels(tool="resume-builder", function="cover_letter").inc()
-    if source == "paid":
-        tokens_consumed.labels(tool="resume-builder").inc()
-    else:
-        free_trial_used.labels(tool="resume-builder").inc()
-    
-    token = await token_service.get_or_create_token(db, x_device_id)
+    _record_usage("cover_letter", reservation)
     
     return GenerateResponse(
         content=content,
-        tokens_remaining=token.tokens_remaining,
-        source=source
+        tokens_remaining=reservation.tokens_remaining,
+        source=reservation.source
+    )
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_generation(
+    chunks: AsyncIterator[str],
+    function: str,
+    reservation: token_service.Reservation,
+    session_factory: Callable[[], AsyncSession],
+) -> AsyncIterator[str]:
+    """Relay LLM chunks as SSE, confirming the reservation only if it completes.
+    
+    If the client disconnects, Starlette cancels this generator, which
+    closes the upstream stream and releases the reserved generation. The
+    reservation is settled in its own session: the request's is already
+    closed by the time the stream ends.
+    """
+    completed = False
+    try:
+        async for chunk in chunks:
+            yield _sse({"content": chunk})
+        completed = True
+    except Exception as e:
+        yield _sse({"detail": f"Generation failed: {str(e)}"}, event="error")
+    finally:
+        # Shielded so cleanup still runs when the response task is cancelled.
+        with anyio.CancelScope(shield=True):
+            await chunks.aclose()
+            async with session_factory() as db:
+                if completed:
+                    await token_service.confirm_generations(db, reservation)
+                else:
+                    await token_service.release_generations(db, reservation)
+    
+    if completed:
+        _record_usage(function, reservation)
+        yield _sse(
+            {"tokens_remaining": reservation.tokens_remaining, "source": reservation.source},
+            event="done"
+        )
+
+
+def _event_stream(body: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/generate/stream")
+async def generate_content_stream(
+    request: GenerateRequest,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db),
+    session_factory: Callable[[], AsyncSession] = Depends(get_session_factory)
+):
+    """Generate resume content using AI, streamed as server-sent events."""
+    
+    reservation = await _reserve(db, x_device_id)
+    
+    chunks = llm_service.stream_resume_content(
+        job_title=request.job_title,
+        section=request.section,
+        context=request.context or "",
+        language=request.language
     )
+    return _event_stream(_stream_generation(chunks, "generate", reservation, session_factory))
+
+
+@router.post("/cover-letter/stream")
+async def generate_cover_letter_stream(
+    request: CoverLetterRequest,
+    x_device_id: str = Header(...),
+    db: AsyncSession = Depends(get_db),
+    session_factory: Callable[[], AsyncSession] = Depends(get_session_factory)
+):
+    """Generate cover letter using AI, streamed as server-sent events."""
+    
+    reservation = await _reserve(db, x_device_id)
+    
+    chunks = llm_service.stream_cover_letter(
+        job_title=request.job_title,
+        company=request.company,
+        resume_summary=request.resume_summary,
+        language=request.language
+    )
+    return _event_stream(_stream_generation(chunks, "cover_letter", reservation, session_factory))
 
 
 @router.get("/tokens", response_model=TokenStatusResponse)
@@ -133,16 +302,78 @@ async def get_token_status(
     db: AsyncSession = Depends(get_db)
 ):
     """Get current token status for device."""
-    from app.core.config import get_settings
-    settings = get_settings()
-    
-    token = await token_service.get_or_create_token(db, x_device_id)
+    tokens_remaining = await token_service.get_balance(db, x_device_id)
     daily_used = await token_service.get_daily_usage(db, x_device_id)
-    can_gen, _ = await token_service.can_generate(db, x_device_id)
     
     return TokenStatusResponse(
-        tokens_remaining=token.tokens_remaining,
+        tokens_remaining=tokens_remaining,
         daily_used=daily_used,
         daily_limit=settings.FREE_DAILY_GENERATIONS,
-        can_generate=can_gen
+        can_generate=tokens_remaining > 0 or daily_used < settings.FREE_DAILY_GENERATIONS
+    )
+
+
+@router.get("/{resume_id}/export.pdf")
+async def export_pdf(
+    resume_id: int,
+    x_device_id: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Render a saved resume to PDF. Free users get a watermark.
+    
+    Renders are cached on disk by content, so repeated downloads of an
+    unchanged resume are served from the cache or answered with 304.
+    """
+    with tracing.span("load"):
+        resume = await document_service.get_document(db, x_device_id, resume_id)
+    if resume is None:
+        raise HTTPException(status_code=404, detail="Resume not found")
+    
+    token = await token_service.get_or_create_token(db, x_device_id)
+    watermark = not token.total_purchased
+    filename = f"resume-{resume_id}.pdf"
+    core_function_calls.labels(tool="resume-builder", function="export_pdf").inc()
+    
+    cache = pdf_cache.get_cache()
+    headers = {}
+    if cache is not None:
+        key = cache.key_for(resume.id, resume.data or {}, resume.template_id, watermark)
+        headers = {"ETag": pdf_cache.etag_for(key), "Cache-Control": "private, no-cache"}
+        if etag_matches(if_none_match, headers["ETag"]):
+            pdf_cache_requests.labels(tool="resume-builder", result="not_modified").inc()
+            return Response(status_code=304, headers=headers)
+        path = cache.get(key)
+        if path is not None:
+            try:
+                response = pdf_cache.PDFFileResponse.open(
+                    path, media_type="application/pdf", filename=filename, headers=headers
+                )
+            except FileNotFoundError:
+                pass  # evicted since the lookup; render it again
+            else:
+                pdf_cache_requests.labels(tool="resume-builder", result="hit").inc()
+                return response
+        pdf_cache_requests.labels(tool="resume-builder", result="miss").inc()
+    
+    try:
+        with tracing.span("render", template=resume.template_id):
+            pdf = await pdf_service.render_pdf(
+                resume.template_id, resume.data or {}, watermark=watermark, title=resume.title or ""
+            )
+    except pdf_service.RenderQueueFull:
+        raise HTTPException(status_code=503, detail="PDF export is busy, try again shortly", headers={"Retry-After": "5"})
+    except pdf_service.RenderTimeout:
+        raise HTTPException(status_code=504, detail="PDF export timed out")
+    except pdf_service.RenderError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if cache is not None:
+        with tracing.span("cache_put"):
+            path = await cache.put(key, pdf)
+        return pdf_cache.PDFFileResponse.open(path, media_type="application/pdf", filename=filename, headers=headers)
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
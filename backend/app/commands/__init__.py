@@ -0,0 +1 @@
+# Maintenance commands (python -m app.commands.<name>)
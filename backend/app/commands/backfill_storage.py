@@ -0,0 +1,145 @@
+"""
+Re-encode stored resume data and version history with a storage codec.
+
+    python -m app.commands.backfill_storage [--codec zlib] [--batch-size 500] [--dry-run]
+
+Covers every ``CompactJSON`` column: ``resumes.data`` and
+``resume_versions.payload``. Rows are rewritten in id order, one
+transaction per batch; a resume only if its version is unchanged, and
+history rows by id since they are never updated in place. The command
+can therefore run alongside the API on SQLite and can be interrupted and
+re-run. Reads decode either form, so rows not yet rewritten keep working.
+
+On PostgreSQL the column types change (json <-> bytea), so stop the API,
+run the command and start it again with the matching ``STORAGE_CODEC``.
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+
+from sqlalchemy import LargeBinary, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core import codec
+from app.core.config import get_settings
+from app.core.database import create_engine_for
+
+settings = get_settings()
+
+# (table, column, column guarding against concurrent updates)
+COLUMNS = (
+    ("resumes", "data", "version"),
+    ("resume_versions", "payload", None),
+)
+
+
+@dataclass
+class BackfillStats:
+    rows: int = 0
+    rewritten: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+
+def _size(stored) -> int:
+    return len(stored.encode("utf-8")) if isinstance(stored, str) else len(stored)
+
+
+async def _column_type(engine: AsyncEngine, table: str, column: str) -> str:
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = :table AND column_name = :column"
+            ),
+            {"table": table, "column": column},
+        )
+        return result.scalar_one()
+
+
+async def _backfill_column(
+    engine: AsyncEngine, table: str, column: str, guard, storage_codec: str,
+    batch_size: int, dry_run: bool, stats: BackfillStats,
+) -> None:
+    postgres = engine.dialect.name == "postgresql"
+    if postgres and not dry_run and storage_codec == "zlib" and await _column_type(engine, table, column) != "bytea":
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE bytea USING convert_to({column}::text, 'UTF8')"
+            ))
+    # Plain JSON stays text on SQLite; on PostgreSQL it is written as bytes
+    # and the column converted back to json at the end.
+    as_text = storage_codec == "json" and not postgres
+
+    select_columns = f"id, {column} AS value" + (f", {guard} AS guard" if guard else "")
+    where = "id = :id" + (f" AND {guard} = :guard" if guard else "")
+    update = text(f"UPDATE {table} SET {column} = :value WHERE {where}")
+    if not as_text:
+        update = update.bindparams(bindparam("value", type_=LargeBinary))
+
+    after = 0
+    while True:
+        async with engine.begin() as conn:
+            rows = (await conn.execute(
+                text(f"SELECT {select_columns} FROM {table} WHERE id > :after ORDER BY id LIMIT :limit"),
+                {"after": after, "limit": batch_size},
+            )).all()
+            if not rows:
+                break
+            for row in rows:
+                stats.rows += 1
+                if row.value is None:
+                    continue
+                encoded = codec.encode(codec.decode(row.value), storage_codec)
+                value = encoded.decode("utf-8") if as_text else encoded
+                stats.bytes_before += _size(row.value)
+                stats.bytes_after += len(encoded)
+                if value == row.value:
+                    continue
+                stats.rewritten += 1
+                if not dry_run:
+                    params = {"value": value, "id": row.id}
+                    if guard:
+                        params["guard"] = row.guard
+                    await conn.execute(update, params)
+            after = rows[-1].id
+
+    if postgres and not dry_run and storage_codec == "json" and await _column_type(engine, table, column) == "bytea":
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE json USING convert_from({column}, 'UTF8')::json"
+            ))
+
+
+async def backfill(
+    engine: AsyncEngine, storage_codec: str, batch_size: int = 500, dry_run: bool = False
+) -> BackfillStats:
+    """Rewrite every resume's data and every history payload with `storage_codec`."""
+    if storage_codec not in codec.CODECS:
+        raise ValueError(f"Unknown storage codec: {storage_codec!r}")
+    stats = BackfillStats()
+    for table, column, guard in COLUMNS:
+        await _backfill_column(engine, table, column, guard, storage_codec, batch_size, dry_run, stats)
+    return stats
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Re-encode stored resume data and history with a storage codec.")
+    parser.add_argument("--codec", choices=codec.CODECS, default=settings.STORAGE_CODEC)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="report sizes without writing")
+    args = parser.parse_args(argv)
+
+    engine = create_engine_for(settings.DATABASE_URL)
+    try:
+        stats = await backfill(engine, args.codec, args.batch_size, args.dry_run)
+    finally:
+        await engine.dispose()
+    print(
+        f"{stats.rows} rows, {stats.rewritten} {'to rewrite' if args.dry_run else 'rewritten'}: "
+        f"{stats.bytes_before} -> {stats.bytes_after} bytes"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,14 +11,106 @@ class Settings(BaseSettings):
     # LLM Proxy
     LLM_PROXY_URL: str = "https://llm-proxy.densematrix.ai"
     LLM_PROXY_KEY: str = ""
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_POOL_MAX_CONNECTIONS: int = 100
+    LLM_POOL_MAX_KEEPALIVE: int = 20
+    LLM_POOL_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_POOL_TIMEOUT_SECONDS: float = 5.0
+    LLM_HTTP2: bool = False
+    LLM_COALESCE_ENABLED: bool = True
+    LLM_COALESCE_MAX_WAITERS: int = 100
+    LLM_BATCH_CONCURRENCY: int = 3
+    
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_SECTIONS: list[str] = ["skills", "summary"]
+    LLM_CACHE_BACKEND: str = "memory"  # memory, sqlite, tiered
+    LLM_CACHE_PATH: str = "./data/llm_cache.db"
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 10000
+    LLM_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    LLM_CACHE_VARIANTS: int = 3
+    
+    # Server-side PDF export
+    PDF_RENDER_WORKERS: int = 0  # 0 = one per CPU core
+    PDF_RENDER_TIMEOUT_SECONDS: float = 20.0
+    PDF_RENDER_MAX_QUEUE: int = 64
+    PDF_TEMPLATE_WARMUP: bool = True  # start workers and render each template once at startup
+    PDF_CACHE_ENABLED: bool = True
+    PDF_CACHE_DIR: str = "./data/pdf_cache"
+    PDF_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    
+    # Resume documents
+    RESUME_MAX_BYTES: int = 256 * 1024
+    RESUME_PATCH_MAX_OPS: int = 200
+    # Version history: a full snapshot every N versions bounds reconstruction
+    RESUME_HISTORY_SNAPSHOT_EVERY: int = 20
+    RESUME_HISTORY_MAX_VERSIONS: int = 200
+    RESUME_HISTORY_RETENTION_DAYS: int = 90
+    RESUME_HISTORY_COMPACT_INTERVAL_SECONDS: int = 3600
+    # Storage codec for resume data and cached generations: "json" or "zlib"
+    STORAGE_CODEC: str = "json"
+    
+    # Write-behind buffer for document saves (single worker only)
+    AUTOSAVE_BUFFER_ENABLED: bool = False
+    AUTOSAVE_WINDOW_SECONDS: float = 2.0
+    AUTOSAVE_MAX_PENDING: int = 500
     
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./app.db"
+    # Engine profile, picked by URL scheme (see app.core.database.engine_options).
+    # SQLite: one writer at a time, so a small pool; WAL lets reads proceed
+    # alongside it and busy_timeout waits for the lock instead of failing.
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # durable with WAL except on power loss
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64000  # negative = KiB, i.e. 64 MB per connection
+    SQLITE_POOL_SIZE: int = 5
+    # PostgreSQL (postgresql+asyncpg://, requires asyncpg)
+    POSTGRES_POOL_SIZE: int = 10
+    POSTGRES_MAX_OVERFLOW: int = 20
+    POSTGRES_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
     
     # Creem Payment
     CREEM_API_KEY: str = ""
     CREEM_WEBHOOK_SECRET: str = ""
     CREEM_PRODUCT_IDS: str = "{}"
+    CREEM_API_URL: str = ""  # defaults to the test or live API by key
+    CREEM_POOL_MAX_CONNECTIONS: int = 20
+    CREEM_TIMEOUT_SECONDS: float = 5.0
+    CREEM_DEADLINE_SECONDS: float = 12.0
+    CREEM_MAX_ATTEMPTS: int = 3
+    CREEM_RETRY_BASE_SECONDS: float = 0.2
+    CREEM_BREAKER_FAILURES: int = 5
+    CREEM_BREAKER_RESET_SECONDS: float = 30.0
+    
+    # Webhook inbox worker
+    WEBHOOK_POLL_INTERVAL_SECONDS: float = 5.0
+    WEBHOOK_BATCH_SIZE: int = 50
+    WEBHOOK_MAX_ATTEMPTS: int = 8
+    WEBHOOK_RETRY_BASE_SECONDS: float = 5.0
+    WEBHOOK_RETRY_MAX_SECONDS: float = 3600.0
+    WEBHOOK_LEASE_SECONDS: float = 60.0
+    
+    # Request tracing: spans and a Server-Timing header (off = near-zero cost)
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = ""  # "", "jsonl" or "otlp" (OTLP/HTTP JSON)
+    TRACING_JSONL_PATH: str = "./data/traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_EXPORT_INTERVAL_SECONDS: float = 2.0
+    TRACING_MAX_QUEUED_SPANS: int = 10000
+    
+    # Admin profiling endpoints (/api/v1/admin/profile), disabled without a token
+    ADMIN_TOKEN: str = ""
+    PROFILE_MAX_SECONDS: float = 60.0
+    PROFILE_MAX_HZ: int = 1000
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_SECONDS: float = 0.25
+    SLOW_CALLBACK_SECONDS: float = 0.1
+    HEAP_SNAPSHOTS_KEPT: int = 5
+    HEAP_TRACEBACK_FRAMES: int = 1
     
     # CORS
     CORS_ORIGINS: list[str] = ["*"]
@@ -26,6 +118,22 @@ class Settings(BaseSettings):
     # Free tier limits
     FREE_DAILY_GENERATIONS: int = 5
     
+    # Generation reservations (must comfortably exceed LLM_TIMEOUT_SECONDS)
+    RESERVATION_TTL_SECONDS: int = 300
+    RESERVATION_SWEEP_INTERVAL_SECONDS: int = 60
+    
+    # In-memory daily usage counters (single worker only)
+    DAILY_USAGE_CACHE_ENABLED: bool = False
+    DAILY_USAGE_FLUSH_INTERVAL_SECONDS: float = 2.0
+    DAILY_USAGE_FLUSH_MAX_PENDING: int = 100
+    DAILY_USAGE_RETENTION_DAYS: int = 30
+    DAILY_USAGE_COMPACT_INTERVAL_SECONDS: int = 3600
+    
+    # Quota storage: "sql" or "redis" (shared across workers)
+    QUOTA_BACKEND: str = "sql"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_MAX_CONNECTIONS: int = 20
+    
     class Config:
         env_file = ".env"
         extra = "ignore"
@@ -1,9 +1,95 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import time
+
+from sqlalchemy import event, exc, inspect, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import get_settings
+from app.metrics import TOOL_NAME, db_pool_checkout_seconds, db_pool_checked_out, db_pool_timeouts
 
 settings = get_settings()
-engine = create_async_engine(settings.DATABASE_URL, echo=settings.DEBUG)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            db_pool_timeouts.labels(tool=TOOL_NAME).inc()
+            raise
+        finally:
+            db_pool_checkout_seconds.labels(tool=TOOL_NAME).observe(time.perf_counter() - start)
+        db_pool_checked_out.labels(tool=TOOL_NAME).set(self.checkedout())
+        return conn
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        db_pool_checked_out.labels(tool=TOOL_NAME).set(self.checkedout())
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(database_url: str) -> dict:
+    """Engine keyword arguments for the profile matching the URL scheme.
+    
+    - ``sqlite`` (file): a small pool with no overflow. SQLite allows one
+      writer at a time, so extra connections only queue on the file lock;
+      the PRAGMAs from `_apply_sqlite_pragmas` run on every new connection.
+    - ``sqlite`` (``:memory:``): left to SQLAlchemy's single shared connection.
+    - ``postgresql`` (e.g. ``postgresql+asyncpg://``, needs asyncpg):
+      a larger pool with overflow, pre-ping to drop connections the server
+      closed, and periodic recycling.
+    """
+    url = make_url(database_url)
+    if _is_memory_sqlite(url):
+        return {}
+    if url.get_backend_name() == "sqlite":
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": settings.SQLITE_POOL_SIZE,
+            "max_overflow": 0,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        }
+    if url.get_backend_name() == "postgresql":
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": settings.POSTGRES_POOL_SIZE,
+            "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+            "pool_recycle": settings.POSTGRES_POOL_RECYCLE_SECONDS,
+            "pool_pre_ping": True,
+        }
+    return {}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.close()
+
+
+def create_engine_for(database_url: str, **kwargs) -> AsyncEngine:
+    """Create an async engine tuned for the database behind `database_url`."""
+    new_engine = create_async_engine(database_url, **{**engine_options(database_url), **kwargs})
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and not _is_memory_sqlite(url):
+        event.listen(new_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
+
+
+engine = create_engine_for(settings.DATABASE_URL, echo=settings.DEBUG)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -19,6 +105,74 @@ async def get_db():
             await session.close()
 
 
+def get_session_factory() -> async_sessionmaker:
+    """Session factory for work that outlives the request (e.g. streamed responses).
+
+    The `get_db` session is closed once the endpoint returns, before a
+    streaming body has finished.
+    """
+    return async_session
+
+
+def insert_for(db: AsyncSession):
+    """Dialect-specific INSERT construct supporting ON CONFLICT upserts."""
+    if db.get_bind().dialect.name == "postgresql":
+        return pg_insert
+    return sqlite_insert
+
+
+def _merge_duplicate_daily_usage(conn):
+    """Fold duplicate (device_id, date) rows into the oldest one.
+
+    The old select-then-insert counter could race and leave two rows for
+    the same day; the unique index cannot be built until they are merged.
+    """
+    conn.execute(text(
+        "UPDATE daily_usage SET"
+        " generations_used = (SELECT SUM(COALESCE(d.generations_used, 0)) FROM daily_usage d"
+        "  WHERE d.device_id = daily_usage.device_id AND d.date = daily_usage.date),"
+        " reserved = (SELECT SUM(COALESCE(d.reserved, 0)) FROM daily_usage d"
+        "  WHERE d.device_id = daily_usage.device_id AND d.date = daily_usage.date)"
+        " WHERE id IN (SELECT MIN(id) FROM daily_usage GROUP BY device_id, date HAVING COUNT(*) > 1)"
+    ))
+    conn.execute(text(
+        "DELETE FROM daily_usage WHERE id NOT IN (SELECT MIN(id) FROM daily_usage GROUP BY device_id, date)"
+    ))
+
+
+# Data fixes to run before creating an index on an existing table
+_BEFORE_INDEX = {
+    "uq_daily_usage_device_date": _merge_duplicate_daily_usage,
+}
+
+
+def _upgrade_schema(conn):
+    """Add columns and indexes introduced after a table was first created."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            conn.execute(text(ddl))
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in indexes:
+                continue
+            if index.name in _BEFORE_INDEX:
+                _BEFORE_INDEX[index.name](conn)
+            index.create(conn, checkfirst=True)
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
+
+
+async def close_db():
+    """Close pooled connections (called on shutdown)."""
+    await engine.dispose()
@@ -0,0 +1,181 @@
+"""
+RFC 6902 JSON Patch, applied to plain JSON values.
+
+Supports all six operations (add, remove, replace, move, copy, test) with
+RFC 6901 pointers. Patches are applied to a deep copy, so a failing
+operation leaves the original document untouched. ``make_patch`` computes
+a patch between two values.
+"""
+import copy
+from typing import Any
+
+
+class JsonPatchError(ValueError):
+    """The patch is malformed or cannot be applied to the document."""
+
+
+_MISSING = object()
+
+
+def parse_pointer(pointer: str) -> list[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")]
+
+
+def escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _index(container: list, token: str, allow_end: bool = False) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (token.startswith("0") and token != "0"):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document: Any, parts: list[str]) -> Any:
+    for token in parts:
+        if isinstance(document, dict):
+            if token not in document:
+                raise JsonPatchError(f"Path not found: /{'/'.join(parts)}")
+            document = document[token]
+        elif isinstance(document, list):
+            document = document[_index(document, token)]
+        else:
+            raise JsonPatchError(f"Path not found: /{'/'.join(parts)}")
+    return document
+
+
+def _get(document: Any, pointer: str) -> Any:
+    return _resolve(document, parse_pointer(pointer))
+
+
+def _add(document: Any, pointer: str, value: Any) -> Any:
+    parts = parse_pointer(pointer)
+    if not parts:
+        return value
+    parent = _resolve(document, parts[:-1])
+    token = parts[-1]
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, token, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add to a scalar at {pointer}")
+    return document
+
+
+def _remove(document: Any, pointer: str) -> tuple[Any, Any]:
+    parts = parse_pointer(pointer)
+    if not parts:
+        raise JsonPatchError("Cannot remove the document root")
+    parent = _resolve(document, parts[:-1])
+    token = parts[-1]
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f"Path not found: {pointer}")
+        return document, parent.pop(token)
+    if isinstance(parent, list):
+        return document, parent.pop(_index(parent, token))
+    raise JsonPatchError(f"Path not found: {pointer}")
+
+
+def _field(operation: dict, name: str) -> Any:
+    value = operation.get(name, _MISSING)
+    if value is _MISSING:
+        raise JsonPatchError(f"Operation {operation.get('op')!r} requires {name!r}")
+    return value
+
+
+def apply_patch(document: Any, patch: list[dict]) -> Any:
+    """Return a patched copy of `document`."""
+    if not isinstance(patch, list):
+        raise JsonPatchError("A JSON Patch must be an array of operations")
+    document = copy.deepcopy(document)
+    for operation in patch:
+        if not isinstance(operation, dict):
+            raise JsonPatchError("Each operation must be an object")
+        op = operation.get("op")
+        path = _field(operation, "path")
+        if op == "add":
+            document = _add(document, path, copy.deepcopy(_field(operation, "value")))
+        elif op == "remove":
+            document, _ = _remove(document, path)
+        elif op == "replace":
+            _get(document, path)
+            if parse_pointer(path):
+                document, _ = _remove(document, path)
+            document = _add(document, path, copy.deepcopy(_field(operation, "value")))
+        elif op == "move":
+            source = _field(operation, "from")
+            if path != source and path.startswith(source + "/"):
+                raise JsonPatchError("Cannot move a value into one of its children")
+            document, value = _remove(document, source)
+            document = _add(document, path, value)
+        elif op == "copy":
+            value = copy.deepcopy(_get(document, _field(operation, "from")))
+            document = _add(document, path, value)
+        elif op == "test":
+            if _get(document, path) != _field(operation, "value"):
+                raise JsonPatchError(f"Test failed at {path}")
+        else:
+            raise JsonPatchError(f"Unknown operation: {op!r}")
+    return document
+
+
+def _same(a: Any, b: Any) -> bool:
+    # Stricter than ==, which treats true, 1 and 1.0 as equal.
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(a[key], b[key]) for key in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(_same, a, b))
+    return a == b
+
+
+def _diff_lists(source: list, target: list, path: str) -> list[dict]:
+    # Strip the common prefix and suffix so a single insert or removal
+    # produces one operation rather than rewriting the tail.
+    prefix = 0
+    while prefix < min(len(source), len(target)) and _same(source[prefix], target[prefix]):
+        prefix += 1
+    suffix = 0
+    while (suffix < min(len(source), len(target)) - prefix
+           and _same(source[-1 - suffix], target[-1 - suffix])):
+        suffix += 1
+    old, new = source[prefix:len(source) - suffix], target[prefix:len(target) - suffix]
+    operations = []
+    for offset, (a, b) in enumerate(zip(old, new)):
+        operations.extend(make_patch(a, b, f"{path}/{prefix + offset}"))
+    for _ in range(len(old) - len(new)):
+        operations.append({"op": "remove", "path": f"{path}/{prefix + len(new)}"})
+    for offset in range(len(old), len(new)):
+        operations.append({"op": "add", "path": f"{path}/{prefix + offset}", "value": copy.deepcopy(new[offset])})
+    return operations
+
+
+def make_patch(source: Any, target: Any, path: str = "") -> list[dict]:
+    """Return a patch that turns `source` into `target`."""
+    if _same(source, target):
+        return []
+    if isinstance(source, dict) and isinstance(target, dict):
+        operations = [
+            {"op": "remove", "path": f"{path}/{escape(key)}"} for key in source if key not in target
+        ]
+        for key, value in target.items():
+            if key in source:
+                operations.extend(make_patch(source[key], value, f"{path}/{escape(key)}"))
+            else:
+                operations.append({"op": "add", "path": f"{path}/{escape(key)}", "value": copy.deepcopy(value)})
+        return operations
+    if isinstance(source, list) and isinstance(target, list):
+        return _diff_lists(source, target, path)
+    return [{"op": "replace", "path": path, "value": copy.deepcopy(target)}]
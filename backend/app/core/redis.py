@@ -0,0 +1,17 @@
+"""
+Redis connections for the quota backend, built on ``redis.asyncio``.
+
+Replies are decoded to ``str``, and the pool waits for a free connection
+(up to ``max_connections``) rather than raising when all are in use. The
+client speaks RESP2, which every redis-py >= 5 and every Redis-compatible
+server (KeyDB, Dragonfly, Redis < 6) agree on.
+"""
+from redis.asyncio import BlockingConnectionPool, Redis
+
+
+def create_client(url: str, max_connections: int = 10) -> Redis:
+    """Client for `url` that owns (and on ``aclose()`` closes) its pool."""
+    pool = BlockingConnectionPool.from_url(
+        url, max_connections=max_connections, decode_responses=True, protocol=2
+    )
+    return Redis.from_pool(pool)
@@ -0,0 +1,275 @@
+"""
+Request tracing with spans.
+
+``TracingMiddleware`` starts a trace per HTTP request, and code on the
+request path marks its phases with ``span``::
+
+    with tracing.span("llm", section=section):
+        data = await _chat_completion(payload)
+
+Completed spans are summed by name into a ``Server-Timing`` response
+header, and with ``TRACING_EXPORTER`` set the whole trace is queued for
+export: appended to a JSONL file, or posted as OTLP/HTTP JSON to a local
+collector. Export runs in a background task, so requests never wait on
+it, and the queue is bounded.
+
+With ``TRACING_ENABLED`` off (or outside a request) ``span`` returns a
+shared no-op, so instrumented code costs one context variable lookup.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import httpx
+
+from app.core.config import get_settings
+from app.metrics import TOOL_NAME, tracing_spans_exported
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """A timed phase of a request; use ``span()`` to create one."""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "attributes", "start", "end", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = 0
+        self.end = 0
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end - self.start) / 1e6
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter_ns()
+        self._token = _current_span.set(self.span_id)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end = time.perf_counter_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            pass  # A streaming generator finalized from another context.
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.trace.spans.append(self)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    """The spans of one request. Tasks spawned by the request add to it too."""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        # Anchor perf_counter readings to wall-clock time for export.
+        self.unix_ns = time.time_ns()
+        self.perf_ns = time.perf_counter_ns()
+        self.spans: list[Span] = []
+
+    def unix(self, perf_ns: int) -> int:
+        return self.unix_ns + perf_ns - self.perf_ns
+
+    def server_timing(self) -> str:
+        """Completed spans summed by name, in order of first completion."""
+        totals: dict[str, float] = {}
+        for completed in self.spans:
+            totals[completed.name] = totals.get(completed.name, 0.0) + completed.duration_ms
+        return ", ".join(f"{name};dur={duration:.1f}" for name, duration in totals.items())
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("span", default=None)
+
+
+def span(name: str, **attributes: Any):
+    """Time a block as a span of the current request's trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return Span(trace, name, _current_span.get(), attributes)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware that traces requests when TRACING_ENABLED is on."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        root = Span(trace, "request", None, {"http.method": scope["method"]})
+        trace_token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                total = (time.perf_counter_ns() - root.start) / 1e6
+                timing = trace.server_timing()
+                timing = f"{timing}, total;dur={total:.1f}" if timing else f"total;dur={total:.1f}"
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(trace_token)
+            route = scope.get("route")
+            root.name = f"{scope['method']} {getattr(route, 'path', 'unmatched')}"
+            if settings.TRACING_EXPORTER:
+                _enqueue(trace)
+
+
+# Export
+
+_queue: deque = deque()
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _enqueue(trace: Trace) -> None:
+    if len(_queue) + len(trace.spans) > settings.TRACING_MAX_QUEUED_SPANS:
+        tracing_spans_exported.labels(
+            tool=TOOL_NAME, exporter=settings.TRACING_EXPORTER, outcome="dropped"
+        ).inc(len(trace.spans))
+        return
+    _queue.extend((trace, completed) for completed in trace.spans)
+
+
+def _drain() -> list[tuple[Trace, Span]]:
+    batch = list(_queue)
+    _queue.clear()
+    return batch
+
+
+def _span_record(trace: Trace, exported: Span) -> dict:
+    return {
+        "trace_id": trace.trace_id,
+        "span_id": exported.span_id,
+        "parent_id": exported.parent_id,
+        "name": exported.name,
+        "start_unix_nano": trace.unix(exported.start),
+        "duration_ms": round(exported.duration_ms, 3),
+        "attributes": exported.attributes,
+    }
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(batch: list[tuple[Trace, Span]]) -> dict:
+    """Encode spans as an OTLP/HTTP JSON ExportTraceServiceRequest."""
+    spans = [
+        {
+            "traceId": trace.trace_id,
+            "spanId": exported.span_id,
+            **({"parentSpanId": exported.parent_id} if exported.parent_id else {}),
+            "name": exported.name,
+            "kind": 1 if exported.parent_id else 2,  # INTERNAL, SERVER
+            "startTimeUnixNano": str(trace.unix(exported.start)),
+            "endTimeUnixNano": str(trace.unix(exported.end)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in exported.attributes.items()],
+        }
+        for trace, exported in batch
+    ]
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TOOL_NAME}}]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+def _write_jsonl(path: str, lines: list[str]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+async def export_pending() -> int:
+    """Export everything queued. Returns the number of spans exported."""
+    global _client
+    batch = _drain()
+    if not batch:
+        return 0
+    exporter = settings.TRACING_EXPORTER
+    try:
+        if exporter == "jsonl":
+            lines = [json.dumps(_span_record(trace, exported), default=str) + "\n" for trace, exported in batch]
+            await asyncio.to_thread(_write_jsonl, settings.TRACING_JSONL_PATH, lines)
+        elif exporter == "otlp":
+            if _client is None:
+                _client = httpx.AsyncClient(timeout=5.0)
+            response = await _client.post(settings.TRACING_OTLP_ENDPOINT, json=otlp_payload(batch))
+            response.raise_for_status()
+        else:
+            raise ValueError(f"Unknown tracing exporter: {exporter!r}")
+    except Exception:
+        tracing_spans_exported.labels(tool=TOOL_NAME, exporter=exporter, outcome="failed").inc(len(batch))
+        raise
+    tracing_spans_exported.labels(tool=TOOL_NAME, exporter=exporter, outcome="exported").inc(len(batch))
+    return len(batch)
+
+
+async def run_exporter():
+    """Export queued spans on an interval (started in main.lifespan)."""
+    while True:
+        await asyncio.sleep(settings.TRACING_EXPORT_INTERVAL_SECONDS)
+        try:
+            await export_pending()
+        except Exception:
+            logger.exception("Trace export failed")
+
+
+async def shutdown() -> None:
+    """Export what is left and close the OTLP client (called on shutdown)."""
+    global _client
+    try:
+        await export_pending()
+    except Exception:
+        logger.exception("Trace export failed")
+    if _client is not None:
+        await _client.aclose()
+        _client = None
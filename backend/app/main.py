@@ -1,15 +1,20 @@
 """
 Resume Builder API — FastAPI Application
 """
-import time
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.core import tracing
 from app.core.config import get_settings
-from app.core.database import init_db
+from app.core.database import close_db, init_db
 from app.api.v1 import api_router
-from app.metrics import metrics_router, track_request
+from app.metrics import MULTIPROC_DIR, MetricsMiddleware, metrics_router, run_dead_worker_cleanup
+from app.services import (
+    autosave, creem_client, llm_cache, llm_service, pdf_cache, pdf_service, profiler, quota, token_service,
+    usage_cache, version_history, webhook_inbox,
+)
 
 settings = get_settings()
 
@@ -18,7 +23,40 @@ settings = get_settings()
 async def lifespan(app: FastAPI):
     """Startup and shutdown events."""
     await init_db()
+    await llm_service.init_client()
+    await llm_cache.init_cache()
+    await pdf_service.init_pool()
+    await pdf_cache.init_cache()
+    await creem_client.init_client()
+    await profiler.start_monitor()
+    background = [
+        asyncio.create_task(token_service.run_reservation_sweeper()),
+        asyncio.create_task(token_service.run_usage_compactor()),
+        asyncio.create_task(usage_cache.run_flusher()),
+        asyncio.create_task(autosave.run_flusher()),
+        asyncio.create_task(version_history.run_compactor()),
+        asyncio.create_task(webhook_inbox.run_worker()),
+    ]
+    if settings.TRACING_EXPORTER:
+        background.append(asyncio.create_task(tracing.run_exporter()))
+    if MULTIPROC_DIR:
+        background.append(asyncio.create_task(run_dead_worker_cleanup()))
     yield
+    for task in background:
+        task.cancel()
+    # Let cancelled loops unwind (e.g. finish a flush's rollback) before
+    # the engine, Redis and HTTP clients they use are closed.
+    await asyncio.gather(*background, return_exceptions=True)
+    await usage_cache.shutdown()
+    await autosave.shutdown()
+    await quota.close_backend()
+    await llm_cache.close_cache()
+    await llm_service.close_client()
+    await pdf_service.close_pool()
+    await creem_client.close_client()
+    await tracing.shutdown()
+    await profiler.stop_monitor()
+    await close_db()
 
 
 app = FastAPI(
@@ -37,15 +75,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-
-@app.middleware("http")
-async def metrics_middleware(request: Request, call_next):
-    """Track request metrics."""
-    start_time = time.time()
-    response = await call_next(request)
-    duration = time.time() - start_time
-    await track_request(request, response, duration)
-    return response
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
 
 
 # Routers
@@ -1,12 +1,35 @@
 """
 Prometheus Metrics for Resume Builder.
+
+With ``uvicorn --workers N``, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty
+directory shared by the workers (it must be in the environment before
+the workers start, as prometheus_client picks its storage on import).
+Each process then writes its values to mmap files there, ``/metrics``
+aggregates all of them whichever worker answers, and files left behind
+by exited workers are folded into one archive per metric type.
 """
+import asyncio
+import fcntl
+import glob
+import logging
 import os
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from fastapi import APIRouter, Request
+import re
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from fastapi import APIRouter
 from fastapi.responses import Response
 
 TOOL_NAME = os.getenv("TOOL_NAME", "resume-builder")
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_CLEANUP_INTERVAL_SECONDS = float(os.getenv("METRICS_CLEANUP_INTERVAL_SECONDS", "60"))
+
+logger = logging.getLogger(__name__)
 
 # HTTP Metrics
 http_requests = Counter(
@@ -34,6 +57,53 @@ payment_revenue = Counter(
     ["tool"]
 )
 
+creem_requests = Counter(
+    "creem_requests_total",
+    "Creem API calls by outcome (ok, retried, rejected, failed, short_circuited)",
+    ["tool", "operation", "outcome"]
+)
+
+creem_request_duration = Histogram(
+    "creem_request_duration_seconds",
+    "Creem API call duration including retries",
+    ["tool", "operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+)
+
+creem_breaker_state = Gauge(
+    "creem_circuit_breaker_state",
+    "Creem circuit breaker state (0 closed, 1 open, 2 half-open)",
+    ["tool"],
+    multiprocess_mode="livemax"
+)
+
+webhook_events = Counter(
+    "webhook_events_total",
+    "Webhook inbox events by processing outcome",
+    ["tool", "event_type", "result"]
+)
+
+webhook_inbox_pending = Gauge(
+    "webhook_inbox_pending",
+    "Webhook events waiting to be processed",
+    ["tool"],
+    multiprocess_mode="livemax"
+)
+
+webhook_inbox_oldest_seconds = Gauge(
+    "webhook_inbox_oldest_pending_seconds",
+    "Age of the oldest unprocessed webhook event",
+    ["tool"],
+    multiprocess_mode="livemax"
+)
+
+webhook_inbox_lag = Histogram(
+    "webhook_inbox_lag_seconds",
+    "Time from receiving a webhook to processing it",
+    ["tool"],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 1800, 3600)
+)
+
 tokens_consumed = Counter(
     "tokens_consumed_total",
     "Tokens consumed",
@@ -46,6 +116,44 @@ free_trial_used = Counter(
     ["tool"]
 )
 
+reservations_expired = Counter(
+    "generation_reservations_expired_total",
+    "Generation reservations refunded after their TTL expired",
+    ["tool"]
+)
+
+usage_cache_pending = Gauge(
+    "daily_usage_cache_pending",
+    "Daily usage increments waiting to be flushed to the database",
+    ["tool"],
+    multiprocess_mode="livesum"
+)
+
+usage_cache_flushes = Counter(
+    "daily_usage_cache_flushes_total",
+    "Daily usage write-behind flushes",
+    ["tool", "status"]
+)
+
+autosave_pending = Gauge(
+    "autosave_pending_documents",
+    "Resume documents with buffered saves waiting to be written",
+    ["tool"],
+    multiprocess_mode="livesum"
+)
+
+autosave_flushes = Counter(
+    "autosave_flushes_total",
+    "Autosave write-behind flushes",
+    ["tool", "status"]
+)
+
+autosave_conflicts = Counter(
+    "autosave_conflicts_total",
+    "Buffered saves dropped because the row changed or was deleted before the flush",
+    ["tool"]
+)
+
 core_function_calls = Counter(
     "core_function_calls_total",
     "Core function calls",
@@ -65,42 +173,355 @@ crawler_visits = Counter(
     ["tool", "bot"]
 )
 
+# LLM Proxy Connection Pool Metrics
+llm_pool_max_connections = Gauge(
+    "llm_pool_max_connections",
+    "Configured size of the LLM proxy connection pool",
+    ["tool"],
+    multiprocess_mode="livesum"
+)
+
+llm_pool_in_flight = Gauge(
+    "llm_pool_requests_in_flight",
+    "LLM proxy requests currently using the connection pool",
+    ["tool"],
+    multiprocess_mode="livesum"
+)
+
+llm_pool_saturated = Counter(
+    "llm_pool_saturated_total",
+    "LLM proxy requests issued while the connection pool was full",
+    ["tool"]
+)
+
+llm_pool_timeouts = Counter(
+    "llm_pool_timeouts_total",
+    "LLM proxy requests that timed out waiting for a pooled connection",
+    ["tool"]
+)
+
+llm_coalesced_calls = Counter(
+    "llm_coalesced_calls_total",
+    "LLM generations served by joining an identical in-flight upstream call",
+    ["tool"]
+)
+
+llm_coalesce_overflow = Counter(
+    "llm_coalesce_overflow_total",
+    "LLM generations that bypassed coalescing because the waiter queue was full",
+    ["tool"]
+)
+
+# LLM Call Metrics (per section: experience, summary, skills, improve, cover_letter)
+llm_time_to_first_byte = Histogram(
+    "llm_time_to_first_byte_seconds",
+    "Time from sending an LLM proxy call to the first chunk of its response body",
+    ["tool", "section"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+)
+
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds",
+    "LLM proxy call duration until the response is fully read",
+    ["tool", "section"],
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0)
+)
+
+llm_tokens = Counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM proxy (kind: prompt, completion)",
+    ["tool", "section", "model", "kind"]
+)
+
+llm_cost = Counter(
+    "llm_cost_usd_total",
+    "Estimated LLM spend in US dollars from reported token usage",
+    ["tool", "section", "model"]
+)
+
+llm_errors = Counter(
+    "llm_errors_total",
+    "Failed LLM proxy calls by status class (4xx, 5xx, timeout, transport)",
+    ["tool", "section", "status_class"]
+)
+
+# LLM Response Cache Metrics
+llm_cache_hits = Counter(
+    "llm_cache_hits_total",
+    "LLM response cache hits",
+    ["tool", "section"]
+)
+
+llm_cache_misses = Counter(
+    "llm_cache_misses_total",
+    "LLM response cache misses",
+    ["tool", "section"]
+)
+
+llm_cache_evictions = Counter(
+    "llm_cache_evictions_total",
+    "LLM response cache evictions",
+    ["tool", "backend", "reason"]
+)
+
+# PDF Export Metrics
+pdf_render_queue_depth = Gauge(
+    "pdf_render_queue_depth",
+    "PDF render jobs submitted to the process pool and not yet finished",
+    ["tool"],
+    multiprocess_mode="livesum"
+)
+
+pdf_render_duration = Histogram(
+    "pdf_render_duration_seconds",
+    "PDF render time including queueing in the process pool",
+    ["tool", "template"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 60.0)
+)
+
+pdf_render_failures = Counter(
+    "pdf_render_failures_total",
+    "PDF render jobs that failed",
+    ["tool", "reason"]
+)
+
+pdf_cache_requests = Counter(
+    "pdf_cache_requests_total",
+    "PDF export requests by cache outcome (hit, miss, not_modified)",
+    ["tool", "result"]
+)
+
+pdf_cache_bytes = Gauge(
+    "pdf_cache_bytes",
+    "Bytes of rendered PDFs held in the on-disk cache",
+    ["tool"],
+    multiprocess_mode="livemax"
+)
+
+pdf_cache_evictions = Counter(
+    "pdf_cache_evictions_total",
+    "Rendered PDFs removed from the on-disk cache",
+    ["tool", "reason"]
+)
+
+# Event Loop Metrics
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a scheduled heartbeat",
+    ["tool"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+event_loop_stalls = Counter(
+    "event_loop_stalls_total",
+    "Times the event loop was blocked longer than SLOW_CALLBACK_SECONDS",
+    ["tool"]
+)
+
+# Tracing Metrics
+tracing_spans_exported = Counter(
+    "tracing_spans_exported_total",
+    "Spans handed to the trace exporter by outcome (exported, dropped, failed)",
+    ["tool", "exporter", "outcome"]
+)
+
+# Database Pool Metrics
+db_pool_checkout_seconds = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a database connection from the pool",
+    ["tool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+
+db_pool_checked_out = Gauge(
+    "db_pool_connections_checked_out",
+    "Database connections currently checked out of the pool",
+    ["tool"],
+    multiprocess_mode="livesum"
+)
+
+db_pool_timeouts = Counter(
+    "db_pool_timeouts_total",
+    "Database pool checkouts that timed out",
+    ["tool"]
+)
+
 # Metrics endpoint
 metrics_router = APIRouter()
 
 
 @metrics_router.get("/metrics")
 async def metrics():
-    """Prometheus metrics endpoint."""
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    """Prometheus metrics endpoint (aggregated across workers in multi-process mode)."""
+    if not MULTIPROC_DIR:
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    return Response(await asyncio.to_thread(collect_multiprocess, MULTIPROC_DIR), media_type=CONTENT_TYPE_LATEST)
+
+
+# Multi-process mode
+
+# Value files are named <type>_<pid>.db, or gauge_<mode>_<pid>.db.
+_ARCHIVED_TYPES = ("counter", "histogram", "summary")
+ARCHIVE = "archive"
+
+
+@contextmanager
+def _directory_lock(path: str, exclusive: bool):
+    """Keep collection from seeing a dead worker's values both archived and not."""
+    with open(os.path.join(path, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def collect_multiprocess(path: str) -> bytes:
+    """Render the metrics of every process writing to `path`."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path)
+    with _directory_lock(path, exclusive=False):
+        return generate_latest(registry)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _dead_pids(path: str) -> set[int]:
+    """Exited processes that still have files this cleanup handles."""
+    pids = set()
+    for filename in glob.glob(os.path.join(path, "*.db")):
+        prefix, _, pid = os.path.basename(filename)[:-3].rpartition("_")
+        handled = prefix in _ARCHIVED_TYPES or prefix.startswith("gauge_live")
+        if handled and pid.isdigit() and not _pid_alive(int(pid)):
+            pids.add(int(pid))
+    return pids
+
+
+def _archive(path: str, typ: str, files: list[str]) -> None:
+    """Merge `files` into the type's archive file, replacing it atomically."""
+    archive = os.path.join(path, f"{typ}_{ARCHIVE}.db")
+    sources = [archive, *files] if os.path.exists(archive) else files
+    merged = multiprocess.MultiProcessCollector.merge(sources, accumulate=False)
+    staging = os.path.join(path, f".{typ}_{ARCHIVE}.tmp")
+    values = MmapedDict(staging)
+    try:
+        for metric in merged:
+            for sample in metric.samples:
+                key = mmap_key(
+                    metric.name, sample.name, list(sample.labels), list(sample.labels.values()), metric.documentation
+                )
+                values.write_value(key, sample.value, 0.0)
+    finally:
+        values.close()
+    os.replace(staging, archive)
+
+
+def cleanup_dead_workers(path: Optional[str] = None) -> set[int]:
+    """Fold the files of exited processes into the archives. Returns their pids.
+
+    Counters, histograms and summaries keep their totals; the live gauges
+    of a dead process are dropped.
+    """
+    path = path or MULTIPROC_DIR
+    if not path:
+        return set()
+    with _directory_lock(path, exclusive=True):
+        dead = _dead_pids(path)
+        if not dead:
+            return dead
+        for typ in _ARCHIVED_TYPES:
+            files = [f for pid in dead if os.path.exists(f := os.path.join(path, f"{typ}_{pid}.db"))]
+            if files:
+                _archive(path, typ, files)
+                for filename in files:
+                    os.remove(filename)
+        for pid in dead:
+            multiprocess.mark_process_dead(pid, path)
+    return dead
+
+
+async def run_dead_worker_cleanup():
+    """Periodically archive exited workers' files (started in main.lifespan)."""
+    while True:
+        try:
+            dead = await asyncio.to_thread(cleanup_dead_workers)
+            if dead:
+                logger.info("Archived metrics of exited processes %s", sorted(dead))
+        except Exception:
+            logger.exception("Metrics cleanup failed")
+        await asyncio.sleep(METRICS_CLEANUP_INTERVAL_SECONDS)
 
 
 # Bot detection patterns
 BOT_PATTERNS = ["Googlebot", "bingbot", "Baiduspider", "YandexBot", "DuckDuckBot", "Slurp"]
+_BOT_RE = re.compile("|".join(re.escape(bot) for bot in BOT_PATTERNS), re.IGNORECASE)
+_BOT_NAMES = {bot.lower(): bot for bot in BOT_PATTERNS}
+
+UNMATCHED = "unmatched"
+_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording HTTP request metrics.
+
+    Requests are labelled by the matched route template (e.g.
+    ``/api/v1/resume/documents/{document_id}``); anything that matched no
+    route is counted under ``unmatched``, and unknown methods as ``OTHER``,
+    so scanners cannot create new series. Label children are bound once
+    per (endpoint, method, status) and reused.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._children: dict[tuple, tuple] = {}
+
+    def _children_for(self, endpoint: str, method: str, status: int) -> tuple:
+        key = (endpoint, method, status)
+        children = self._children.get(key)
+        if children is None:
+            children = self._children[key] = (
+                http_requests.labels(tool=TOOL_NAME, endpoint=endpoint, method=method, status=status),
+                http_request_duration.labels(tool=TOOL_NAME, endpoint=endpoint, method=method),
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
 
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
 
-async def track_request(request: Request, response, duration: float):
-    """Track HTTP request metrics."""
-    endpoint = request.url.path
-    method = request.method
-    status = response.status_code
-    
-    http_requests.labels(
-        tool=TOOL_NAME,
-        endpoint=endpoint,
-        method=method,
-        status=status
-    ).inc()
-    
-    http_request_duration.labels(
-        tool=TOOL_NAME,
-        endpoint=endpoint,
-        method=method
-    ).observe(duration)
-    
-    # Track bot visits
-    ua = request.headers.get("user-agent", "")
-    for bot in BOT_PATTERNS:
-        if bot.lower() in ua.lower():
-            crawler_visits.labels(tool=TOOL_NAME, bot=bot).inc()
-            break
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            method = scope["method"]
+            requests, durations = self._children_for(
+                getattr(scope.get("route"), "path", UNMATCHED),
+                method if method in _METHODS else "OTHER",
+                status,
+            )
+            requests.inc()
+            durations.observe(duration)
+            for name, value in scope["headers"]:
+                if name == b"user-agent":
+                    match = _BOT_RE.search(value.decode("latin-1"))
+                    if match:
+                        crawler_visits.labels(tool=TOOL_NAME, bot=_BOT_NAMES[match.group().lower()]).inc()
+                    break
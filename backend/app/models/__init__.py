@@ -1,4 +1,4 @@
-from app.models.token import GenerationToken, PaymentTransaction
-from app.models.resume import Resume, DailyUsage
+from app.models.token import GenerationToken, PaymentTransaction, WebhookEvent
+from app.models.resume import Resume, ResumeVersion, DailyUsage, DailyUsageArchive
 
-__all__ = ["GenerationToken", "PaymentTransaction", "Resume", "DailyUsage"]
+__all__ = ["GenerationToken", "PaymentTransaction", "WebhookEvent", "Resume", "ResumeVersion", "DailyUsage", "DailyUsageArchive"]
@@ -1,7 +1,11 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, JSON
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index
 from sqlalchemy.sql import func
+from app.core.codec import CompactJSON
+from app.core.config import get_settings
 from app.core.database import Base
 
+settings = get_settings()
+
 
 class Resume(Base):
     """Resume data storage."""
@@ -12,17 +16,56 @@ class Resume(Base):
     device_id = Column(String(255), index=True, nullable=False)
     title = Column(String(255), default="Untitled Resume")
     template_id = Column(String(50), default="modern")
-    data = Column(JSON, default=dict)  # Full resume JSON
+    data = Column(CompactJSON(settings.STORAGE_CODEC), default=dict)  # Full resume JSON
+    # Bumped on every save; clients send it back (If-Match) for optimistic concurrency
+    version = Column(Integer, default=1, server_default="1", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class ResumeVersion(Base):
+    """One saved version of a resume: a full snapshot, or a delta from the previous version."""
+    
+    __tablename__ = "resume_versions"
+    __table_args__ = (
+        Index("uq_resume_versions_resume_version", "resume_id", "version", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    resume_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    # "snapshot": payload is the document; "delta": a JSON Patch from the previous row
+    kind = Column(String(10), nullable=False)
+    payload = Column(CompactJSON(settings.STORAGE_CODEC), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class DailyUsage(Base):
     """Track daily free usage."""
     
     __tablename__ = "daily_usage"
+    __table_args__ = (
+        # One counter row per device per day; target of the quota UPSERT.
+        Index("uq_daily_usage_device_date", "device_id", "date", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String(255), index=True, nullable=False)
     date = Column(String(10), index=True, nullable=False)  # YYYY-MM-DD
     generations_used = Column(Integer, default=0)
+    # Free generations debited for in-flight requests, refunded if not confirmed in time
+    reserved = Column(Integer, default=0, server_default="0", nullable=False)
+    reserved_until = Column(DateTime, nullable=True)
+    # Bumped when the sweeper refunds `reserved`; reservations taken before then are void
+    reserved_epoch = Column(Integer, default=0, server_default="0", nullable=False)
+
+
+class DailyUsageArchive(Base):
+    """Per-day usage totals kept after old DailyUsage rows are compacted."""
+    
+    __tablename__ = "daily_usage_archive"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(String(10), unique=True, index=True, nullable=False)  # YYYY-MM-DD
+    devices = Column(Integer, default=0)
+    generations_used = Column(Integer, default=0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, Index
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -13,6 +13,11 @@ class GenerationToken(Base):
     tokens_remaining = Column(Integer, default=0)
     total_purchased = Column(Integer, default=0)
     free_trial_used = Column(Boolean, default=False)
+    # Tokens debited for in-flight generations, refunded if not confirmed in time
+    reserved = Column(Integer, default=0, server_default="0", nullable=False)
+    reserved_until = Column(DateTime, nullable=True)
+    # Bumped when the sweeper refunds `reserved`; reservations taken before then are void
+    reserved_epoch = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -32,3 +37,25 @@ class PaymentTransaction(Base):
     tokens_granted = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class WebhookEvent(Base):
+    """Received webhook, persisted before it is acknowledged and processed by a worker."""
+    
+    __tablename__ = "webhook_inbox"
+    __table_args__ = (
+        Index("ix_webhook_inbox_due", "status", "next_attempt_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # Provider event id (or a hash of the body); redeliveries are dropped on insert
+    event_id = Column(String(255), unique=True, nullable=False)
+    event_type = Column(String(100))
+    checkout_id = Column(String(255), index=True, nullable=True)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), default="pending", nullable=False)  # pending, done, dead
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, nullable=False)
+    processed_at = Column(DateTime, nullable=True)
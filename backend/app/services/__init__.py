@@ -1,3 +1,9 @@
-from app.services import llm_service, token_service
+from app.services import (
+    autosave, creem_client, document_service, llm_cache, llm_service, pdf_cache, pdf_service, profiler, quota,
+    token_service, usage_cache, version_history, webhook_inbox,
+)
 
-__all__ = ["llm_service", "token_service"]
+__all__ = [
+    "autosave", "creem_client", "document_service", "llm_cache", "llm_service", "pdf_cache", "pdf_service",
+    "profiler", "quota", "token_service", "usage_cache", "version_history", "webhook_inbox",
+]
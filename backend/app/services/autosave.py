@@ -0,0 +1,179 @@
+"""
+Write-behind buffer for resume document saves.
+
+The editor autosaves on every pause in typing, so most saves are quickly
+superseded by the next one. With the buffer enabled, a save is applied to
+an in-memory copy of the document and its version is bumped there; the
+row is written once the document has been pending for
+``AUTOSAVE_WINDOW_SECONDS`` (all due documents in one transaction), or
+sooner once ``AUTOSAVE_MAX_PENDING`` documents are waiting. Reads by the
+owning device see the buffered copy, and everything pending is flushed on
+shutdown.
+
+The buffer is per process, so this is only exact for a single worker: a
+flush whose base version no longer matches the row is dropped and logged.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.database import async_session
+from app.metrics import TOOL_NAME, autosave_conflicts, autosave_flushes, autosave_pending
+from app.models.resume import Resume
+from app.services import version_history
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingSave:
+    device_id: str
+    document: dict[str, Any]
+    # Version of the row in the database, and of the buffered document.
+    base_version: int
+    version: int
+    since: float
+    # The document at base_version, for the version history delta.
+    base_document: Optional[dict[str, Any]] = None
+    saves: int = 1
+
+
+class AutosaveBuffer:
+    """Buffered documents keyed by document id, flushed in batches."""
+
+    def __init__(self, session_factory: Callable[[], AsyncSession], window: float, max_pending: int):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_pending = max_pending
+        self.pending: dict[int, PendingSave] = {}
+        self._flush_lock = asyncio.Lock()
+        self._early_flush: Optional[asyncio.Task] = None
+
+    def get(self, device_id: str, document_id: int) -> Optional[PendingSave]:
+        entry = self.pending.get(document_id)
+        return entry if entry is not None and entry.device_id == device_id else None
+
+    def stage(
+        self, device_id: str, document_id: int, base_version: int, document: dict, previous: Optional[dict] = None
+    ) -> int:
+        """Buffer a saved document on top of `base_version` (whose document is `previous`).
+
+        Returns the document's new version.
+        """
+        entry = self.pending.get(document_id)
+        if entry is None:
+            entry = self.pending[document_id] = PendingSave(
+                device_id, document, base_version, base_version + 1, time.monotonic(), previous
+            )
+            autosave_pending.labels(tool=TOOL_NAME).set(len(self.pending))
+        else:
+            entry.document = document
+            entry.version += 1
+            entry.saves += 1
+        if len(self.pending) >= self.max_pending and (
+            self._early_flush is None or self._early_flush.done()
+        ):
+            self._early_flush = asyncio.create_task(self.flush_quietly(due_only=False))
+        return entry.version
+
+    def discard(self, document_id: int) -> None:
+        if self.pending.pop(document_id, None) is not None:
+            autosave_pending.labels(tool=TOOL_NAME).set(len(self.pending))
+
+    async def flush(self, due_only: bool = False) -> int:
+        """Write buffered documents in one transaction. Returns documents written.
+
+        With `due_only`, only documents pending for at least the window are
+        written. Saves arriving during the flush stay buffered on top of it.
+        """
+        async with self._flush_lock:
+            now = time.monotonic()
+            batch = {
+                document_id: (entry, entry.version, entry.document)
+                for document_id, entry in self.pending.items()
+                if not due_only or now - entry.since >= self.window
+            }
+            if not batch:
+                return 0
+            conflicts = []
+            try:
+                async with self.session_factory() as db:
+                    for document_id, (entry, version, document) in batch.items():
+                        result = await db.execute(
+                            update(Resume)
+                            .where(
+                                Resume.id == document_id,
+                                Resume.device_id == entry.device_id,
+                                Resume.version == entry.base_version,
+                            )
+                            .values(**document, version=version, updated_at=func.now())
+                            .execution_options(synchronize_session=False)
+                        )
+                        if result.rowcount == 0:
+                            conflicts.append(document_id)
+                        else:
+                            await version_history.record_version(
+                                db, document_id, version, document, entry.base_version, entry.base_document
+                            )
+                    await db.commit()
+            except Exception:
+                # Leave the documents buffered so the next flush retries them.
+                autosave_flushes.labels(tool=TOOL_NAME, status="error").inc()
+                raise
+
+            for document_id, (entry, version, document) in batch.items():
+                if self.pending.get(document_id) is not entry:
+                    continue  # Deleted while flushing.
+                if document_id in conflicts or entry.version == version:
+                    del self.pending[document_id]
+                else:
+                    entry.base_version = version
+                    entry.base_document = document
+                    entry.since = time.monotonic()
+            if conflicts:
+                autosave_conflicts.labels(tool=TOOL_NAME).inc(len(conflicts))
+                logger.warning("Dropped buffered saves for changed or deleted documents %s", conflicts)
+            autosave_pending.labels(tool=TOOL_NAME).set(len(self.pending))
+            autosave_flushes.labels(tool=TOOL_NAME, status="ok").inc()
+            return len(batch) - len(conflicts)
+
+    async def flush_quietly(self, due_only: bool = True) -> None:
+        try:
+            await self.flush(due_only=due_only)
+        except Exception:
+            logger.exception("Autosave flush failed")
+
+
+_buffer: Optional[AutosaveBuffer] = None
+
+
+def get_buffer() -> Optional[AutosaveBuffer]:
+    """The process-wide buffer, or None when AUTOSAVE_BUFFER_ENABLED is off."""
+    global _buffer
+    if not settings.AUTOSAVE_BUFFER_ENABLED:
+        return None
+    if _buffer is None:
+        _buffer = AutosaveBuffer(async_session, settings.AUTOSAVE_WINDOW_SECONDS, settings.AUTOSAVE_MAX_PENDING)
+    return _buffer
+
+
+async def run_flusher():
+    """Flush documents whose window has passed (started in main.lifespan)."""
+    while True:
+        await asyncio.sleep(settings.AUTOSAVE_WINDOW_SECONDS / 2)
+        buffer = get_buffer()
+        if buffer is not None:
+            await buffer.flush_quietly()
+
+
+async def shutdown() -> None:
+    """Flush everything still buffered (called on shutdown)."""
+    if _buffer is not None:
+        await _buffer.flush()
@@ -0,0 +1,261 @@
+"""
+Client for the Creem payments API.
+
+One pooled ``httpx.AsyncClient`` is shared by every call, and the SKU to
+Creem product id map is parsed once at startup. Each attempt has its own
+timeout (``CREEM_TIMEOUT_SECONDS``) and all attempts of a call share a
+deadline (``CREEM_DEADLINE_SECONDS``), so a slow upstream cannot hold a
+request for long. Retries use jittered exponential backoff: idempotent
+calls retry on timeouts, transport errors, 429 and 5xx; other calls only
+when the request never reached Creem (connection failures).
+
+A circuit breaker opens after ``CREEM_BREAKER_FAILURES`` consecutive
+failed calls and fails calls fast with ``CreemUnavailable`` for
+``CREEM_BREAKER_RESET_SECONDS``, after which a single trial call decides
+whether it closes again.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Optional
+
+import httpx
+from app.core.config import get_settings
+from app.metrics import TOOL_NAME, creem_breaker_state, creem_request_duration, creem_requests
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class CreemError(Exception):
+    """Creem rejected the request."""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CreemUnavailable(CreemError):
+    """Creem is unreachable, too slow or failing; try again later."""
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message, status_code=503)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial."""
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = self.CLOSED
+
+    def _set_state(self, state: int) -> None:
+        self.state = state
+        creem_breaker_state.labels(tool=TOOL_NAME).set(state)
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_seconds - time.monotonic(), 0)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now."""
+        if self.state == self.CLOSED:
+            return True
+        if self.retry_after() <= 0:
+            # One trial call; another one after each reset period if it never reports back.
+            self.opened_at = time.monotonic()
+            self._set_state(self.HALF_OPEN)
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Creem circuit breaker opened after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+
+def api_base() -> str:
+    """CREEM_API_URL if set; otherwise the test API for test keys, production for live keys."""
+    if settings.CREEM_API_URL:
+        return settings.CREEM_API_URL.rstrip("/")
+    if settings.CREEM_API_KEY.startswith("creem_test_"):
+        return "https://test-api.creem.io/v1"
+    return "https://api.creem.io/v1"
+
+
+def _parse_product_ids(raw: str) -> dict[str, str]:
+    try:
+        product_ids = json.loads(raw) if raw else {}
+    except ValueError:
+        logger.error("CREEM_PRODUCT_IDS is not valid JSON; no products are purchasable")
+        return {}
+    if not isinstance(product_ids, dict):
+        logger.error("CREEM_PRODUCT_IDS must be a JSON object; no products are purchasable")
+        return {}
+    return {str(sku): str(product_id) for sku, product_id in product_ids.items()}
+
+
+_client: Optional[httpx.AsyncClient] = None
+_product_ids: Optional[dict[str, str]] = None
+_breaker: Optional[CircuitBreaker] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=api_base(),
+        headers={"x-api-key": settings.CREEM_API_KEY, "Content-Type": "application/json"},
+        limits=httpx.Limits(
+            max_connections=settings.CREEM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.CREEM_POOL_MAX_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(settings.CREEM_TIMEOUT_SECONDS),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside of lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def get_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(settings.CREEM_BREAKER_FAILURES, settings.CREEM_BREAKER_RESET_SECONDS)
+    return _breaker
+
+
+def product_ids() -> dict[str, str]:
+    """The SKU to Creem product id map, parsed once."""
+    global _product_ids
+    if _product_ids is None:
+        _product_ids = _parse_product_ids(settings.CREEM_PRODUCT_IDS)
+    return _product_ids
+
+
+async def init_client() -> httpx.AsyncClient:
+    """Parse the product map and create the shared client (called on startup)."""
+    product_ids()
+    return get_client()
+
+
+async def close_client() -> None:
+    """Close the shared client (called on shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, settings.CREEM_RETRY_BASE_SECONDS * 2 ** attempt)
+
+
+def _retryable(error: Exception, idempotent: bool) -> bool:
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True  # Nothing reached Creem, so any call is safe to repeat.
+    if not idempotent:
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+async def _request(operation: str, method: str, path: str, idempotent: bool, **kwargs) -> Any:
+    breaker = get_breaker()
+    if not breaker.allow():
+        creem_requests.labels(tool=TOOL_NAME, operation=operation, outcome="short_circuited").inc()
+        raise CreemUnavailable("Payment provider is unavailable", retry_after=breaker.retry_after())
+
+    client = get_client()
+    deadline = time.monotonic() + settings.CREEM_DEADLINE_SECONDS
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise httpx.TimeoutException("Creem deadline exceeded")
+            response = await client.request(
+                method, path, timeout=min(settings.CREEM_TIMEOUT_SECONDS, remaining), **kwargs
+            )
+            response.raise_for_status()
+            break
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status < 500 and status != 429:
+                # The upstream is healthy; the request itself was rejected.
+                breaker.record_success()
+                creem_requests.labels(tool=TOOL_NAME, operation=operation, outcome="rejected").inc()
+                raise CreemError(f"Creem API error: {e.response.text}", status_code=status)
+            error: Exception = e
+        except httpx.HTTPError as e:
+            error = e
+
+        attempt += 1
+        delay = _backoff(attempt)
+        if (
+            attempt >= settings.CREEM_MAX_ATTEMPTS
+            or not _retryable(error, idempotent)
+            or time.monotonic() + delay >= deadline
+        ):
+            breaker.record_failure()
+            creem_requests.labels(tool=TOOL_NAME, operation=operation, outcome="failed").inc()
+            creem_request_duration.labels(tool=TOOL_NAME, operation=operation).observe(time.perf_counter() - start)
+            raise CreemUnavailable(f"Payment provider error: {error!r}", retry_after=breaker.retry_after())
+        creem_requests.labels(tool=TOOL_NAME, operation=operation, outcome="retried").inc()
+        await asyncio.sleep(delay)
+
+    breaker.record_success()
+    creem_requests.labels(tool=TOOL_NAME, operation=operation, outcome="ok").inc()
+    creem_request_duration.labels(tool=TOOL_NAME, operation=operation).observe(time.perf_counter() - start)
+    return response.json()
+
+
+async def create_checkout(
+    product_sku: str,
+    device_id: str,
+    generations: int,
+    success_url: str,
+    email: Optional[str] = None,
+) -> dict:
+    """Create a checkout session for a configured SKU."""
+    product_id = product_ids().get(product_sku)
+    if not product_id:
+        raise CreemError("Product not configured in Creem", status_code=400)
+    payload = {
+        "product_id": product_id,
+        "success_url": success_url,
+        "metadata": {
+            "product_sku": product_sku,
+            "device_id": device_id,
+            "generations": str(generations),
+        },
+    }
+    if email:
+        payload["customer"] = {"email": email}
+    return await _request("create_checkout", "POST", "/checkouts", idempotent=False, json=payload)
+
+
+async def get_checkout(checkout_id: str) -> dict:
+    """Fetch a checkout session (safe to retry)."""
+    return await _request(
+        "get_checkout", "GET", "/checkouts", idempotent=True, params={"checkout_id": checkout_id}
+    )
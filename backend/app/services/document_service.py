@@ -0,0 +1,206 @@
+"""
+Server-side storage of resume documents.
+
+Saves are RFC 6902 JSON Patches against the document
+``{"title", "template_id", "data"}`` and are guarded by the row's
+``version``: a save names the version it was based on and only applies
+if nobody saved in between. With ``AUTOSAVE_BUFFER_ENABLED``, saves go
+through the write-behind buffer in ``autosave`` and reads by the owning
+device see the buffered document.
+"""
+import json
+from typing import Any, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.config import get_settings
+from app.core.jsonpatch import JsonPatchError, apply_patch
+from app.models.resume import Resume
+from app.services import autosave, version_history
+
+settings = get_settings()
+
+FIELDS = ("title", "template_id", "data")
+
+
+class InvalidDocument(ValueError):
+    """The document (after patching) is not a valid resume document."""
+
+
+class VersionConflict(Exception):
+    """The document was saved by someone else since `expected` was read."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Document is at version {current_version}")
+        self.current_version = current_version
+
+
+def as_document(resume: Resume) -> dict[str, Any]:
+    return {"title": resume.title, "template_id": resume.template_id, "data": resume.data or {}}
+
+
+def validate_document(document: Any) -> dict[str, Any]:
+    """Check a (patched) document's shape and size."""
+    if not isinstance(document, dict) or set(document) != set(FIELDS):
+        raise InvalidDocument(f"Document must have exactly the fields {', '.join(FIELDS)}")
+    if not isinstance(document["title"], str) or len(document["title"]) > 255:
+        raise InvalidDocument("title must be a string of at most 255 characters")
+    if not isinstance(document["template_id"], str) or len(document["template_id"]) > 50:
+        raise InvalidDocument("template_id must be a string of at most 50 characters")
+    if not isinstance(document["data"], dict):
+        raise InvalidDocument("data must be an object")
+    size = len(json.dumps(document["data"], separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    if size > settings.RESUME_MAX_BYTES:
+        raise InvalidDocument(f"data exceeds {settings.RESUME_MAX_BYTES} bytes")
+    return document
+
+
+async def create_document(
+    db: AsyncSession, device_id: str, title: str, template_id: str, data: dict
+) -> Resume:
+    validate_document({"title": title, "template_id": template_id, "data": data})
+    resume = Resume(device_id=device_id, title=title, template_id=template_id, data=data, version=1)
+    db.add(resume)
+    await db.flush()
+    await version_history.record_version(db, resume.id, 1, as_document(resume))
+    await db.commit()
+    await db.refresh(resume)
+    return resume
+
+
+async def _load(db: AsyncSession, device_id: str, document_id: int) -> Optional[Resume]:
+    result = await db.execute(
+        select(Resume).where(Resume.id == document_id, Resume.device_id == device_id)
+    )
+    return result.scalar_one_or_none()
+
+
+def _with_buffered(resumes: list[Resume], buffer: Optional[autosave.AutosaveBuffer]) -> list[Resume]:
+    """Show buffered saves on loaded rows without marking them dirty."""
+    if buffer is not None:
+        for resume in resumes:
+            entry = buffer.get(resume.device_id, resume.id)
+            if entry is not None:
+                for key, value in {**entry.document, "version": entry.version}.items():
+                    set_committed_value(resume, key, value)
+    return resumes
+
+
+async def list_documents(db: AsyncSession, device_id: str) -> list[Resume]:
+    result = await db.execute(
+        select(Resume).where(Resume.device_id == device_id).order_by(Resume.id)
+    )
+    return _with_buffered(list(result.scalars()), autosave.get_buffer())
+
+
+async def get_document(db: AsyncSession, device_id: str, document_id: int) -> Optional[Resume]:
+    resume = await _load(db, device_id, document_id)
+    if resume is not None:
+        _with_buffered([resume], autosave.get_buffer())
+    return resume
+
+
+async def patch_document(
+    db: AsyncSession, device_id: str, document_id: int, expected_version: int, patch: list[dict]
+) -> Optional[int]:
+    """Apply a JSON Patch saved against `expected_version`.
+
+    Returns the new version, or None if the document does not exist.
+    Raises VersionConflict if it was saved since, JsonPatchError if the
+    patch does not apply and InvalidDocument if the result is not a valid
+    document.
+    """
+    if len(patch) > settings.RESUME_PATCH_MAX_OPS:
+        raise JsonPatchError(f"A save may contain at most {settings.RESUME_PATCH_MAX_OPS} operations")
+    buffer = autosave.get_buffer()
+    if buffer is not None:
+        return await _patch_buffered(db, buffer, device_id, document_id, expected_version, patch)
+
+    resume = await _load(db, device_id, document_id)
+    if resume is None:
+        return None
+    if resume.version != expected_version:
+        raise VersionConflict(resume.version)
+
+    previous = as_document(resume)
+    document = validate_document(apply_patch(previous, patch))
+    result = await db.execute(
+        update(Resume)
+        .where(
+            Resume.id == document_id,
+            Resume.device_id == device_id,
+            Resume.version == expected_version,
+        )
+        .values(**document, version=Resume.version + 1)
+        .returning(Resume.version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one_or_none()
+    if version is None:
+        # Lost a race with a concurrent save between the read and the update.
+        await db.rollback()
+        await db.refresh(resume)
+        raise VersionConflict(resume.version)
+    await version_history.record_version(db, document_id, version, document, expected_version, previous)
+    await db.commit()
+    return version
+
+
+async def _patch_buffered(
+    db: AsyncSession,
+    buffer: autosave.AutosaveBuffer,
+    device_id: str,
+    document_id: int,
+    expected_version: int,
+    patch: list[dict],
+) -> Optional[int]:
+    """Apply a save to the buffered document, loading it on the first save."""
+    entry = buffer.get(device_id, document_id)
+    if entry is None:
+        resume = await _load(db, device_id, document_id)
+        if resume is None:
+            return None
+        # Another save may have been buffered while we were loading.
+        entry = buffer.get(device_id, document_id)
+    if entry is not None:
+        current, base_version = entry.document, entry.version
+    else:
+        current, base_version = as_document(resume), resume.version
+    if base_version != expected_version:
+        raise VersionConflict(base_version)
+
+    document = validate_document(apply_patch(current, patch))
+    return buffer.stage(device_id, document_id, base_version, document, previous=current)
+
+
+async def restore_version(
+    db: AsyncSession, device_id: str, document_id: int, version: int, expected_version: int
+) -> Optional[int]:
+    """Save an earlier version from the history as a new version.
+
+    Returns the new version, or None if the document or version does not
+    exist. Raises VersionConflict like patch_document.
+    """
+    if await get_document(db, device_id, document_id) is None:
+        return None
+    found = await version_history.get_version(db, document_id, version)
+    if found is None:
+        return None
+    document, _ = found
+    patch = [{"op": "replace", "path": f"/{field}", "value": document[field]} for field in FIELDS]
+    return await patch_document(db, device_id, document_id, expected_version, patch)
+
+
+async def delete_document(db: AsyncSession, device_id: str, document_id: int) -> bool:
+    result = await db.execute(
+        delete(Resume).where(Resume.id == document_id, Resume.device_id == device_id)
+    )
+    if result.rowcount > 0:
+        await version_history.delete_history(db, document_id)
+    await db.commit()
+    buffer = autosave.get_buffer()
+    if buffer is not None and result.rowcount > 0:
+        buffer.discard(document_id)
+    return result.rowcount > 0
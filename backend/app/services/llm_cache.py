@@ -0,0 +1,314 @@
+"""
+Content-addressed response cache for LLM generations.
+
+Keys are a hash of the section, model, temperature and the inputs that
+section's prompt is built from (``PROMPT_FIELDS``). The job title and
+language are normalized with ``normalize_inputs``, and the prompt is built
+from those same values, so requests that share a key always send the same
+prompt. Each key stores up to ``LLM_CACHE_VARIANTS`` distinct completions; once that many have been collected, lookups rotate
+through them so repeat users don't always see the same text.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.core import codec
+from app.core.config import get_settings
+from app.metrics import TOOL_NAME, llm_cache_hits, llm_cache_misses, llm_cache_evictions
+
+settings = get_settings()
+
+
+@dataclass
+class CacheEntry:
+    variants: list[str]
+    expires_at: float
+    size: int = field(init=False)
+
+    def __post_init__(self):
+        self.size = sum(len(v.encode("utf-8")) for v in self.variants)
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+
+def normalize_inputs(job_title: str, language: str) -> tuple[str, str]:
+    """Collapse whitespace in the job title and lowercase the language code."""
+    return " ".join(job_title.split()), language.strip().lower()
+
+
+# Inputs each section's prompt uses (see llm_service._resume_payload);
+# other sections get the experience prompt.
+PROMPT_FIELDS = {
+    "experience": ("job_title", "language", "context"),
+    "summary": ("job_title", "language", "context"),
+    "skills": ("job_title", "language"),
+    "improve": ("language", "context"),
+}
+
+
+def make_key(
+    section: str,
+    job_title: str,
+    language: str,
+    context: str,
+    model: str,
+    temperature: float,
+) -> str:
+    """Hash a generation request into a cache key.
+
+    Only normalizations the prompt also gets (``normalize_inputs``) are
+    applied, and only the inputs the section's prompt uses are hashed;
+    anything else that changes the prompt changes the key.
+    """
+    job_title, language = normalize_inputs(job_title, language)
+    inputs = {"job_title": job_title, "language": language, "context": context}
+    normalized = {
+        "section": section,
+        "model": model,
+        "temperature": round(float(temperature), 3),
+    }
+    for name in PROMPT_FIELDS.get(section, PROMPT_FIELDS["experience"]):
+        normalized[name] = inputs[name]
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """In-process LRU with TTL, entry-count and byte-size bounds."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expired:
+            self._remove(key, "ttl")
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        if key in self._entries:
+            self.total_bytes -= self._entries.pop(key).size
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest, "size")
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    async def close(self) -> None:
+        pass
+
+    def _remove(self, key: str, reason: str) -> None:
+        self.total_bytes -= self._entries.pop(key).size
+        llm_cache_evictions.labels(tool=TOOL_NAME, backend=self.name, reason=reason).inc()
+
+
+class SQLiteCache:
+    """On-disk cache tier that survives restarts.
+
+    Variants are stored with the given storage codec; entries written
+    with another codec are still read.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int, storage_codec: str = "json"):
+        self.path = path
+        self.max_entries = max_entries
+        self.storage_codec = storage_codec
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, variants TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        await asyncio.to_thread(self._set, key, entry)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM llm_cache")
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT variants, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                llm_cache_evictions.labels(tool=TOOL_NAME, backend=self.name, reason="ttl").inc()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return CacheEntry(variants=codec.decode(row[0]), expires_at=row[1])
+
+    def _set(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, variants, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, codec.encode(entry.variants, self.storage_codec), entry.expires_at, time.time()),
+            )
+            overflow = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._conn.commit()
+        if overflow > 0:
+            llm_cache_evictions.labels(tool=TOOL_NAME, backend=self.name, reason="size").inc(overflow)
+
+
+class TieredCache:
+    """Memory LRU in front of the SQLite tier."""
+
+    name = "tiered"
+
+    def __init__(self, memory: MemoryCache, disk: SQLiteCache):
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = await self.memory.get(key)
+        if entry is None:
+            entry = await self.disk.get(key)
+            if entry is not None:
+                await self.memory.set(key, entry)
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        await self.memory.set(key, entry)
+        await self.disk.set(key, entry)
+
+    async def clear(self) -> None:
+        await self.memory.clear()
+        await self.disk.clear()
+
+    async def close(self) -> None:
+        await self.disk.close()
+
+
+def _build_backend():
+    memory = MemoryCache(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_MAX_BYTES)
+    if settings.LLM_CACHE_BACKEND == "memory":
+        return memory
+    disk = SQLiteCache(settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_ENTRIES, settings.STORAGE_CODEC)
+    if settings.LLM_CACHE_BACKEND == "sqlite":
+        return disk
+    if settings.LLM_CACHE_BACKEND == "tiered":
+        return TieredCache(memory, disk)
+    raise ValueError(f"Unknown LLM_CACHE_BACKEND: {settings.LLM_CACHE_BACKEND}")
+
+
+_backend = None
+# Round-robin position per key, bounded like the memory tier.
+_cursors: OrderedDict[str, int] = OrderedDict()
+# One lock per key being stored; entries go away once no store holds them.
+_store_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = _build_backend()
+    return _backend
+
+
+async def init_cache() -> None:
+    """Open the configured cache backend (called on startup)."""
+    if settings.LLM_CACHE_ENABLED:
+        get_backend()
+
+
+async def close_cache() -> None:
+    """Close the cache backend (called on shutdown)."""
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
+    _cursors.clear()
+
+
+def is_enabled_for(section: str) -> bool:
+    return settings.LLM_CACHE_ENABLED and section in settings.LLM_CACHE_SECTIONS
+
+
+async def lookup(section: str, key: str) -> Optional[str]:
+    """Return a cached variant, or None if more variants should be collected."""
+    entry = await get_backend().get(key)
+    if entry is None or len(entry.variants) < settings.LLM_CACHE_VARIANTS:
+        llm_cache_misses.labels(tool=TOOL_NAME, section=section).inc()
+        return None
+
+    position = _cursors.pop(key, 0)
+    _cursors[key] = position + 1
+    if len(_cursors) > settings.LLM_CACHE_MAX_ENTRIES:
+        _cursors.popitem(last=False)
+
+    llm_cache_hits.labels(tool=TOOL_NAME, section=section).inc()
+    return entry.variants[position % len(entry.variants)]
+
+
+async def store(key: str, content: str) -> None:
+    """Add a freshly generated variant under ``key``.
+
+    Stores for the same key are serialized within the process, so
+    concurrent generations don't overwrite each other's variants.
+    """
+    lock = _store_locks.get(key)
+    if lock is None:
+        lock = _store_locks[key] = asyncio.Lock()
+    async with lock:
+        backend = get_backend()
+        entry = await backend.get(key)
+        variants = list(entry.variants) if entry else []
+        if content in variants or len(variants) >= settings.LLM_CACHE_VARIANTS:
+            return
+        variants.append(content)
+        expires_at = entry.expires_at if entry else time.time() + settings.LLM_CACHE_TTL_SECONDS
+        await backend.set(key, CacheEntry(variants=variants, expires_at=expires_at))
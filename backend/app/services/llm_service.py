@@ -1,17 +1,243 @@
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
 import httpx
+from app.core import tracing
 from app.core.config import get_settings
+from app.services import llm_cache
+from app.metrics import (
+    TOOL_NAME, llm_pool_max_connections, llm_pool_in_flight,
+    llm_pool_saturated, llm_pool_timeouts, llm_coalesced_calls, llm_coalesce_overflow,
+    llm_cost, llm_errors, llm_request_duration, llm_time_to_first_byte, llm_tokens
+)
 
 settings = get_settings()
 
+MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.7
 
-async def generate_resume_content(
-    job_title: str,
-    section: str = "experience",
-    context: str = "",
-    language: str = "en"
-) -> str:
-    """Generate resume content using LLM proxy."""
-    
+# USD per million (prompt, completion) tokens, for the cost estimate.
+PRICES_PER_MILLION_TOKENS = {
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Metric label values; unknown sections get the experience prompt.
+SECTIONS = ("experience", "summary", "skills", "improve", "cover_letter")
+
+# Shared client, created in main.lifespan and reused for every proxy call.
+_client: Optional[httpx.AsyncClient] = None
+_in_flight = 0
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(settings.LLM_TIMEOUT_SECONDS, pool=settings.LLM_POOL_TIMEOUT_SECONDS)
+    llm_pool_max_connections.labels(tool=TOOL_NAME).set(settings.LLM_POOL_MAX_CONNECTIONS)
+    return httpx.AsyncClient(
+        base_url=settings.LLM_PROXY_URL,
+        headers={
+            "Authorization": f"Bearer {settings.LLM_PROXY_KEY}",
+            "Content-Type": "application/json"
+        },
+        limits=limits,
+        timeout=timeout,
+        http2=settings.LLM_HTTP2,
+    )
+
+
+async def init_client() -> httpx.AsyncClient:
+    """Create the shared LLM proxy client (called on startup)."""
+    return get_client()
+
+
+async def close_client() -> None:
+    """Close the shared LLM proxy client (called on shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside of lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+@asynccontextmanager
+async def _pooled_client():
+    """Yield the shared client while tracking pool usage."""
+    global _in_flight
+    client = get_client()
+    if _in_flight >= settings.LLM_POOL_MAX_CONNECTIONS:
+        llm_pool_saturated.labels(tool=TOOL_NAME).inc()
+    _in_flight += 1
+    llm_pool_in_flight.labels(tool=TOOL_NAME).set(_in_flight)
+    try:
+        yield client
+    except httpx.PoolTimeout:
+        llm_pool_timeouts.labels(tool=TOOL_NAME).inc()
+        raise
+    finally:
+        _in_flight -= 1
+        llm_pool_in_flight.labels(tool=TOOL_NAME).set(_in_flight)
+
+
+def _status_class(error: httpx.HTTPError) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"{error.response.status_code // 100}xx"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    return "transport"
+
+
+class _CallMetrics:
+    """Latency, usage and cost of one upstream call, labelled by section."""
+
+    def __init__(self, section: str):
+        self.section = section if section in SECTIONS else "experience"
+        self.start = time.perf_counter()
+        self._first_byte = False
+
+    def first_byte(self) -> None:
+        if not self._first_byte:
+            self._first_byte = True
+            llm_time_to_first_byte.labels(tool=TOOL_NAME, section=self.section).observe(
+                time.perf_counter() - self.start
+            )
+
+    def usage(self, model: str, usage: Optional[dict]) -> None:
+        if not usage:
+            return
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        llm_tokens.labels(tool=TOOL_NAME, section=self.section, model=model, kind="prompt").inc(prompt)
+        llm_tokens.labels(tool=TOOL_NAME, section=self.section, model=model, kind="completion").inc(completion)
+        prices = PRICES_PER_MILLION_TOKENS.get(model)
+        if prices is not None:
+            llm_cost.labels(tool=TOOL_NAME, section=self.section, model=model).inc(
+                (prompt * prices[0] + completion * prices[1]) / 1_000_000
+            )
+
+    def done(self) -> None:
+        llm_request_duration.labels(tool=TOOL_NAME, section=self.section).observe(time.perf_counter() - self.start)
+
+
+@asynccontextmanager
+async def _observed(section: str):
+    """Record an upstream call's metrics; calls abandoned by the caller only count as started."""
+    call = _CallMetrics(section)
+    with tracing.span("llm", section=call.section):
+        try:
+            yield call
+        except httpx.HTTPError as e:
+            llm_errors.labels(tool=TOOL_NAME, section=call.section, status_class=_status_class(e)).inc()
+            call.done()
+            raise
+        call.done()
+
+
+async def _chat_completion(payload: dict, section: str) -> dict:
+    """POST a chat completion through the pooled client."""
+    async with _observed(section) as call, _pooled_client() as client:
+        async with client.stream("POST", "/v1/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                call.first_byte()
+                body += chunk
+        data = json.loads(body)
+        call.usage(payload["model"], data.get("usage"))
+    return data
+
+
+async def _stream_completion(payload: dict, section: str) -> AsyncIterator[str]:
+    """Stream a chat completion, yielding content deltas as they arrive.
+
+    Closing the generator (e.g. on client disconnect) closes the upstream
+    response, which aborts the request at the proxy.
+    """
+    payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+    async with _observed(section) as call, _pooled_client() as client:
+        async with client.stream("POST", "/v1/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                call.first_byte()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # With include_usage, the last chunk has no choices and the totals.
+                call.usage(payload["model"], chunk.get("usage"))
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+class _Flight:
+    """One upstream call shared by every concurrent caller with the same payload."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+_flights: dict[str, _Flight] = {}
+
+
+async def _shared_completion(payload: dict, section: str) -> dict:
+    """Coalesce concurrent identical chat completions into one upstream call.
+
+    The upstream request runs in its own task so a disconnecting caller
+    does not cancel it for the others; it is only cancelled once every
+    waiter has gone away.
+    """
+    if not settings.LLM_COALESCE_ENABLED:
+        return await _chat_completion(payload, section)
+
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _Flight(asyncio.create_task(_chat_completion(payload, section)))
+        _flights[key] = flight
+        flight.task.add_done_callback(
+            lambda _, key=key, flight=flight: _flights.pop(key) if _flights.get(key) is flight else None
+        )
+    elif flight.waiters >= settings.LLM_COALESCE_MAX_WAITERS:
+        llm_coalesce_overflow.labels(tool=TOOL_NAME).inc()
+        return await _chat_completion(payload, section)
+    else:
+        llm_coalesced_calls.labels(tool=TOOL_NAME).inc()
+
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # Unregister now: the done callback only runs on a later loop
+            # iteration, and a caller arriving before then must not join a
+            # cancelled task.
+            if _flights.get(key) is flight:
+                del _flights[key]
+            flight.task.cancel()
+
+
+def _resume_payload(job_title: str, section: str, context: str, language: str) -> dict:
+    """Build the chat completion payload for a resume section."""
     prompts = {
         "experience": f"""Generate 3-4 professional bullet points for a {job_title} position.
 Focus on achievements, metrics, and impact. Use action verbs.
@@ -38,36 +264,19 @@ Language: {language}"""
     
     prompt = prompts.get(section, prompts["experience"])
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            f"{settings.LLM_PROXY_URL}/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {settings.LLM_PROXY_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o-mini",
-                "messages": [
-                    {"role": "system", "content": "You are a professional resume writer. Be concise and impactful."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 500
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a professional resume writer. Be concise and impactful."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": 500
+    }
 
 
-async def generate_cover_letter(
-    job_title: str,
-    company: str,
-    resume_summary: str,
-    language: str = "en"
-) -> str:
-    """Generate a cover letter using LLM proxy."""
-    
+def _cover_letter_payload(job_title: str, company: str, resume_summary: str, language: str) -> dict:
+    """Build the chat completion payload for a cover letter."""
     prompt = f"""Write a professional cover letter for a {job_title} position at {company}.
 
 Based on this candidate summary:
@@ -81,23 +290,86 @@ Requirements:
 
 Do not include placeholders like [Your Name] - write a complete letter."""
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            f"{settings.LLM_PROXY_URL}/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {settings.LLM_PROXY_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o-mini",
-                "messages": [
-                    {"role": "system", "content": "You are a professional career consultant specializing in cover letters."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 800
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a professional career consultant specializing in cover letters."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": 800
+    }
+
+
+async def generate_resume_content(
+    job_title: str,
+    section: str = "experience",
+    context: str = "",
+    language: str = "en"
+) -> str:
+    """Generate resume content using LLM proxy."""
+    job_title, language = llm_cache.normalize_inputs(job_title, language)
+    cache_key = None
+    if llm_cache.is_enabled_for(section):
+        cache_key = llm_cache.make_key(section, job_title, language, context, MODEL, TEMPERATURE)
+        with tracing.span("llm_cache"):
+            cached = await llm_cache.lookup(section, cache_key)
+        if cached is not None:
+            return cached
+    
+    data = await _shared_completion(_resume_payload(job_title, section, context, language), section)
+    content = data["choices"][0]["message"]["content"]
+    if cache_key is not None:
+        await llm_cache.store(cache_key, content)
+    return content
+
+
+async def stream_resume_content(
+    job_title: str,
+    section: str = "experience",
+    context: str = "",
+    language: str = "en"
+) -> AsyncIterator[str]:
+    """Stream resume content from the LLM proxy, chunk by chunk."""
+    job_title, language = llm_cache.normalize_inputs(job_title, language)
+    cache_key = None
+    if llm_cache.is_enabled_for(section):
+        cache_key = llm_cache.make_key(section, job_title, language, context, MODEL, TEMPERATURE)
+        with tracing.span("llm_cache"):
+            cached = await llm_cache.lookup(section, cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    chunks = []
+    async for delta in _stream_completion(_resume_payload(job_title, section, context, language), section):
+        chunks.append(delta)
+        yield delta
+    if cache_key is not None:
+        await llm_cache.store(cache_key, "".join(chunks))
+
+
+async def generate_cover_letter(
+    job_title: str,
+    company: str,
+    resume_summary: str,
+    language: str = "en"
+) -> str:
+    """Generate a cover letter using LLM proxy."""
+    data = await _shared_completion(
+        _cover_letter_payload(job_title, company, resume_summary, language), "cover_letter"
+    )
+    return data["choices"][0]["message"]["content"]
+
+
+async def stream_cover_letter(
+    job_title: str,
+    company: str,
+    resume_summary: str,
+    language: str = "en"
+) -> AsyncIterator[str]:
+    """Stream a cover letter from the LLM proxy, chunk by chunk."""
+    async for delta in _stream_completion(
+        _cover_letter_payload(job_title, company, resume_summary, language), "cover_letter"
+    ):
+        yield delta
@@ -0,0 +1,253 @@
+"""
+On-disk cache of rendered resume PDFs.
+
+Files are named by a hash of everything that determines the output: the
+resume JSON (canonicalized), the template id, the template version and
+the watermark flag. Identical requests are therefore served from disk
+without touching the render pool, and an edited resume simply maps to a
+new key. The file for a resume's previous version is dropped as soon as
+an edited version is requested, and the directory is kept under
+``PDF_CACHE_MAX_BYTES`` by evicting the least recently served files.
+
+The LRU bookkeeping is per process; with several workers sharing the
+directory the byte bound is approximate, never exceeded by more than one
+worker's view.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import get_settings
+from app.metrics import TOOL_NAME, pdf_cache_bytes, pdf_cache_evictions
+from app.services import pdf_service
+
+settings = get_settings()
+
+
+def make_key(data: dict, template_id: str, template_version: str, watermark: bool) -> str:
+    """Hash the render inputs into a cache key."""
+    payload = json.dumps(
+        {
+            "data": data or {},
+            "template_id": template_id,
+            "template_version": template_version,
+            "watermark": watermark,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def etag_for(key: str) -> str:
+    # Weak: re-rendering the same inputs yields an equivalent PDF, but
+    # WeasyPrint embeds a creation date, so not a byte-identical one.
+    return f'W/"{key}"'
+
+
+class PDFCache:
+    """Size-bounded LRU of PDF files in one directory."""
+
+    # Resumes whose current version is remembered for invalidation. Past
+    # this bound the least recently exported are forgotten; their stale
+    # file then just ages out of the byte LRU.
+    MAX_TRACKED_VERSIONS = 10000
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._files: OrderedDict[str, int] = OrderedDict()
+        # (resume_id, watermark) -> key of the version last served (LRU).
+        self._versions: OrderedDict[tuple[int, bool], str] = OrderedDict()
+        # key -> number of tracked resumes whose current version it is.
+        self._current: Counter[str] = Counter()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def load(self) -> None:
+        """Index files left by a previous run, least recently used first."""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(".pdf")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._files[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def key_for(self, resume_id: int, data: dict, template_id: str, watermark: bool) -> str:
+        """Cache key for a resume, dropping the file of its previous version.
+
+        The key is recomputed from the content on every call (microseconds
+        next to a render) rather than trusted from ``updated_at``, whose
+        one-second resolution on SQLite can miss quick successive edits.
+        """
+        template_id = pdf_service.resolve_template(template_id)
+        key = make_key(data, template_id, pdf_service.template_version(template_id), watermark)
+        previous = self._versions.pop((resume_id, watermark), None)
+        self._versions[(resume_id, watermark)] = key
+        self._current[key] += 1
+        if previous is not None:
+            self._untrack(previous)
+            # Identical content may still be current for another resume.
+            if previous != key and previous not in self._current:
+                self._remove(previous, "invalidated")
+        while len(self._versions) > self.MAX_TRACKED_VERSIONS:
+            _, forgotten = self._versions.popitem(last=False)
+            self._untrack(forgotten)
+        return key
+
+    def _untrack(self, key: str) -> None:
+        self._current[key] -= 1
+        if self._current[key] <= 0:
+            del self._current[key]
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached PDF, or None."""
+        if key not in self._files:
+            return None
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # persist recency for the next load()
+        except FileNotFoundError:
+            # Removed by another worker sharing the directory.
+            self.total_bytes -= self._files.pop(key)
+            return None
+        self._files.move_to_end(key)
+        return path
+
+    def _write(self, key: str, pdf: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(pdf)
+        path = self.path_for(key)
+        os.replace(tmp, path)
+        return path
+
+    async def put(self, key: str, pdf: bytes) -> str:
+        """Write the PDF atomically (off the event loop) and return its path."""
+        path = await asyncio.to_thread(self._write, key, pdf)
+        if key in self._files:
+            self.total_bytes -= self._files.pop(key)
+        self._files[key] = len(pdf)
+        self.total_bytes += len(pdf)
+        self._evict(keep=key)
+        return path
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        for key in list(self._files):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key != keep:
+                self._remove(key, "size")
+        pdf_cache_bytes.labels(tool=TOOL_NAME).set(self.total_bytes)
+
+    def _remove(self, key: str, reason: str) -> None:
+        size = self._files.pop(key, None)
+        if size is None:
+            return
+        self.total_bytes -= size
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+        pdf_cache_evictions.labels(tool=TOOL_NAME, reason=reason).inc()
+        pdf_cache_bytes.labels(tool=TOOL_NAME).set(self.total_bytes)
+
+
+class PDFFileResponse(FileResponse):
+    """FileResponse that hands the file to the server for zero-copy sending.
+
+    Uses the ASGI ``http.response.zerocopysend`` (sendfile) or
+    ``http.response.pathsend`` extension when the server advertises one,
+    and falls back to Starlette's chunked reads otherwise. A response built
+    with `open` sends from the handle it already holds, so the file can be
+    evicted in the meantime.
+    """
+
+    file = None
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "PDFFileResponse":
+        """Open the file now; raises FileNotFoundError if it is already gone."""
+        file = open(path, "rb")
+        try:
+            response = cls(path, stat_result=os.fstat(file.fileno()), **kwargs)
+        except BaseException:
+            file.close()
+            raise
+        response.file = file
+        return response
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        zerocopy = "http.response.zerocopysend" in extensions
+        pathsend = "http.response.pathsend" in extensions
+        if self.file is not None:
+            with self.file:
+                await self._send_file(scope, send, zerocopy)
+        elif scope["method"].upper() == "HEAD" or not (zerocopy or pathsend):
+            await super().__call__(scope, receive, send)
+            return
+        elif zerocopy:
+            # Open before the headers go out; eviction can't pull it from under us.
+            with open(os.path.abspath(self.path), "rb") as file:
+                self.set_stat_headers(os.fstat(file.fileno()))
+                await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+                await send({"type": "http.response.zerocopysend", "file": file})
+        else:
+            path = os.path.abspath(self.path)
+            if self.stat_result is None:
+                self.set_stat_headers(os.stat(path))
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.pathsend", "path": path})
+        if self.background is not None:
+            await self.background()
+
+    async def _send_file(self, scope: Scope, send: Send, zerocopy: bool) -> None:
+        # pathsend would reopen by name, which may be evicted by now.
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif zerocopy:
+            await send({"type": "http.response.zerocopysend", "file": self.file})
+        else:
+            more_body = True
+            while more_body:
+                chunk = await asyncio.to_thread(self.file.read, self.chunk_size)
+                more_body = len(chunk) == self.chunk_size
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+_cache: Optional[PDFCache] = None
+
+
+def get_cache() -> Optional[PDFCache]:
+    """The process-wide cache, or None when PDF_CACHE_ENABLED is off."""
+    global _cache
+    if not settings.PDF_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = PDFCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_BYTES)
+        _cache.load()
+    return _cache
+
+
+async def init_cache() -> None:
+    """Index the cache directory (called on startup)."""
+    if settings.PDF_CACHE_ENABLED:
+        await asyncio.to_thread(get_cache)
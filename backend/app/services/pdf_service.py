@@ -0,0 +1,182 @@
+"""
+Server-side PDF export.
+
+Resume JSON is rendered through a Jinja2 template into HTML and then by
+WeasyPrint into a PDF. Both steps are CPU-bound, so they run in a process
+pool (one worker per core by default) and the event loop only awaits the
+result. Each worker builds its own template registry (compiled templates,
+parsed CSS, fonts) once, when it starts. Jobs beyond
+``PDF_RENDER_MAX_QUEUE`` are rejected rather than left to pile up, and a
+job exceeding ``PDF_RENDER_TIMEOUT_SECONDS`` has its worker pool torn
+down so it cannot occupy a core indefinitely.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.core.config import get_settings
+from app.metrics import TOOL_NAME, pdf_render_duration, pdf_render_failures, pdf_render_queue_depth
+from app.services.pdf_templates import TemplateRegistry, resolve_template
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class RenderError(Exception):
+    """PDF rendering failed."""
+
+
+class RenderTimeout(RenderError):
+    """A render job exceeded PDF_RENDER_TIMEOUT_SECONDS."""
+
+
+class RenderQueueFull(RenderError):
+    """Too many render jobs are already waiting."""
+
+
+_templates: Optional[TemplateRegistry] = None
+# Set in each render worker by _init_worker.
+_worker_templates: Optional[TemplateRegistry] = None
+
+
+def get_templates() -> TemplateRegistry:
+    """The compiled Jinja templates and versions, built once per process."""
+    global _templates
+    if _templates is None:
+        _templates = TemplateRegistry(auto_reload=settings.DEBUG).load()
+    return _templates
+
+
+def template_version(template_id: str) -> str:
+    return get_templates().get(template_id).version
+
+
+def render_html(template_id: str, data: dict, watermark: bool, title: str = "", language: str = "en") -> str:
+    """Render resume JSON to HTML with the given template."""
+    return get_templates().render_html(template_id, data, watermark, title, language)
+
+
+def _init_worker(warm_up: bool) -> None:
+    """Pool initializer: compile templates, parse CSS and load fonts once per worker."""
+    global _worker_templates
+    _worker_templates = TemplateRegistry(with_css=True, auto_reload=settings.DEBUG).load()
+    if warm_up:
+        _worker_templates.warm_up()
+
+
+def _render_job(template_id: str, data: dict, watermark: bool, title: str) -> bytes:
+    """Runs in a pool worker: HTML via Jinja2, then PDF via WeasyPrint."""
+    if _worker_templates is None:
+        _init_worker(warm_up=False)
+    return _worker_templates.render_pdf(template_id, data, watermark, title)
+
+
+def _ping() -> bool:
+    return True
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_queued = 0
+
+
+def _worker_count() -> int:
+    return settings.PDF_RENDER_WORKERS or os.cpu_count() or 1
+
+
+def _build_pool() -> ProcessPoolExecutor:
+    # Spawn rather than fork: the parent runs an event loop and DB threads.
+    return ProcessPoolExecutor(
+        max_workers=_worker_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(settings.PDF_TEMPLATE_WARMUP,),
+    )
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the render pool, creating it lazily outside of lifespan."""
+    global _pool
+    if _pool is None:
+        _pool = _build_pool()
+    return _pool
+
+
+async def init_pool() -> ProcessPoolExecutor:
+    """Load templates and create the render pool (called on startup).
+    
+    With PDF_TEMPLATE_WARMUP, every worker is started now so its template
+    registry and warm-up renders are ready before the first export.
+    """
+    get_templates()
+    pool = get_pool()
+    if settings.PDF_TEMPLATE_WARMUP:
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(pool, _ping) for _ in range(_worker_count())))
+        except Exception:
+            logger.exception("PDF render workers failed to start")
+    return pool
+
+
+async def close_pool() -> None:
+    """Shut down the render pool (called on shutdown)."""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+
+def _kill_pool(pool: ProcessPoolExecutor) -> None:
+    """Terminate a pool whose worker is stuck; the next job gets a fresh one."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def render_pdf(template_id: str, data: dict, watermark: bool = False, title: str = "") -> bytes:
+    """Render a resume to PDF bytes in the process pool."""
+    global _queued
+    if _queued >= settings.PDF_RENDER_MAX_QUEUE:
+        pdf_render_failures.labels(tool=TOOL_NAME, reason="overloaded").inc()
+        raise RenderQueueFull("PDF render queue is full")
+
+    loop = asyncio.get_running_loop()
+    template_id = resolve_template(template_id)
+    _queued += 1
+    pdf_render_queue_depth.labels(tool=TOOL_NAME).set(_queued)
+    start = time.perf_counter()
+    try:
+        for attempt in range(2):
+            pool = get_pool()
+            future = loop.run_in_executor(pool, _render_job, template_id, data, watermark, title)
+            try:
+                pdf = await asyncio.wait_for(future, settings.PDF_RENDER_TIMEOUT_SECONDS)
+                break
+            except BrokenProcessPool:
+                # Another job's timeout killed the pool under us; retry once.
+                if attempt:
+                    pdf_render_failures.labels(tool=TOOL_NAME, reason="error").inc()
+                    raise RenderError("PDF render pool crashed")
+                if _pool is pool:
+                    _kill_pool(pool)
+            except asyncio.TimeoutError:
+                _kill_pool(pool)
+                pdf_render_failures.labels(tool=TOOL_NAME, reason="timeout").inc()
+                raise RenderTimeout(f"PDF render exceeded {settings.PDF_RENDER_TIMEOUT_SECONDS}s")
+            except Exception as e:
+                pdf_render_failures.labels(tool=TOOL_NAME, reason="error").inc()
+                raise RenderError(f"PDF render failed: {e}") from e
+    finally:
+        _queued -= 1
+        pdf_render_queue_depth.labels(tool=TOOL_NAME).set(_queued)
+
+    pdf_render_duration.labels(tool=TOOL_NAME, template=template_id).observe(time.perf_counter() - start)
+    return pdf
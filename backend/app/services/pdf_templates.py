@@ -0,0 +1,141 @@
+"""
+Registry of resume templates for PDF export.
+
+Each template is compiled once: its Jinja2 template, its version (a hash
+of the files it renders with) and, in render workers, its stylesheets
+pre-parsed into WeasyPrint ``CSS`` objects sharing one
+``FontConfiguration``. With ``auto_reload`` (DEBUG), a template whose
+files changed on disk is rebuilt the next time it is requested.
+"""
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "resume")
+TEMPLATES = ("modern", "creative", "professional", "minimalist")
+DEFAULT_TEMPLATE = "modern"
+
+# Used to warm up layout, font and CSS caches in each render worker.
+SAMPLE_RESUME = {
+    "personalInfo": {
+        "name": "Alex Example",
+        "title": "Software Engineer",
+        "email": "alex@example.com",
+        "summary": "Engineer with a track record of shipping reliable products.",
+    },
+    "experience": [
+        {"title": "Engineer", "company": "Acme", "startDate": "2020", "endDate": "2024",
+         "description": "• Built things\n• Measured impact"},
+    ],
+    "education": [{"degree": "BSc", "field": "Computer Science", "school": "State University"}],
+    "skills": ["Python", "SQL", "Communication"],
+}
+
+
+def resolve_template(template_id: Optional[str]) -> str:
+    return template_id if template_id in TEMPLATES else DEFAULT_TEMPLATE
+
+
+def _files(template_id: str) -> tuple[str, ...]:
+    return ("base.html", f"{template_id}.html", "base.css", f"{template_id}.css")
+
+
+@dataclass
+class CompiledTemplate:
+    template: Template
+    version: str
+    mtime: float
+    stylesheets: list[Any] = field(default_factory=list)  # weasyprint.CSS
+
+
+class TemplateRegistry:
+    """Compiled templates keyed by template id."""
+
+    def __init__(self, directory: str = TEMPLATE_DIR, with_css: bool = False, auto_reload: bool = False):
+        self.directory = directory
+        self.with_css = with_css
+        self.auto_reload = auto_reload
+        self.font_config = None
+        self.env = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(["html"]),
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=auto_reload,
+        )
+        self._templates: dict[str, CompiledTemplate] = {}
+        self._css_cache: dict[tuple[str, float], Any] = {}
+
+    def load(self) -> "TemplateRegistry":
+        """Compile every template up front."""
+        if self.with_css and self.font_config is None:
+            from weasyprint.text.fonts import FontConfiguration
+
+            self.font_config = FontConfiguration()
+        for template_id in TEMPLATES:
+            self._templates[template_id] = self._compile(template_id)
+        return self
+
+    def _mtime(self, template_id: str) -> float:
+        return max(os.path.getmtime(os.path.join(self.directory, name)) for name in _files(template_id))
+
+    def _stylesheet(self, name: str, mtime: float):
+        # base.css is shared, so parse it once for all templates.
+        key = (name, mtime)
+        if key not in self._css_cache:
+            from weasyprint import CSS
+
+            self._css_cache[key] = CSS(filename=os.path.join(self.directory, name), font_config=self.font_config)
+        return self._css_cache[key]
+
+    def _compile(self, template_id: str) -> CompiledTemplate:
+        digest = hashlib.sha256()
+        for name in _files(template_id):
+            with open(os.path.join(self.directory, name), "rb") as file:
+                digest.update(file.read())
+        compiled = CompiledTemplate(
+            template=self.env.get_template(f"{template_id}.html"),
+            version=digest.hexdigest()[:16],
+            mtime=self._mtime(template_id),
+        )
+        if self.with_css:
+            compiled.stylesheets = [
+                self._stylesheet(name, os.path.getmtime(os.path.join(self.directory, name)))
+                for name in ("base.css", f"{template_id}.css")
+            ]
+        return compiled
+
+    def get(self, template_id: Optional[str]) -> CompiledTemplate:
+        template_id = resolve_template(template_id)
+        compiled = self._templates.get(template_id)
+        if compiled is None or (self.auto_reload and self._mtime(template_id) != compiled.mtime):
+            compiled = self._templates[template_id] = self._compile(template_id)
+        return compiled
+
+    def render_html(self, template_id: str, data: dict, watermark: bool, title: str = "", language: str = "en") -> str:
+        template_id = resolve_template(template_id)
+        return self.get(template_id).template.render(
+            resume=data or {},
+            template_id=template_id,
+            watermark=watermark,
+            title=title,
+            language=language,
+        )
+
+    def render_pdf(self, template_id: str, data: dict, watermark: bool, title: str = "") -> bytes:
+        """Render to PDF with the pre-parsed stylesheets (render workers only)."""
+        from weasyprint import HTML
+
+        compiled = self.get(template_id)
+        html = self.render_html(template_id, data, watermark, title)
+        return HTML(string=html, base_url=self.directory).write_pdf(
+            stylesheets=compiled.stylesheets, font_config=self.font_config
+        )
+
+    def warm_up(self) -> None:
+        """Render every template once so the first real export is not cold."""
+        for template_id in TEMPLATES:
+            self.render_pdf(template_id, SAMPLE_RESUME, watermark=True)
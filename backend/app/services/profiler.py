@@ -0,0 +1,270 @@
+"""
+In-process diagnostics for the admin profiling endpoints.
+
+* ``sample_cpu`` samples every thread's stack from a background thread
+  and returns the counts as collapsed stacks (``frame;frame;frame count``),
+  the input format of flamegraph.pl and speedscope.
+* ``LoopMonitor`` schedules a heartbeat on the event loop and records how
+  late it runs as ``event_loop_lag_seconds``. A watchdog thread notices
+  when the loop has been stuck longer than ``SLOW_CALLBACK_SECONDS`` and
+  logs the task that was running together with its current stack, while
+  it is still blocking.
+* ``HeapProfiler`` keeps the last few tracemalloc snapshots and diffs
+  them by allocation site.
+"""
+import asyncio
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+from app.core.config import get_settings
+from app.metrics import TOOL_NAME, event_loop_lag, event_loop_stalls
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ProfilerBusy(Exception):
+    """Another CPU profile is already running."""
+
+
+# CPU sampling
+
+_cpu_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def _short_path(path: str) -> str:
+    for root in sys.path:
+        if root and path.startswith(root + os.sep):
+            return os.path.relpath(path, root)
+    return path
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, thread_name: str) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+def sample_cpu(seconds: float, hz: int) -> Counter:
+    """Sample all other threads' stacks `hz` times a second for `seconds`.
+
+    Blocks the calling thread; run it with ``asyncio.to_thread``.
+    """
+    if not _cpu_lock.acquire(blocking=False):
+        raise ProfilerBusy("A CPU profile is already running")
+    try:
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stacks[_collapse(frame, names.get(ident, str(ident)))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _cpu_lock.release()
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# Event loop lag and stalls
+
+@dataclass
+class Stall:
+    detected_at: datetime
+    blocked_seconds: float
+    task: str
+    stack: str
+
+
+class LoopMonitor:
+    """Heartbeat on the event loop plus a watchdog thread for stalls."""
+
+    def __init__(self, interval: float, stall_threshold: float, keep: int = 20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.stalls: deque[Stall] = deque(maxlen=keep)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self._expected = 0.0
+        self._last_beat = 0.0
+        self._reported_beat = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._schedule()
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def _schedule(self) -> None:
+        self._expected = time.monotonic() + self.interval
+        self._handle = self._loop.call_later(self.interval, self._beat)
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        event_loop_lag.labels(tool=TOOL_NAME).observe(max(now - self._expected, 0))
+        self._last_beat = now
+        self._schedule()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(min(self.interval, self.stall_threshold) / 2):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked >= self.stall_threshold and beat != self._reported_beat:
+                self._reported_beat = beat
+                self._report(blocked)
+
+    def _report(self, blocked: float) -> None:
+        task = asyncio.current_task(self._loop)
+        frame = sys._current_frames().get(self._loop_thread)
+        stall = Stall(
+            detected_at=datetime.utcnow(),
+            blocked_seconds=round(blocked, 3),
+            task=repr(task) if task is not None else "(callback outside a task)",
+            stack="".join(traceback.format_stack(frame)) if frame is not None else "",
+        )
+        self.stalls.append(stall)
+        event_loop_stalls.labels(tool=TOOL_NAME).inc()
+        logger.warning(
+            "Event loop blocked for %.3fs+ by %s\n%s", stall.blocked_seconds, stall.task, stall.stack
+        )
+
+
+_monitor: Optional[LoopMonitor] = None
+
+
+def get_monitor() -> Optional[LoopMonitor]:
+    return _monitor
+
+
+async def start_monitor() -> Optional[LoopMonitor]:
+    """Start watching the running loop (called on startup)."""
+    global _monitor
+    if settings.LOOP_MONITOR_ENABLED and _monitor is None:
+        _monitor = LoopMonitor(settings.LOOP_MONITOR_INTERVAL_SECONDS, settings.SLOW_CALLBACK_SECONDS)
+        _monitor.start()
+    return _monitor
+
+
+async def stop_monitor() -> None:
+    """Stop the loop monitor (called on shutdown)."""
+    global _monitor
+    if _monitor is not None:
+        _monitor.stop()
+        _monitor = None
+
+
+# Heap snapshots
+
+_HEAP_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _site(stat) -> str:
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class HeapProfiler:
+    """tracemalloc snapshots numbered from 1, keeping the last `keep`."""
+
+    def __init__(self, keep: int, frames: int):
+        self.keep = keep
+        self.frames = frames
+        self.snapshots: dict[int, tracemalloc.Snapshot] = {}
+        self._next_id = 1
+
+    def snapshot(self, top: int) -> dict:
+        """Take a snapshot, starting tracemalloc first if needed."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces(_HEAP_FILTERS)
+        snapshot_id = self._next_id
+        self._next_id += 1
+        self.snapshots[snapshot_id] = snapshot
+        while len(self.snapshots) > self.keep:
+            del self.snapshots[min(self.snapshots)]
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "id": snapshot_id,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {"site": _site(stat), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:top]
+            ],
+        }
+
+    def diff(self, base: int, target: int, top: int) -> Optional[list[dict]]:
+        """Largest changes between two kept snapshots, or None if one is gone."""
+        if base not in self.snapshots or target not in self.snapshots:
+            return None
+        stats = self.snapshots[target].compare_to(self.snapshots[base], "lineno")
+        return [
+            {
+                "site": _site(stat),
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:top]
+        ]
+
+    def stop(self) -> None:
+        self.snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+_heap: Optional[HeapProfiler] = None
+
+
+def get_heap_profiler() -> HeapProfiler:
+    global _heap
+    if _heap is None:
+        _heap = HeapProfiler(settings.HEAP_SNAPSHOTS_KEPT, settings.HEAP_TRACEBACK_FRAMES)
+    return _heap
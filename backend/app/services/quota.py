@@ -0,0 +1,602 @@
+"""
+Pluggable storage for generation quotas.
+
+Every backend exposes the same coroutines: ``reserve``, ``confirm``,
+``release``, ``expire``, ``get_balance``, ``get_daily_usage``,
+``increment_daily_usage``, ``add_tokens`` and ``close``. The backend is
+picked with ``QUOTA_BACKEND``:
+
+- ``sql``: balances and daily usage live in the ``generation_tokens`` and
+  ``daily_usage`` tables (optionally fronted by the usage cache).
+- ``redis``: hot counters live in Redis, so any number of workers share
+  them with single-command atomic updates. Balances are seeded from the
+  database the first time a device is seen; Redis must therefore run with
+  persistence (AOF) and ``maxmemory-policy noeviction``. Purchases are
+  committed to the database first and then carried over to Redis, so a
+  grant is never lost if Redis fails in between.
+"""
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import WatchError
+from sqlalchemy import DateTime, exists, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.database import insert_for
+from app.core.redis import create_client
+from app.models.resume import DailyUsage
+from app.models.token import GenerationToken
+from app.services import usage_cache
+
+settings = get_settings()
+
+
+@dataclass
+class Reservation:
+    """Generations debited up front for an in-progress request.
+
+    A reservation is held until it is confirmed (the generation succeeded)
+    or released (refunded). Held units that are not settled within
+    RESERVATION_TTL_SECONDS, e.g. because the worker crashed, are refunded
+    by `expire`; confirming or releasing them afterwards does nothing.
+    """
+    device_id: str
+    date: str
+    paid: int = 0
+    free: int = 0
+    tokens_remaining: int = 0
+    confirmed: bool = False
+    key: Optional[str] = None  # backend handle for the held units
+    # SQL backend: the rows' reserved_epoch when the units were taken
+    paid_epoch: int = 0
+    free_epoch: int = 0
+
+    @property
+    def source(self) -> str:
+        if self.paid and self.free:
+            return "mixed"
+        return "paid" if self.paid else "free"
+
+
+def _reservation_deadline() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.RESERVATION_TTL_SECONDS)
+
+
+async def _grant(db: AsyncSession, device_id: str, amount: int) -> int:
+    """Add purchased tokens to the stored balance in one UPDATE; returns the new balance.
+
+    Not committed, so the grant lands in the caller's transaction.
+    """
+    result = await db.execute(
+        update(GenerationToken)
+        .where(GenerationToken.device_id == device_id)
+        .values(
+            tokens_remaining=GenerationToken.tokens_remaining + amount,
+            total_purchased=GenerationToken.total_purchased + amount,
+        )
+        .returning(GenerationToken.tokens_remaining)
+    )
+    return result.scalar_one()
+
+
+class SQLQuotaBackend:
+    """Quotas stored in the application database.
+
+    A generation costs one statement to reserve and one to confirm. Paid
+    units are taken with a single conditional UPDATE, free units with an
+    UPSERT that only applies while the device has no paid tokens, so the
+    order in which they are tried never changes the outcome, only the cost.
+    Devices seen holding paid tokens are remembered per process and tried
+    paid-first; everyone else free-first, falling back to paid when the
+    UPSERT is refused.
+
+    Held units are counted in each row's ``reserved``. When the sweeper
+    refunds a row it also bumps ``reserved_epoch``; every reservation
+    records the epoch it was taken in, and confirm/release only touch the
+    row while that epoch is current. A reservation that outlived its TTL
+    therefore can't settle units belonging to a newer one.
+    """
+
+    name = "sql"
+    MAX_PAID_HINTS = 10000
+
+    def __init__(self):
+        # Devices last seen with paid tokens left (bounded LRU).
+        self._paid_hint: OrderedDict[str, None] = OrderedDict()
+
+    def _hint_paid(self, device_id: str, has_tokens: bool) -> None:
+        if not has_tokens:
+            self._paid_hint.pop(device_id, None)
+            return
+        self._paid_hint[device_id] = None
+        self._paid_hint.move_to_end(device_id)
+        if len(self._paid_hint) > self.MAX_PAID_HINTS:
+            self._paid_hint.popitem(last=False)
+
+    async def _take_paid(self, db: AsyncSession, device_id: str, count: int, deadline: datetime, available=None):
+        """Debit `count` tokens if the balance (or exactly `available`) allows.
+
+        Returns the new balance and the row's reserved_epoch, or None.
+        """
+        condition = (
+            GenerationToken.tokens_remaining >= count if available is None
+            else GenerationToken.tokens_remaining == available
+        )
+        result = await db.execute(
+            update(GenerationToken)
+            .where(GenerationToken.device_id == device_id, condition)
+            .values(
+                tokens_remaining=GenerationToken.tokens_remaining - count,
+                reserved=GenerationToken.reserved + count,
+                reserved_until=deadline,
+            )
+            .returning(GenerationToken.tokens_remaining, GenerationToken.reserved_epoch)
+        )
+        return result.one_or_none()
+
+    async def _reserve_paid(
+        self, db: AsyncSession, reservation: Reservation, count: int, deadline: datetime
+    ) -> None:
+        """Take up to `count` paid tokens into `reservation`.
+
+        One UPDATE when the balance covers `count`; when it doesn't, the
+        remainder is read and taken with a compare-and-set.
+        """
+        device_id = reservation.device_id
+        taken_row = await self._take_paid(db, device_id, count, deadline)
+        taken = count
+        while taken_row is None and count > 1:
+            available = await db.scalar(
+                select(GenerationToken.tokens_remaining).where(GenerationToken.device_id == device_id)
+            )
+            if not available or available <= 0:
+                break
+            taken_row = await self._take_paid(db, device_id, available, deadline, available=available)
+            taken = available
+        if taken_row is not None:
+            reservation.paid += taken
+            reservation.tokens_remaining, reservation.paid_epoch = taken_row
+        self._hint_paid(device_id, taken_row is not None and taken_row[0] > 0)
+
+    async def _reserve_free(
+        self, db: AsyncSession, reservation: Reservation, deadline: datetime, count: int
+    ) -> bool:
+        """Take `count` free generations for today if that stays within the daily limit.
+
+        Without the usage cache the UPSERT is also refused while the device
+        still has paid tokens, which are always spent first.
+        """
+        device_id, today = reservation.device_id, reservation.date
+        limit = settings.FREE_DAILY_GENERATIONS
+        if count > limit:
+            return False
+        cache = usage_cache.get_cache()
+        if cache is not None:
+            return await cache.add(db, device_id, count, limit=limit)
+        no_paid_tokens = ~exists().where(
+            GenerationToken.device_id == device_id, GenerationToken.tokens_remaining > 0
+        )
+        insert = insert_for(db)
+        stmt = insert(DailyUsage).from_select(
+            ["device_id", "date", "generations_used", "reserved", "reserved_until"],
+            select(
+                literal(device_id), literal(today), literal(count), literal(count), literal(deadline, DateTime)
+            ).where(no_paid_tokens),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyUsage.device_id, DailyUsage.date],
+            set_={
+                "generations_used": DailyUsage.generations_used + count,
+                "reserved": DailyUsage.reserved + count,
+                "reserved_until": deadline,
+            },
+            where=(DailyUsage.generations_used + count <= limit) & no_paid_tokens,
+        ).returning(DailyUsage.reserved_epoch)
+        epoch = (await db.execute(stmt)).scalar_one_or_none()
+        if epoch is None:
+            return False
+        reservation.free_epoch = epoch
+        return True
+
+    async def reserve(self, db: AsyncSession, device_id: str, count: int) -> Optional[Reservation]:
+        today = date.today().isoformat()
+        deadline = _reservation_deadline()
+        reservation = Reservation(device_id=device_id, date=today)
+
+        # The usage cache can't see paid balances, so it always goes paid-first.
+        paid_first = usage_cache.get_cache() is not None or device_id in self._paid_hint
+        if paid_first:
+            await self._reserve_paid(db, reservation, count, deadline)
+
+        free = count - reservation.paid
+        if free:
+            reserved = await self._reserve_free(db, reservation, deadline, free)
+            if not reserved and not paid_first:
+                # Refused: paid tokens left, or no free generations.
+                await self._reserve_paid(db, reservation, count, deadline)
+                free = count - reservation.paid
+                reserved = not free or await self._reserve_free(db, reservation, deadline, free)
+            if not reserved:
+                await db.rollback()
+                return None
+            reservation.free = free
+
+        await db.commit()
+        return reservation
+
+    async def confirm(self, db: AsyncSession, reservation: Reservation) -> None:
+        cache = usage_cache.get_cache()
+        if reservation.paid:
+            await db.execute(
+                update(GenerationToken)
+                .where(
+                    GenerationToken.device_id == reservation.device_id,
+                    GenerationToken.reserved_epoch == reservation.paid_epoch,
+                    GenerationToken.reserved >= reservation.paid,
+                )
+                .values(reserved=GenerationToken.reserved - reservation.paid)
+            )
+        if reservation.free and cache is None:
+            await db.execute(
+                update(DailyUsage)
+                .where(
+                    DailyUsage.device_id == reservation.device_id,
+                    DailyUsage.date == reservation.date,
+                    DailyUsage.reserved_epoch == reservation.free_epoch,
+                    DailyUsage.reserved >= reservation.free,
+                )
+                .values(reserved=DailyUsage.reserved - reservation.free)
+            )
+        if reservation.paid or (reservation.free and cache is None):
+            await db.commit()
+
+    async def release(self, db: AsyncSession, reservation: Reservation, paid: int, free: int) -> None:
+        cache = usage_cache.get_cache()
+        if paid:
+            await db.execute(
+                update(GenerationToken)
+                .where(
+                    GenerationToken.device_id == reservation.device_id,
+                    GenerationToken.reserved_epoch == reservation.paid_epoch,
+                    GenerationToken.reserved >= paid,
+                )
+                .values(
+                    tokens_remaining=GenerationToken.tokens_remaining + paid,
+                    reserved=GenerationToken.reserved - paid,
+                )
+            )
+        if free and cache is not None:
+            cache.subtract(reservation.device_id, reservation.date, free)
+        elif free:
+            await db.execute(
+                update(DailyUsage)
+                .where(
+                    DailyUsage.device_id == reservation.device_id,
+                    DailyUsage.date == reservation.date,
+                    DailyUsage.reserved_epoch == reservation.free_epoch,
+                    DailyUsage.reserved >= free,
+                )
+                .values(
+                    generations_used=DailyUsage.generations_used - free,
+                    reserved=DailyUsage.reserved - free,
+                )
+            )
+        if paid or (free and cache is None):
+            await db.commit()
+
+    async def expire(self, db: AsyncSession) -> int:
+        # The deadline is pushed forward by every new reservation on the
+        # same row, so once it passes, every unit still held there is stale.
+        # Bumping the epoch voids those reservations for confirm/release.
+        now = datetime.utcnow()
+        paid = await db.execute(
+            update(GenerationToken)
+            .where(GenerationToken.reserved > 0, GenerationToken.reserved_until < now)
+            .values(
+                tokens_remaining=GenerationToken.tokens_remaining + GenerationToken.reserved,
+                reserved=0,
+                reserved_epoch=GenerationToken.reserved_epoch + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        free = await db.execute(
+            update(DailyUsage)
+            .where(DailyUsage.reserved > 0, DailyUsage.reserved_until < now)
+            .values(
+                generations_used=DailyUsage.generations_used - DailyUsage.reserved,
+                reserved=0,
+                reserved_epoch=DailyUsage.reserved_epoch + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return paid.rowcount + free.rowcount
+
+    async def get_balance(self, db: AsyncSession, device_id: str) -> int:
+        result = await db.execute(
+            select(GenerationToken.tokens_remaining).where(GenerationToken.device_id == device_id)
+        )
+        return result.scalar_one_or_none() or 0
+
+    async def get_daily_usage(self, db: AsyncSession, device_id: str) -> int:
+        cache = usage_cache.get_cache()
+        if cache is not None:
+            return await cache.get(db, device_id)
+        today = date.today().isoformat()
+        result = await db.execute(
+            select(DailyUsage.generations_used).where(
+                DailyUsage.device_id == device_id,
+                DailyUsage.date == today
+            )
+        )
+        return result.scalar_one_or_none() or 0
+
+    async def increment_daily_usage(self, db: AsyncSession, device_id: str) -> int:
+        cache = usage_cache.get_cache()
+        if cache is not None:
+            await cache.add(db, device_id, 1)
+            return await cache.get(db, device_id)
+        today = date.today().isoformat()
+        result = await db.execute(
+            select(DailyUsage).where(
+                DailyUsage.device_id == device_id,
+                DailyUsage.date == today
+            )
+        )
+        usage = result.scalar_one_or_none()
+
+        if usage:
+            usage.generations_used += 1
+        else:
+            usage = DailyUsage(device_id=device_id, date=today, generations_used=1)
+            db.add(usage)
+
+        await db.commit()
+        return usage.generations_used
+
+    async def add_tokens(self, db: AsyncSession, device_id: str, amount: int) -> int:
+        balance = await _grant(db, device_id, amount)
+        await db.commit()
+        self._hint_paid(device_id, balance > 0)
+        return balance
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisQuotaBackend:
+    """Quotas stored in Redis, shared by every worker process.
+
+    Each check-and-debit is a single DECRBY/INCRBY whose result decides the
+    outcome; an overdraw is undone with the inverse command. Held units are
+    members of one sorted set scored by their deadline, and whoever removes
+    a member (ZREM returning 1) owns its refund, so a confirm, a release and
+    the sweeper can race without double-refunding.
+
+    Next to each balance Redis keeps the device's ``total_purchased`` that
+    the balance already includes. Syncing a balance adds any purchases the
+    database has beyond that mark and moves the mark in one MULTI/EXEC, so
+    a grant is applied exactly once however often the sync is retried.
+    """
+
+    name = "redis"
+    RESERVATIONS = "quota:reservations"
+    USAGE_TTL_SECONDS = 2 * 24 * 3600
+    MAX_SEEDED = 10000
+
+    def __init__(self, client: Redis):
+        self.client = client
+        # Keys this process already seeded from the database (bounded LRU).
+        self._seeded: OrderedDict[str, None] = OrderedDict()
+
+    @staticmethod
+    def _balance_key(device_id: str) -> str:
+        return f"quota:tokens:{device_id}"
+
+    @staticmethod
+    def _purchased_key(device_id: str) -> str:
+        return f"quota:purchased:{device_id}"
+
+    @staticmethod
+    def _usage_key(device_id: str, day: str) -> str:
+        return f"quota:usage:{device_id}:{day}"
+
+    def _is_seeded(self, key: str) -> bool:
+        if key in self._seeded:
+            self._seeded.move_to_end(key)
+            return True
+        return False
+
+    def _remember(self, key: str) -> None:
+        self._seeded[key] = None
+        if len(self._seeded) > self.MAX_SEEDED:
+            self._seeded.popitem(last=False)
+
+    async def _seed(self, key: str, load) -> None:
+        """Copy the DB value into Redis unless the key already exists."""
+        if self._is_seeded(key):
+            return
+        if await self.client.get(key) is None:
+            value = await load()
+            ttl = self.USAGE_TTL_SECONDS if key.startswith("quota:usage:") else None
+            await self.client.set(key, value, nx=True, ex=ttl)
+        self._remember(key)
+
+    async def _seed_balance(self, db: AsyncSession, device_id: str) -> str:
+        """Seed the Redis balance from the DB, or add purchases it doesn't include yet."""
+        key = self._balance_key(device_id)
+        if self._is_seeded(key):
+            return key
+        row = (await db.execute(
+            select(GenerationToken.tokens_remaining, GenerationToken.total_purchased)
+            .where(GenerationToken.device_id == device_id)
+        )).one_or_none()
+        tokens, purchased = (row[0] or 0, row[1] or 0) if row else (0, 0)
+        purchased_key = self._purchased_key(device_id)
+        async with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(purchased_key)
+                    applied = await pipe.get(purchased_key)
+                    if applied is not None and int(applied) >= purchased:
+                        break
+                    pipe.multi()
+                    if applied is None:
+                        # tokens_remaining already includes every purchase up to `purchased`.
+                        pipe.set(key, tokens, nx=True)
+                    else:
+                        pipe.incrby(key, purchased - int(applied))
+                    pipe.set(purchased_key, purchased)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        self._remember(key)
+        return key
+
+    async def _seed_usage(self, db: AsyncSession, device_id: str, day: str) -> str:
+        key = self._usage_key(device_id, day)
+
+        async def load():
+            result = await db.execute(
+                select(DailyUsage.generations_used).where(
+                    DailyUsage.device_id == device_id, DailyUsage.date == day
+                )
+            )
+            return result.scalar_one_or_none() or 0
+
+        await self._seed(key, load)
+        return key
+
+    async def _refund(self, device_id: str, day: str, paid: int, free: int) -> None:
+        if paid:
+            await self.client.incrby(self._balance_key(device_id), paid)
+        if free:
+            await self.client.decrby(self._usage_key(device_id, day), free)
+
+    async def _hold(self, reservation: Reservation, deadline: float) -> None:
+        reservation.key = json.dumps({
+            "id": uuid.uuid4().hex,
+            "device_id": reservation.device_id,
+            "date": reservation.date,
+            "paid": reservation.paid,
+            "free": reservation.free,
+        })
+        await self.client.zadd(self.RESERVATIONS, {reservation.key: deadline})
+
+    async def reserve(self, db: AsyncSession, device_id: str, count: int) -> Optional[Reservation]:
+        today = date.today().isoformat()
+        reservation = Reservation(device_id=device_id, date=today)
+
+        balance_key = await self._seed_balance(db, device_id)
+        balance = await self.client.decrby(balance_key, count)
+        paid = max(0, min(count, balance + count))
+        if paid < count:
+            balance = await self.client.incrby(balance_key, count - paid)
+        reservation.paid = paid
+        reservation.tokens_remaining = balance
+
+        free = count - paid
+        if free:
+            limit = settings.FREE_DAILY_GENERATIONS
+            usage_key = await self._seed_usage(db, device_id, today)
+            used = await self.client.incrby(usage_key, free)
+            if used > limit:
+                await self._refund(device_id, today, paid, free)
+                return None
+            reservation.free = free
+
+        await self._hold(reservation, time.time() + settings.RESERVATION_TTL_SECONDS)
+        return reservation
+
+    async def confirm(self, db: AsyncSession, reservation: Reservation) -> None:
+        if reservation.key is not None:
+            await self.client.zrem(self.RESERVATIONS, reservation.key)
+            reservation.key = None
+
+    async def release(self, db: AsyncSession, reservation: Reservation, paid: int, free: int) -> None:
+        if reservation.key is None:
+            return
+        removed = await self.client.zrem(self.RESERVATIONS, reservation.key)
+        reservation.key = None
+        if not removed:
+            # Already expired and refunded by the sweeper.
+            return
+        await self._refund(reservation.device_id, reservation.date, paid, free)
+        held = (reservation.paid - paid) + (reservation.free - free)
+        if held:
+            remaining = Reservation(
+                device_id=reservation.device_id,
+                date=reservation.date,
+                paid=reservation.paid - paid,
+                free=reservation.free - free,
+            )
+            await self._hold(remaining, time.time() + settings.RESERVATION_TTL_SECONDS)
+            reservation.key = remaining.key
+
+    async def expire(self, db: AsyncSession) -> int:
+        members = await self.client.zrangebyscore(self.RESERVATIONS, "-inf", time.time())
+        expired = 0
+        for member in members:
+            if await self.client.zrem(self.RESERVATIONS, member):
+                held = json.loads(member)
+                await self._refund(held["device_id"], held["date"], held["paid"], held["free"])
+                expired += 1
+        return expired
+
+    async def get_balance(self, db: AsyncSession, device_id: str) -> int:
+        key = await self._seed_balance(db, device_id)
+        return int(await self.client.get(key) or 0)
+
+    async def get_daily_usage(self, db: AsyncSession, device_id: str) -> int:
+        key = await self._seed_usage(db, device_id, date.today().isoformat())
+        return int(await self.client.get(key) or 0)
+
+    async def increment_daily_usage(self, db: AsyncSession, device_id: str) -> int:
+        key = await self._seed_usage(db, device_id, date.today().isoformat())
+        return await self.client.incrby(key, 1)
+
+    async def add_tokens(self, db: AsyncSession, device_id: str, amount: int) -> int:
+        # The DB grant commits with the caller's transaction (e.g. the webhook
+        # inbox status). If carrying it over to Redis fails, the next sync of
+        # this device in any process that hasn't cached it picks it up.
+        await _grant(db, device_id, amount)
+        await db.commit()
+        self._seeded.pop(self._balance_key(device_id), None)
+        return await self.get_balance(db, device_id)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def _build_backend():
+    if settings.QUOTA_BACKEND == "sql":
+        return SQLQuotaBackend()
+    if settings.QUOTA_BACKEND == "redis":
+        return RedisQuotaBackend(create_client(settings.REDIS_URL, settings.REDIS_MAX_CONNECTIONS))
+    raise ValueError(f"Unknown QUOTA_BACKEND: {settings.QUOTA_BACKEND}")
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = _build_backend()
+    return _backend
+
+
+async def close_backend() -> None:
+    """Close the quota backend (called on shutdown)."""
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
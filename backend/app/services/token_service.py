@@ -1,69 +1,58 @@
-from datetime import datetime, date
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, delete, func
 from app.models.token import GenerationToken
-from app.models.resume import DailyUsage
+from app.models.resume import DailyUsage, DailyUsageArchive
+from app.core import tracing
 from app.core.config import get_settings
+from app.core.database import async_session, insert_for
+from app.metrics import reservations_expired
+from app.services import quota
+from app.services.quota import Reservation
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 
 async def get_or_create_token(db: AsyncSession, device_id: str) -> GenerationToken:
     """Get or create token record for device."""
-    result = await db.execute(
-        select(GenerationToken).where(GenerationToken.device_id == device_id)
-    )
-    token = result.scalar_one_or_none()
-    
-    if not token:
-        token = GenerationToken(device_id=device_id, tokens_remaining=0)
-        db.add(token)
-        await db.commit()
-        await db.refresh(token)
+    with tracing.span("token"):
+        result = await db.execute(
+            select(GenerationToken).where(GenerationToken.device_id == device_id)
+        )
+        token = result.scalar_one_or_none()
+        
+        if not token:
+            token = GenerationToken(device_id=device_id, tokens_remaining=0)
+            db.add(token)
+            await db.commit()
+            await db.refresh(token)
     
     return token
 
 
+async def get_balance(db: AsyncSession, device_id: str) -> int:
+    """Get the paid generations left for device."""
+    return await quota.get_backend().get_balance(db, device_id)
+
+
 async def get_daily_usage(db: AsyncSession, device_id: str) -> int:
     """Get today's usage count for device."""
-    today = date.today().isoformat()
-    result = await db.execute(
-        select(DailyUsage).where(
-            DailyUsage.device_id == device_id,
-            DailyUsage.date == today
-        )
-    )
-    usage = result.scalar_one_or_none()
-    return usage.generations_used if usage else 0
+    return await quota.get_backend().get_daily_usage(db, device_id)
 
 
 async def increment_daily_usage(db: AsyncSession, device_id: str) -> int:
     """Increment daily usage and return new count."""
-    today = date.today().isoformat()
-    result = await db.execute(
-        select(DailyUsage).where(
-            DailyUsage.device_id == device_id,
-            DailyUsage.date == today
-        )
-    )
-    usage = result.scalar_one_or_none()
-    
-    if usage:
-        usage.generations_used += 1
-    else:
-        usage = DailyUsage(device_id=device_id, date=today, generations_used=1)
-        db.add(usage)
-    
-    await db.commit()
-    return usage.generations_used
+    return await quota.get_backend().increment_daily_usage(db, device_id)
 
 
 async def can_generate(db: AsyncSession, device_id: str) -> tuple[bool, str]:
     """Check if device can generate content."""
-    token = await get_or_create_token(db, device_id)
-    
     # Check paid tokens first
-    if token.tokens_remaining > 0:
+    if await get_balance(db, device_id) > 0:
         return True, "paid"
     
     # Check daily free limit
@@ -76,27 +65,121 @@ async def can_generate(db: AsyncSession, device_id: str) -> tuple[bool, str]:
 
 async def use_generation(db: AsyncSession, device_id: str) -> bool:
     """Use one generation token. Returns True if successful."""
-    token = await get_or_create_token(db, device_id)
+    reservation = await reserve_generations(db, device_id)
+    if reservation is None:
+        return False
+    await confirm_generations(db, reservation)
+    return True
+
+
+async def reserve_generations(
+    db: AsyncSession, device_id: str, count: int = 1
+) -> Optional[Reservation]:
+    """Atomically check and debit `count` generations, paid tokens first.
     
-    # Use paid token if available
-    if token.tokens_remaining > 0:
-        token.tokens_remaining -= 1
-        await db.commit()
-        return True
+    Concurrent requests can never overspend, and all units are debited
+    together or none are. Returns None when the device does not have
+    enough generations left.
+    """
+    with tracing.span("reserve", count=count):
+        return await quota.get_backend().reserve(db, device_id, count)
+
+
+async def confirm_generations(db: AsyncSession, reservation: Reservation) -> None:
+    """Make the reserved generations permanent."""
+    with tracing.span("confirm"):
+        await quota.get_backend().confirm(db, reservation)
+    reservation.confirmed = True
+
+
+async def release_generations(
+    db: AsyncSession, reservation: Reservation, count: Optional[int] = None
+) -> None:
+    """Refund `count` (default: all) reserved generations, paid tokens first.
     
-    # Use free tier
-    daily_used = await get_daily_usage(db, device_id)
-    if daily_used < settings.FREE_DAILY_GENERATIONS:
-        await increment_daily_usage(db, device_id)
-        return True
+    Units that already expired (and were refunded by the sweeper) are not
+    refunded twice.
+    """
+    count = reservation.paid + reservation.free if count is None else count
+    paid = min(count, reservation.paid)
+    free = min(count - paid, reservation.free)
+    with tracing.span("release"):
+        await quota.get_backend().release(db, reservation, paid, free)
     
-    return False
+    reservation.paid -= paid
+    reservation.free -= free
+    reservation.tokens_remaining += paid
+
+
+async def expire_reservations(db: AsyncSession) -> int:
+    """Refund reservations whose deadline passed. Returns counters refunded."""
+    return await quota.get_backend().expire(db)
+
+
+async def run_reservation_sweeper():
+    """Periodically refund expired reservations (started in main.lifespan)."""
+    while True:
+        await asyncio.sleep(settings.RESERVATION_SWEEP_INTERVAL_SECONDS)
+        try:
+            async with async_session() as db:
+                expired = await expire_reservations(db)
+            if expired:
+                reservations_expired.labels(tool="resume-builder").inc(expired)
+        except Exception:
+            logger.exception("Reservation sweep failed")
+
+
+async def compact_daily_usage(db: AsyncSession, keep_days: int) -> int:
+    """Fold per-device rows older than `keep_days` into daily totals.
+    
+    Returns the number of daily_usage rows removed.
+    """
+    cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+    totals = (await db.execute(
+        select(
+            DailyUsage.date,
+            func.count(DailyUsage.id),
+            func.coalesce(func.sum(DailyUsage.generations_used), 0),
+        )
+        .where(DailyUsage.date < cutoff)
+        .group_by(DailyUsage.date)
+    )).all()
+    if not totals:
+        return 0
+    
+    insert = insert_for(db)
+    for day, devices, used in totals:
+        stmt = insert(DailyUsageArchive).values(date=day, devices=devices, generations_used=used)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[DailyUsageArchive.date],
+            set_={
+                "devices": DailyUsageArchive.devices + devices,
+                "generations_used": DailyUsageArchive.generations_used + used,
+            },
+        ))
+    result = await db.execute(
+        delete(DailyUsage)
+        .where(DailyUsage.date < cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def run_usage_compactor():
+    """Periodically compact old daily_usage rows (started in main.lifespan)."""
+    while True:
+        try:
+            async with async_session() as db:
+                removed = await compact_daily_usage(db, settings.DAILY_USAGE_RETENTION_DAYS)
+            if removed:
+                logger.info("Compacted %d daily_usage rows", removed)
+        except Exception:
+            logger.exception("Daily usage compaction failed")
+        await asyncio.sleep(settings.DAILY_USAGE_COMPACT_INTERVAL_SECONDS)
 
 
 async def add_tokens(db: AsyncSession, device_id: str, amount: int) -> int:
     """Add tokens to device account. Returns new balance."""
-    token = await get_or_create_token(db, device_id)
-    token.tokens_remaining += amount
-    token.total_purchased += amount
-    await db.commit()
-    return token.tokens_remaining
+    await get_or_create_token(db, device_id)
+    return await quota.get_backend().add_tokens(db, device_id, amount)
@@ -0,0 +1,163 @@
+"""
+Write-behind cache for today's DailyUsage counters.
+
+Free-tier checks are served from memory; increments accumulate as
+per-(date, device) deltas and are flushed to ``daily_usage`` in one
+transaction every ``DAILY_USAGE_FLUSH_INTERVAL_SECONDS``, or sooner once
+``DAILY_USAGE_FLUSH_MAX_PENDING`` increments are waiting. Those two
+settings bound how many increments a crash can lose.
+
+The counters are per process, so this is only exact for a single worker.
+"""
+import asyncio
+import logging
+from datetime import date
+from typing import Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.database import async_session, insert_for
+from app.metrics import TOOL_NAME, usage_cache_flushes, usage_cache_pending
+from app.models.resume import DailyUsage
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class DailyUsageCache:
+    """In-memory view of today's usage with batched write-behind."""
+
+    def __init__(self, session_factory: Callable[[], AsyncSession], max_pending: int):
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.day = date.today().isoformat()
+        self.counts: dict[str, int] = {}
+        self.pending: dict[tuple[str, str], int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._early_flush: Optional[asyncio.Task] = None
+
+    @property
+    def pending_total(self) -> int:
+        return sum(abs(delta) for delta in self.pending.values())
+
+    def _roll_over(self) -> None:
+        today = date.today().isoformat()
+        if today != self.day:
+            # Deltas keep their own date, so yesterday's still flush correctly.
+            self.day = today
+            self.counts.clear()
+
+    async def get(self, db: AsyncSession, device_id: str) -> int:
+        """Today's usage for a device, loading it from the DB on first access."""
+        self._roll_over()
+        if device_id not in self.counts:
+            # A flush moves deltas out of `pending` before its commit lands;
+            # loading under the flush lock keeps the DB row and `pending`
+            # from missing that delta in between.
+            async with self._flush_lock:
+                if device_id in self.counts:
+                    return self.counts[device_id]
+                day = self.day
+                result = await db.execute(
+                    select(DailyUsage.generations_used).where(
+                        DailyUsage.device_id == device_id,
+                        DailyUsage.date == day
+                    )
+                )
+                stored = (result.scalar_one_or_none() or 0) + self.pending.get((day, device_id), 0)
+                if day != self.day:
+                    return 0
+                # Another coroutine may have loaded (and incremented) it meanwhile.
+                self.counts.setdefault(device_id, stored)
+        return self.counts[device_id]
+
+    async def add(self, db: AsyncSession, device_id: str, amount: int, limit: Optional[int] = None) -> bool:
+        """Add `amount` to today's usage, unless it would exceed `limit`."""
+        used = await self.get(db, device_id)
+        if limit is not None and used + amount > limit:
+            return False
+        self.counts[device_id] = used + amount
+        key = (self.day, device_id)
+        self.pending[key] = self.pending.get(key, 0) + amount
+        usage_cache_pending.labels(tool=TOOL_NAME).set(self.pending_total)
+        if self.pending_total >= self.max_pending and (
+            self._early_flush is None or self._early_flush.done()
+        ):
+            self._early_flush = asyncio.create_task(self.flush_quietly())
+        return True
+
+    def subtract(self, device_id: str, day: str, amount: int) -> None:
+        """Undo `amount` of usage recorded on `day` (e.g. a released reservation)."""
+        if day == self.day and device_id in self.counts:
+            self.counts[device_id] = max(self.counts[device_id] - amount, 0)
+        key = (day, device_id)
+        self.pending[key] = self.pending.get(key, 0) - amount
+        usage_cache_pending.labels(tool=TOOL_NAME).set(self.pending_total)
+
+    async def flush(self) -> int:
+        """Write pending deltas to the DB in one transaction. Returns rows touched."""
+        async with self._flush_lock:
+            batch = {key: delta for key, delta in self.pending.items() if delta}
+            if not batch:
+                self.pending.clear()
+                return 0
+            for key, delta in batch.items():
+                self.pending[key] -= delta
+            try:
+                async with self.session_factory() as db:
+                    insert = insert_for(db)
+                    for (day, device_id), delta in batch.items():
+                        stmt = insert(DailyUsage).values(
+                            device_id=device_id, date=day, generations_used=max(delta, 0)
+                        ).on_conflict_do_update(
+                            index_elements=[DailyUsage.device_id, DailyUsage.date],
+                            set_={"generations_used": DailyUsage.generations_used + delta},
+                        )
+                        await db.execute(stmt)
+                    await db.commit()
+            except Exception:
+                # Put the deltas back so the next flush retries them.
+                for key, delta in batch.items():
+                    self.pending[key] = self.pending.get(key, 0) + delta
+                usage_cache_flushes.labels(tool=TOOL_NAME, status="error").inc()
+                raise
+            self.pending = {key: delta for key, delta in self.pending.items() if delta}
+            usage_cache_pending.labels(tool=TOOL_NAME).set(self.pending_total)
+            usage_cache_flushes.labels(tool=TOOL_NAME, status="ok").inc()
+            return len(batch)
+
+    async def flush_quietly(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Daily usage flush failed")
+
+
+_cache: Optional[DailyUsageCache] = None
+
+
+def get_cache() -> Optional[DailyUsageCache]:
+    """The process-wide cache, or None when DAILY_USAGE_CACHE_ENABLED is off."""
+    global _cache
+    if not settings.DAILY_USAGE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = DailyUsageCache(async_session, settings.DAILY_USAGE_FLUSH_MAX_PENDING)
+    return _cache
+
+
+async def run_flusher():
+    """Flush pending increments on an interval (started in main.lifespan)."""
+    while True:
+        await asyncio.sleep(settings.DAILY_USAGE_FLUSH_INTERVAL_SECONDS)
+        cache = get_cache()
+        if cache is not None:
+            await cache.flush_quietly()
+
+
+async def shutdown() -> None:
+    """Flush whatever is still pending (called on shutdown)."""
+    if _cache is not None:
+        await _cache.flush()
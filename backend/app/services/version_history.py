@@ -0,0 +1,185 @@
+"""
+Version history for resume documents.
+
+Each saved version is stored as a JSON Patch from the version before it,
+with a full snapshot every ``RESUME_HISTORY_SNAPSHOT_EVERY`` (K) versions,
+and whenever the chain is broken (the first save, a document saved before
+history existed, or versions pruned underneath it). Reconstructing a
+version reads the nearest snapshot at or before it plus at most K-1
+deltas, however long the history is.
+
+The compactor prunes versions beyond the newest
+``RESUME_HISTORY_MAX_VERSIONS`` or older than
+``RESUME_HISTORY_RETENTION_DAYS``, rewriting the oldest version it keeps
+as a snapshot first.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.database import async_session
+from app.core.jsonpatch import apply_patch, make_patch
+from app.models.resume import ResumeVersion
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+async def record_version(
+    db: AsyncSession,
+    resume_id: int,
+    version: int,
+    document: dict[str, Any],
+    previous_version: Optional[int] = None,
+    previous: Optional[dict[str, Any]] = None,
+) -> ResumeVersion:
+    """Add `version` to the history in the caller's transaction.
+
+    Stored as a delta from `previous` if that is the latest version in
+    the history and a snapshot is at most K-1 versions back.
+    """
+    recent = (await db.execute(
+        select(ResumeVersion.version, ResumeVersion.kind)
+        .where(ResumeVersion.resume_id == resume_id)
+        .order_by(ResumeVersion.version.desc())
+        .limit(settings.RESUME_HISTORY_SNAPSHOT_EVERY - 1)
+    )).all()
+    chained = (
+        previous is not None
+        and recent
+        and recent[0].version == previous_version
+        and any(row.kind == SNAPSHOT for row in recent)
+    )
+    row = ResumeVersion(
+        resume_id=resume_id,
+        version=version,
+        kind=DELTA if chained else SNAPSHOT,
+        payload=make_patch(previous, document) if chained else document,
+    )
+    db.add(row)
+    return row
+
+
+async def list_versions(db: AsyncSession, resume_id: int) -> list:
+    """Versions in the history, newest first (payloads not loaded)."""
+    result = await db.execute(
+        select(ResumeVersion.version, ResumeVersion.created_at)
+        .where(ResumeVersion.resume_id == resume_id)
+        .order_by(ResumeVersion.version.desc())
+    )
+    return list(result.all())
+
+
+async def get_version(db: AsyncSession, resume_id: int, version: int) -> Optional[tuple[dict, datetime]]:
+    """Reconstruct a version from its snapshot and deltas.
+
+    Returns the document and when it was saved, or None if the version is
+    not in the history.
+    """
+    snapshot = (
+        select(func.max(ResumeVersion.version))
+        .where(
+            ResumeVersion.resume_id == resume_id,
+            ResumeVersion.kind == SNAPSHOT,
+            ResumeVersion.version <= version,
+        )
+        .scalar_subquery()
+    )
+    rows = (await db.execute(
+        select(ResumeVersion)
+        .where(
+            ResumeVersion.resume_id == resume_id,
+            ResumeVersion.version >= snapshot,
+            ResumeVersion.version <= version,
+        )
+        .order_by(ResumeVersion.version)
+    )).scalars().all()
+    if not rows or rows[-1].version != version:
+        return None
+    document = rows[0].payload
+    for row in rows[1:]:
+        document = apply_patch(document, row.payload)
+    return document, rows[-1].created_at
+
+
+async def delete_history(db: AsyncSession, resume_id: int) -> None:
+    """Remove a resume's history in the caller's transaction."""
+    await db.execute(
+        delete(ResumeVersion)
+        .where(ResumeVersion.resume_id == resume_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _first_kept(db: AsyncSession, resume_id: int, count: int, newest: int, cutoff: datetime) -> int:
+    """The oldest version within both the retention period and the version limit."""
+    first = (await db.execute(
+        select(func.min(ResumeVersion.version))
+        .where(ResumeVersion.resume_id == resume_id, ResumeVersion.created_at >= cutoff)
+    )).scalar_one_or_none() or newest
+    if count > settings.RESUME_HISTORY_MAX_VERSIONS:
+        first = max(first, (await db.execute(
+            select(ResumeVersion.version)
+            .where(ResumeVersion.resume_id == resume_id)
+            .order_by(ResumeVersion.version.desc())
+            .offset(settings.RESUME_HISTORY_MAX_VERSIONS - 1)
+            .limit(1)
+        )).scalar_one())
+    return first
+
+
+async def compact_history(db: AsyncSession) -> int:
+    """Prune old versions. Returns the number of rows removed."""
+    cutoff = datetime.utcnow() - timedelta(days=settings.RESUME_HISTORY_RETENTION_DAYS)
+    candidates = (await db.execute(
+        select(ResumeVersion.resume_id, func.count(), func.max(ResumeVersion.version))
+        .group_by(ResumeVersion.resume_id)
+        .having(or_(
+            func.count() > settings.RESUME_HISTORY_MAX_VERSIONS,
+            func.min(ResumeVersion.created_at) < cutoff,
+        ))
+    )).all()
+
+    removed = 0
+    for resume_id, count, newest in candidates:
+        keep = await _first_kept(db, resume_id, count, newest, cutoff)
+        kept = (await db.execute(
+            select(ResumeVersion).where(ResumeVersion.resume_id == resume_id, ResumeVersion.version == keep)
+        )).scalar_one()
+        if kept.kind != SNAPSHOT:
+            document, _ = await get_version(db, resume_id, keep)
+            await db.execute(
+                update(ResumeVersion)
+                .where(ResumeVersion.id == kept.id)
+                .values(kind=SNAPSHOT, payload=document)
+                .execution_options(synchronize_session=False)
+            )
+        result = await db.execute(
+            delete(ResumeVersion)
+            .where(ResumeVersion.resume_id == resume_id, ResumeVersion.version < keep)
+            .execution_options(synchronize_session=False)
+        )
+        removed += result.rowcount
+        await db.commit()
+    return removed
+
+
+async def run_compactor():
+    """Periodically prune version history (started in main.lifespan)."""
+    while True:
+        try:
+            async with async_session() as db:
+                removed = await compact_history(db)
+            if removed:
+                logger.info("Pruned %d resume versions", removed)
+        except Exception:
+            logger.exception("Version history compaction failed")
+        await asyncio.sleep(settings.RESUME_HISTORY_COMPACT_INTERVAL_SECONDS)
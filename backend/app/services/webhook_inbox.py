@@ -0,0 +1,246 @@
+"""
+Inbox for payment webhooks.
+
+The webhook endpoint only verifies the signature and stores the event
+(dropping redeliveries of an event id it already has), so the provider
+gets its 200 straight away. A worker then processes due events, each in
+its own transaction:
+
+* ``checkout.completed`` grants tokens and records the transaction once
+  per ``checkout_id``; a redelivery under a new event id is a no-op.
+* A failure is retried with exponential backoff and jitter; after
+  ``WEBHOOK_MAX_ATTEMPTS`` (or straight away for an event that can never
+  succeed) the event is dead-lettered for inspection.
+
+Events are claimed with a lease, so several workers can share the inbox
+and an event whose worker died becomes due again.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.database import async_session, insert_for
+from app.metrics import (
+    TOOL_NAME, payment_revenue, payment_success, webhook_events, webhook_inbox_lag,
+    webhook_inbox_oldest_seconds, webhook_inbox_pending,
+)
+from app.models.token import PaymentTransaction, WebhookEvent
+from app.services import token_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+DEAD = "dead"
+
+
+class InvalidEvent(ValueError):
+    """The event can never be processed (e.g. required fields are missing)."""
+
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+async def enqueue(db: AsyncSession, payload: bytes, event: dict) -> bool:
+    """Store a verified event. Returns False if it was already received."""
+    obj = event.get("object") or {}
+    now = datetime.utcnow()
+    stmt = insert_for(db)(WebhookEvent).values(
+        event_id=str(event.get("id") or f"sha256:{hashlib.sha256(payload).hexdigest()}"),
+        event_type=event.get("eventType"),
+        checkout_id=obj.get("id") if isinstance(obj, dict) else None,
+        payload=payload.decode("utf-8"),
+        status=PENDING,
+        attempts=0,
+        next_attempt_at=now,
+        received_at=now,
+    ).on_conflict_do_nothing(index_elements=[WebhookEvent.event_id])
+    result = await db.execute(stmt)
+    await db.commit()
+    _get_wakeup().set()
+    return result.rowcount > 0
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter after `attempts` failed attempts."""
+    ceiling = min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.WEBHOOK_RETRY_MAX_SECONDS)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+async def _handle_checkout_completed(db: AsyncSession, row: WebhookEvent, event: dict) -> str:
+    """Grant tokens and record the transaction, once per checkout."""
+    obj = event.get("object") or {}
+    metadata = obj.get("metadata") or {}
+    order = obj.get("order") or {}
+    device_id = metadata.get("device_id")
+    if not row.checkout_id or not device_id:
+        raise InvalidEvent("checkout.completed without a checkout id or device_id")
+    try:
+        generations = int(metadata.get("generations", 1))
+    except (TypeError, ValueError):
+        raise InvalidEvent(f"Invalid generations: {metadata.get('generations')!r}")
+
+    if await db.scalar(
+        select(PaymentTransaction.id).where(PaymentTransaction.checkout_id == row.checkout_id)
+    ) is not None:
+        return "duplicate"
+
+    # Create the token row first: get_or_create_token commits when it inserts.
+    await token_service.get_or_create_token(db, device_id)
+    product_sku = metadata.get("product_sku")
+    amount_cents = order.get("amount", 0)
+    db.add(PaymentTransaction(
+        checkout_id=row.checkout_id,
+        device_id=device_id,
+        product_sku=product_sku,
+        amount_cents=amount_cents,
+        currency=order.get("currency", "USD"),
+        status="completed",
+        tokens_granted=generations,
+        completed_at=datetime.utcnow(),
+    ))
+    _mark(row, DONE)
+    # Commits the grant together with the transaction row and the inbox status.
+    await token_service.add_tokens(db, device_id, generations)
+
+    payment_success.labels(tool=TOOL_NAME, product_sku=product_sku).inc()
+    payment_revenue.labels(tool=TOOL_NAME).inc(amount_cents)
+    return "processed"
+
+
+HANDLERS = {
+    "checkout.completed": _handle_checkout_completed,
+}
+
+
+def _mark(row: WebhookEvent, status: str, error: Optional[str] = None) -> None:
+    row.status = status
+    row.last_error = error
+    if status != PENDING:
+        row.processed_at = datetime.utcnow()
+
+
+async def _claim(db: AsyncSession, event_id: int, attempts: int) -> Optional[WebhookEvent]:
+    """Take a lease on a due event; None if another worker got it first."""
+    result = await db.execute(
+        update(WebhookEvent)
+        .where(
+            WebhookEvent.id == event_id,
+            WebhookEvent.status == PENDING,
+            WebhookEvent.attempts == attempts,
+        )
+        .values(
+            attempts=attempts + 1,
+            next_attempt_at=datetime.utcnow() + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if result.rowcount == 0:
+        return None
+    return await db.get(WebhookEvent, event_id)
+
+
+async def _process(db: AsyncSession, row: WebhookEvent) -> str:
+    handler = HANDLERS.get(row.event_type)
+    try:
+        if handler is None:
+            _mark(row, DONE)
+            await db.commit()
+            return "ignored"
+        try:
+            result = await handler(db, row, json.loads(row.payload))
+        except IntegrityError:
+            # Another worker recorded the same checkout_id first.
+            await db.rollback()
+            await db.refresh(row)
+            result = "duplicate"
+        if row.status != DONE:
+            _mark(row, DONE)
+            await db.commit()
+        return result
+    except Exception as e:
+        await db.rollback()
+        await db.refresh(row)
+        permanent = isinstance(e, (InvalidEvent, json.JSONDecodeError))
+        if permanent or row.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            logger.error("Dead-lettering webhook event %s after %d attempts: %s", row.event_id, row.attempts, e)
+            _mark(row, DEAD, repr(e))
+            result = "dead"
+        else:
+            logger.warning("Webhook event %s failed (attempt %d): %s", row.event_id, row.attempts, e)
+            _mark(row, PENDING, repr(e))
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(row.attempts))
+            result = "retry"
+        await db.commit()
+        return result
+
+
+async def process_due(session_factory: Callable[[], AsyncSession] = async_session, limit: Optional[int] = None) -> int:
+    """Process events that are due. Returns the number of events handled."""
+    async with session_factory() as db:
+        due = (await db.execute(
+            select(WebhookEvent.id, WebhookEvent.attempts)
+            .where(WebhookEvent.status == PENDING, WebhookEvent.next_attempt_at <= datetime.utcnow())
+            .order_by(WebhookEvent.id)
+            .limit(limit or settings.WEBHOOK_BATCH_SIZE)
+        )).all()
+
+    handled = 0
+    for event_id, attempts in due:
+        # One session per event: a rollback must not expire the others.
+        async with session_factory() as db:
+            row = await _claim(db, event_id, attempts)
+            if row is None:
+                continue
+            result = await _process(db, row)
+        webhook_events.labels(tool=TOOL_NAME, event_type=row.event_type or "unknown", result=result).inc()
+        if row.status != PENDING:
+            webhook_inbox_lag.labels(tool=TOOL_NAME).observe((row.processed_at - row.received_at).total_seconds())
+        handled += 1
+
+    async with session_factory() as db:
+        await update_lag_metrics(db)
+    return handled
+
+
+async def update_lag_metrics(db: AsyncSession) -> None:
+    count, oldest = (await db.execute(
+        select(func.count(), func.min(WebhookEvent.received_at)).where(WebhookEvent.status == PENDING)
+    )).one()
+    webhook_inbox_pending.labels(tool=TOOL_NAME).set(count)
+    age = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+    webhook_inbox_oldest_seconds.labels(tool=TOOL_NAME).set(max(age, 0))
+
+
+async def run_worker():
+    """Process the inbox as events arrive and on an interval (started in main.lifespan)."""
+    wakeup = _get_wakeup()
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), settings.WEBHOOK_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        try:
+            while await process_due() >= settings.WEBHOOK_BATCH_SIZE:
+                pass
+        except Exception:
+            logger.exception("Webhook inbox processing failed")
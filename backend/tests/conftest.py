@@ -5,7 +5,7 @@ from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
 from app.main import app
-from app.core.database import Base, get_db
+from app.core.database import Base, get_db, get_session_factory
 
 # Test database
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -38,6 +38,7 @@ async def override_get_db() -> AsyncGenerator[AsyncSession, None]:
 
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_session_factory] = lambda: test_async_session
 
 
 @pytest.fixture
@@ -0,0 +1,111 @@
+"""
+In-process fake Creem API speaking HTTP/1.1 with keep-alive, for
+Creem client tests.
+
+Serves ``POST /v1/checkouts`` and ``GET /v1/checkouts?checkout_id=``.
+Responses can be scripted per request with ``fail`` (an error status)
+and ``delay`` (seconds before answering); unscripted requests succeed.
+"""
+import asyncio
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeCreemServer:
+    """Runs on its own thread and event loop; use ``url`` as CREEM_API_URL."""
+
+    def __init__(self):
+        self.checkouts: dict[str, dict] = {}
+        self.requests: list[tuple[str, str]] = []
+        self.connections = 0
+        self.url = ""
+        self._script: list[tuple[int, float]] = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self) -> "FakeCreemServer":
+        self._thread.start()
+        server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._serve, "127.0.0.1", 0), self._loop
+        ).result()
+        self._server = server
+        self.url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1"
+        return self
+
+    def stop(self) -> None:
+        async def shutdown():
+            self._server.close()
+            # Handlers may still be sleeping on a delay the client gave up on.
+            handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def fail(self, *statuses: int) -> None:
+        """Answer the next requests with these statuses."""
+        self._script.extend((status, 0.0) for status in statuses)
+
+    def delay(self, seconds: float, times: int = 1) -> None:
+        """Answer the next requests successfully after `seconds`."""
+        self._script.extend((200, seconds) for _ in range(times))
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    headers = {}
+                    while (line := await reader.readline()) not in (b"\r\n", b""):
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    body = await reader.readexactly(int(headers.get("content-length", 0)))
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                status, payload = await self._dispatch(method, target, headers, body)
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 %d X\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                    % (status, len(data), data)
+                )
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, headers: dict, body: bytes) -> tuple[int, dict]:
+        url = urlsplit(target)
+        self.requests.append((method, url.path))
+        status, delay = self._script.pop(0) if self._script else (200, 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if status != 200:
+            return status, {"error": f"scripted {status}"}
+        if not headers.get("x-api-key"):
+            return 401, {"error": "missing api key"}
+        if url.path == "/v1/checkouts" and method == "POST":
+            checkout_id = f"ch_{len(self.checkouts) + 1}"
+            self.checkouts[checkout_id] = {
+                "id": checkout_id,
+                "status": "pending",
+                "checkout_url": f"https://checkout.example/{checkout_id}",
+                "request": json.loads(body),
+            }
+            return 200, self.checkouts[checkout_id]
+        if url.path == "/v1/checkouts" and method == "GET":
+            checkout_id = parse_qs(url.query).get("checkout_id", [""])[0]
+            if checkout_id not in self.checkouts:
+                return 404, {"error": "checkout not found"}
+            return 200, self.checkouts[checkout_id]
+        return 404, {"error": "not found"}
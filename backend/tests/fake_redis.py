@@ -0,0 +1,162 @@
+"""
+In-process fake Redis server speaking RESP2, for quota backend tests.
+
+Implements just the commands RedisQuotaBackend uses. Commands run one at
+a time on the server's event loop, so each is atomic like in Redis, and
+so is a MULTI/EXEC block. WATCH compares values rather than versions,
+which is enough for the monotonic keys it is used on.
+"""
+import asyncio
+import threading
+import time
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[str]:
+    """Read one client command (a RESP array of bulk strings)."""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by client")
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+    return args
+
+
+def _bulk(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedisServer:
+    """Runs on its own thread and event loop; use ``url`` to connect."""
+
+    def __init__(self):
+        self.strings: dict[str, tuple[str, float]] = {}
+        self.zsets: dict[str, dict[str, float]] = {}
+        self.commands = 0
+        self.url = ""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self) -> "FakeRedisServer":
+        self._thread.start()
+        server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._serve, "127.0.0.1", 0), self._loop
+        ).result()
+        self._server = server
+        self.url = f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+        return self
+
+    def stop(self) -> None:
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        watched: dict[str, object] = {}
+        queued = None
+        try:
+            while True:
+                try:
+                    args = await read_command(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                command = args[0].upper()
+                if command == "WATCH":
+                    watched.update((key, self._get(key)) for key in args[1:])
+                    reply = b"+OK\r\n"
+                elif command == "UNWATCH":
+                    watched.clear()
+                    reply = b"+OK\r\n"
+                elif command == "MULTI":
+                    queued = []
+                    reply = b"+OK\r\n"
+                elif command == "EXEC":
+                    if any(self._get(key) != value for key, value in watched.items()):
+                        reply = b"*-1\r\n"
+                    else:
+                        reply = b"*%d\r\n" % len(queued) + b"".join(self._dispatch(queued_args) for queued_args in queued)
+                    watched.clear()
+                    queued = None
+                elif queued is not None:
+                    queued.append(args)
+                    reply = b"+QUEUED\r\n"
+                else:
+                    reply = self._dispatch(args)
+                writer.write(reply)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _get(self, key: str):
+        value = self.strings.get(key)
+        if value is None:
+            return None
+        if value[1] and value[1] <= time.time():
+            del self.strings[key]
+            return None
+        return value[0]
+
+    def _incr(self, key: str, amount: int) -> bytes:
+        current = self._get(key)
+        expires = self.strings[key][1] if current is not None else 0
+        new = int(current or 0) + amount
+        self.strings[key] = (str(new), expires)
+        return b":%d\r\n" % new
+
+    def _dispatch(self, args: list[str]) -> bytes:
+        self.commands += 1
+        command, args = args[0].upper(), args[1:]
+        if command in ("PING", "SELECT", "AUTH"):
+            return b"+OK\r\n" if command != "PING" else b"+PONG\r\n"
+        if command == "FLUSHDB":
+            self.strings.clear()
+            self.zsets.clear()
+            return b"+OK\r\n"
+        if command == "GET":
+            return _bulk(self._get(args[0]))
+        if command == "SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if "NX" in options and self._get(key) is not None:
+                return _bulk(None)
+            expires = time.time() + int(args[2 + options.index("EX") + 1]) if "EX" in options else 0
+            self.strings[key] = (value, expires)
+            return b"+OK\r\n"
+        if command == "INCRBY":
+            return self._incr(args[0], int(args[1]))
+        if command == "DECRBY":
+            return self._incr(args[0], -int(args[1]))
+        if command == "EXPIRE":
+            if self._get(args[0]) is None:
+                return b":0\r\n"
+            self.strings[args[0]] = (self.strings[args[0]][0], time.time() + int(args[1]))
+            return b":1\r\n"
+        if command == "DEL":
+            removed = sum(1 for key in args if self.strings.pop(key, None) or self.zsets.pop(key, None))
+            return b":%d\r\n" % removed
+        if command == "ZADD":
+            zset = self.zsets.setdefault(args[0], {})
+            pairs = list(zip(args[1::2], args[2::2]))
+            added = sum(1 for _, member in pairs if member not in zset)
+            zset.update({member: float(score) for score, member in pairs})
+            return b":%d\r\n" % added
+        if command == "ZREM":
+            zset = self.zsets.get(args[0], {})
+            removed = sum(1 for member in args[1:] if zset.pop(member, None) is not None)
+            return b":%d\r\n" % removed
+        if command == "ZRANGEBYSCORE":
+            low, high = float(args[1]), float(args[2])  # handles -inf/+inf
+            members = sorted(
+                (score, member) for member, score in self.zsets.get(args[0], {}).items()
+                if low <= score <= high
+            )
+            return b"*%d\r\n" % len(members) + b"".join(_bulk(member) for _, member in members)
+        return b"-ERR unknown command '%s'\r\n" % command.encode("utf-8")
@@ -0,0 +1,145 @@
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.resume import Resume
+from app.services import autosave
+from app.services.autosave import AutosaveBuffer
+from tests.conftest import test_async_session as session_factory
+from tests.test_documents_api import DEVICE, create, save
+from tests.test_token_queries import count_statements
+
+
+@pytest.fixture
+def buffer(monkeypatch) -> AutosaveBuffer:
+    """Enable the autosave buffer against the test database."""
+    buffer = AutosaveBuffer(session_factory, window=60.0, max_pending=100)
+    monkeypatch.setattr(autosave.settings, "AUTOSAVE_BUFFER_ENABLED", True)
+    monkeypatch.setattr(autosave, "_buffer", buffer)
+    return buffer
+
+
+async def stored(db: AsyncSession, document_id: int) -> Resume:
+    db.expire_all()
+    result = await db.execute(select(Resume).where(Resume.id == document_id))
+    return result.scalar_one()
+
+
+def typing(n: int) -> list[list[dict]]:
+    return [[{"op": "replace", "path": "/title", "value": "x" * i}] for i in range(1, n + 1)]
+
+
+@pytest.mark.asyncio
+async def test_saves_are_coalesced_and_readable(buffer, client: AsyncClient, db_session: AsyncSession):
+    """Test buffered saves are visible to the device and written as one update."""
+    doc = await create(client, title="Draft")
+    for version, patch in enumerate(typing(5), start=1):
+        assert (await save(client, doc["id"], version, patch)).status_code == 200
+
+    fetched = (await client.get(f"/api/v1/resume/documents/{doc['id']}", headers=DEVICE)).json()
+    assert (fetched["title"], fetched["version"]) == ("xxxxx", 6)
+    assert (await stored(db_session, doc["id"])).version == 1
+    assert (await save(client, doc["id"], 5, typing(1)[0])).status_code == 412
+
+    assert await buffer.flush() == 1
+    row = await stored(db_session, doc["id"])
+    assert (row.title, row.version) == ("xxxxx", 6)
+    assert buffer.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_only_due_documents_are_flushed(buffer, client: AsyncClient, db_session: AsyncSession):
+    """Test the window: a document is written once it has been pending long enough."""
+    first = await create(client)
+    second = await create(client)
+    await save(client, first["id"], 1, typing(1)[0])
+    await save(client, second["id"], 1, typing(1)[0])
+    buffer.pending[first["id"]].since = time.monotonic() - buffer.window
+
+    assert await buffer.flush(due_only=True) == 1
+    assert list(buffer.pending) == [second["id"]]
+    assert (await stored(db_session, first["id"])).version == 2
+
+
+@pytest.mark.asyncio
+async def test_save_during_flush_stays_buffered(buffer, client: AsyncClient, db_session: AsyncSession):
+    """Test a save staged while a flush is writing is kept on top of it."""
+    doc = await create(client)
+    await save(client, doc["id"], 1, typing(1)[0])
+    original = buffer.session_factory
+
+    def staging_factory():
+        buffer.stage(DEVICE["X-Device-Id"], doc["id"], 2, {"title": "later", "template_id": "modern", "data": {}})
+        return original()
+
+    buffer.session_factory = staging_factory
+    await buffer.flush()
+    buffer.session_factory = original
+
+    entry = buffer.pending[doc["id"]]
+    assert (entry.base_version, entry.version) == (2, 3)
+    await buffer.flush()
+    row = await stored(db_session, doc["id"])
+    assert (row.title, row.version) == ("later", 3)
+
+
+@pytest.mark.asyncio
+async def test_conflicting_and_deleted_documents_are_dropped(buffer, client: AsyncClient, db_session: AsyncSession):
+    """Test a buffered save is dropped if the row changed underneath it, or deleted."""
+    changed = await create(client)
+    deleted = await create(client)
+    await save(client, changed["id"], 1, typing(1)[0])
+    await save(client, deleted["id"], 1, typing(1)[0])
+    await db_session.execute(update(Resume).where(Resume.id == changed["id"]).values(version=7))
+    await db_session.commit()
+    await client.delete(f"/api/v1/resume/documents/{deleted['id']}", headers=DEVICE)
+
+    assert list(buffer.pending) == [changed["id"]]
+    assert await buffer.flush() == 0
+    assert buffer.pending == {}
+    assert (await stored(db_session, changed["id"])).version == 7
+
+
+@pytest.mark.asyncio
+async def test_shutdown_flushes_pending(buffer, client: AsyncClient, db_session: AsyncSession):
+    """Test shutdown writes everything still buffered."""
+    doc = await create(client)
+    await save(client, doc["id"], 1, typing(1)[0])
+
+    await autosave.shutdown()
+    assert (await stored(db_session, doc["id"])).title == "x"
+
+
+@pytest.mark.asyncio
+async def test_buffer_reduces_commits(client: AsyncClient, db_session: AsyncSession, monkeypatch):
+    """Benchmark commits for a burst of keystroke saves, with and without the buffer.
+
+    Run with ``pytest -s`` to print the numbers.
+    """
+    saves = 40
+
+    async def burst() -> tuple[int, float]:
+        doc = await create(client)
+        with count_statements() as statements:
+            start = time.perf_counter()
+            for version, patch in enumerate(typing(saves), start=1):
+                assert (await save(client, doc["id"], version, patch)).status_code == 200
+            if autosave.get_buffer() is not None:
+                await autosave.get_buffer().flush()
+            elapsed = time.perf_counter() - start
+        assert (await stored(db_session, doc["id"])).version == saves + 1
+        return statements.count("COMMIT"), saves / elapsed
+
+    direct_commits, direct_rate = await burst()
+    monkeypatch.setattr(autosave.settings, "AUTOSAVE_BUFFER_ENABLED", True)
+    monkeypatch.setattr(autosave, "_buffer", AutosaveBuffer(session_factory, window=60.0, max_pending=100))
+    buffered_commits, buffered_rate = await burst()
+
+    print(
+        f"\n{saves} saves: {direct_commits} commits at {direct_rate:.0f} saves/s direct, "
+        f"{buffered_commits} commits at {buffered_rate:.0f} saves/s buffered"
+    )
+    assert direct_commits == saves
+    assert buffered_commits == 1
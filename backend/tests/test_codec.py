@@ -0,0 +1,158 @@
+"""
+Tests for the storage codec, plus a storage benchmark.
+
+Run with ``pytest -s`` to print DB sizes and latencies per codec.
+"""
+import os
+import random
+import time
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, insert, select, text
+
+from app.commands.backfill_storage import backfill
+from app.core import codec
+from app.core.codec import CodecError, CompactJSON
+from app.core.database import Base, create_engine_for
+from app.models.resume import Resume, ResumeVersion
+
+WORDS = (
+    "built scalable services for payments and search, reduced latency by 40% while "
+    "mentoring engineers and leading migrations to cloud infrastructure across teams"
+).split()
+
+
+def make_resume(rng: random.Random) -> dict:
+    """A resume in the editor's format with plausible, varied content."""
+    def sentence(n):
+        return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+    return {
+        "personalInfo": {
+            "name": f"Person {rng.randrange(10_000)}", "title": rng.choice(["Senior Engineer", "Product Manager"]),
+            "email": f"user{rng.randrange(10_000)}@example.com", "phone": f"+1 555 {rng.randrange(10_000):04d}",
+            "location": rng.choice(["Berlin", "New York", "Lisbon"]), "website": "", "summary": sentence(25),
+        },
+        "experience": [
+            {"id": str(i), "title": rng.choice(["Engineer", "Developer", "Manager"]),
+             "company": f"Company {rng.randrange(500)}", "startDate": f"{2010 + i}-01", "endDate": "Present",
+             "description": "\n".join(f"• {sentence(12)}" for _ in range(rng.randint(2, 5)))}
+            for i in range(rng.randint(1, 5))
+        ],
+        "education": [{"id": "1", "degree": "Bachelor", "school": "State University",
+                       "field": "Computer Science", "startDate": "2006", "endDate": "2010"}],
+        "skills": rng.sample(["Python", "Go", "SQL", "JavaScript", "Leadership", "Communication"], 4),
+        "languages": ["English"],
+        "certifications": [],
+    }
+
+
+def test_round_trip_and_legacy_values():
+    """Test encoded values decode, and plain JSON in any form still reads."""
+    resume = make_resume(random.Random(1))
+    compressed = codec.encode(resume, "zlib")
+
+    assert compressed.startswith(codec.MAGIC)
+    assert codec.decode(compressed) == resume
+    assert codec.decode(codec.encode(resume, "json")) == resume
+    assert codec.decode('{"a": [1, 2]}') == {"a": [1, 2]}
+    assert codec.decode(memoryview(b'{"a": 1}')) == {"a": 1}
+    assert len(compressed) < len(codec.canonical_json(resume)) / 2
+
+
+def test_bad_values_are_rejected():
+    """Test unknown dictionaries and corrupt payloads raise CodecError."""
+    compressed = codec.encode({"a": "b" * 100}, "zlib")
+
+    with pytest.raises(CodecError):
+        codec.decode(codec.MAGIC + b"\x63" + compressed[3:])
+    with pytest.raises(CodecError):
+        codec.decode(compressed[:-4])
+    with pytest.raises(ValueError):
+        CompactJSON("lz4")
+
+
+def test_dictionary_helps_small_documents():
+    """Test the preset dictionary compresses a resume better than plain deflate."""
+    raw = codec.canonical_json(make_resume(random.Random(2)))
+
+    def deflated(zdict):
+        compressor = codec.zlib.compressobj(9, codec.zlib.DEFLATED, -15, 9, **zdict)
+        return len(compressor.compress(raw) + compressor.flush())
+
+    assert deflated({"zdict": codec.DICTIONARIES[codec.CURRENT_DICTIONARY]}) < deflated({})
+
+
+@pytest.mark.asyncio
+async def test_backfill_rewrites_rows(tmp_path):
+    """Test the backfill compresses existing rows and history, which still read back, and is re-runnable."""
+    engine = create_engine_for(f"sqlite+aiosqlite:///{tmp_path / 'backfill.db'}")
+    rng = random.Random(3)
+    resumes = [make_resume(rng) for _ in range(7)]
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Resume), [{"device_id": "d", "data": data} for data in resumes])
+        await conn.execute(insert(ResumeVersion), [
+            {"resume_id": i + 1, "version": 1, "kind": "snapshot", "payload": data}
+            for i, data in enumerate(resumes[:3])
+        ])
+
+    dry = await backfill(engine, "zlib", batch_size=3, dry_run=True)
+    stats = await backfill(engine, "zlib", batch_size=3)
+    again = await backfill(engine, "zlib", batch_size=3)
+    async with engine.connect() as conn:
+        raw = (await conn.execute(text("SELECT data FROM resumes UNION ALL SELECT payload FROM resume_versions"))).scalars().all()
+        stored = (await conn.execute(select(Resume.data).order_by(Resume.id))).scalars().all()
+        history = (await conn.execute(select(ResumeVersion.payload).order_by(ResumeVersion.id))).scalars().all()
+    await backfill(engine, "json")
+    async with engine.connect() as conn:
+        restored = (await conn.execute(select(Resume.data).order_by(Resume.id))).scalars().all()
+        raw_restored = (await conn.execute(text("SELECT payload FROM resume_versions"))).scalars().all()
+    await engine.dispose()
+
+    assert (dry.rows, dry.rewritten, stats.rewritten, again.rewritten) == (10, 10, 10, 0)
+    assert stats.bytes_after < stats.bytes_before / 2
+    assert len(raw) == 10 and all(value.startswith(codec.MAGIC) for value in raw)
+    assert stored == resumes == restored
+    assert history == resumes[:3]
+    assert all(isinstance(value, str) for value in raw_restored)
+
+
+@pytest.mark.asyncio
+async def test_storage_benchmark(tmp_path):
+    """Benchmark DB file size and read/write latency for a resume corpus per codec."""
+    rng = random.Random(4)
+    corpus = [make_resume(rng) for _ in range(500)]
+    results = {}
+
+    for storage_codec in codec.CODECS:
+        path = tmp_path / f"{storage_codec}.db"
+        table = Table("resumes", MetaData(), Column("id", Integer, primary_key=True),
+                      Column("data", CompactJSON(storage_codec)))
+        engine = create_engine_for(f"sqlite+aiosqlite:///{path}")
+        async with engine.begin() as conn:
+            await conn.run_sync(table.metadata.create_all)
+
+        start = time.perf_counter()
+        for data in corpus:
+            async with engine.begin() as conn:
+                await conn.execute(insert(table).values(data=data))
+        write = (time.perf_counter() - start) / len(corpus)
+
+        start = time.perf_counter()
+        async with engine.connect() as conn:
+            for i in range(1, len(corpus) + 1):
+                assert (await conn.execute(select(table.c.data).where(table.c.id == i))).scalar_one()
+        read = (time.perf_counter() - start) / len(corpus)
+
+        async with engine.connect() as conn:
+            await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            await conn.execute(text("VACUUM"))
+        await engine.dispose()
+        results[storage_codec] = (os.path.getsize(path), write, read)
+
+    print()
+    for name, (size, write, read) in results.items():
+        print(f"{name:>5}: {size / 1024:7.0f} KiB for {len(corpus)} resumes, "
+              f"write {write * 1e3:.2f} ms, read {read * 1e3:.3f} ms")
+    assert results["zlib"][0] < results["json"][0] * 0.7
@@ -0,0 +1,185 @@
+"""
+Creem client tests against the fake Creem server: connection pooling,
+retries, timeouts and the circuit breaker.
+"""
+import time
+
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from app.services import creem_client
+from tests.fake_creem import FakeCreemServer
+
+
+@pytest.fixture
+def creem_server():
+    server = FakeCreemServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+async def creem(creem_server, monkeypatch):
+    settings = creem_client.settings
+    monkeypatch.setattr(settings, "CREEM_API_URL", creem_server.url)
+    monkeypatch.setattr(settings, "CREEM_API_KEY", "creem_test_key")
+    monkeypatch.setattr(settings, "CREEM_PRODUCT_IDS", '{"starter_30": "prod_starter"}')
+    monkeypatch.setattr(settings, "CREEM_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(settings, "CREEM_DEADLINE_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "CREEM_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "CREEM_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "CREEM_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(settings, "CREEM_BREAKER_RESET_SECONDS", 0.2)
+    monkeypatch.setattr(creem_client, "_client", None)
+    monkeypatch.setattr(creem_client, "_product_ids", None)
+    monkeypatch.setattr(creem_client, "_breaker", None)
+    await creem_client.init_client()
+    yield creem_server
+    await creem_client.close_client()
+
+
+def _count(operation: str, outcome: str) -> float:
+    return REGISTRY.get_sample_value(
+        "creem_requests_total",
+        {"tool": "resume-builder", "operation": operation, "outcome": outcome},
+    ) or 0
+
+
+async def _checkout():
+    return await creem_client.create_checkout("starter_30", "device-1", 30, "https://example.com/ok")
+
+
+@pytest.mark.asyncio
+async def test_checkouts_reuse_pooled_connection(creem):
+    """Test sequential calls share one connection and one parsed product map."""
+    first = await _checkout()
+    second = await _checkout()
+    fetched = await creem_client.get_checkout(second["id"])
+
+    assert first["id"] != second["id"]
+    assert fetched["request"]["product_id"] == "prod_starter"
+    assert fetched["request"]["metadata"] == {
+        "product_sku": "starter_30", "device_id": "device-1", "generations": "30",
+    }
+    assert len(creem.requests) == 3
+    assert creem.connections == 1
+
+    creem_client.settings.CREEM_PRODUCT_IDS = "{}"
+    assert (await _checkout())["request"]["product_id"] == "prod_starter"
+
+
+@pytest.mark.asyncio
+async def test_unconfigured_product_rejected(creem):
+    """Test a SKU without a Creem product id fails without calling Creem."""
+    with pytest.raises(creem_client.CreemError) as e:
+        await creem_client.create_checkout("pro_100", "device-1", 100, "https://example.com/ok")
+    assert e.value.status_code == 400
+    assert creem.requests == []
+
+
+@pytest.mark.asyncio
+async def test_idempotent_call_retried(creem):
+    """Test a GET is retried through 503 and 429 responses."""
+    checkout = await _checkout()
+    retried = _count("get_checkout", "retried")
+    creem.fail(503, 429)
+
+    assert (await creem_client.get_checkout(checkout["id"]))["id"] == checkout["id"]
+    assert len(creem.requests) == 4
+    assert _count("get_checkout", "retried") == retried + 2
+
+
+@pytest.mark.asyncio
+async def test_checkout_not_retried_after_send(creem):
+    """Test a POST that reached Creem is not repeated on 5xx or a read timeout."""
+    creem.fail(502)
+    with pytest.raises(creem_client.CreemUnavailable):
+        await _checkout()
+    assert len(creem.requests) == 1
+
+    creem.delay(1.0)
+    start = time.monotonic()
+    with pytest.raises(creem_client.CreemUnavailable):
+        await _checkout()
+    assert time.monotonic() - start < 0.9  # per-attempt timeout, not the server's delay
+    assert len(creem.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_client_errors_not_retried(creem):
+    """Test a 4xx is reported as-is and does not count against the breaker."""
+    with pytest.raises(creem_client.CreemError) as e:
+        await creem_client.get_checkout("ch_missing")
+    assert e.value.status_code == 404
+    assert not isinstance(e.value, creem_client.CreemUnavailable)
+    assert len(creem.requests) == 1
+    assert creem_client.get_breaker().failures == 0
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_retries(creem):
+    """Test retries stop once the overall deadline is spent."""
+    creem_client.settings.CREEM_DEADLINE_SECONDS = 0.8
+    creem_client.settings.CREEM_MAX_ATTEMPTS = 10
+    creem.delay(1.0, times=10)
+
+    start = time.monotonic()
+    with pytest.raises(creem_client.CreemUnavailable):
+        await creem_client.get_checkout("ch_1")
+    assert time.monotonic() - start < 1.0
+    assert len(creem.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_recovers(creem):
+    """Test the breaker fails fast while open and closes after a good trial call."""
+    short_circuited = _count("create_checkout", "short_circuited")
+    creem.fail(500, 500)
+    for _ in range(2):
+        with pytest.raises(creem_client.CreemUnavailable):
+            await _checkout()
+    breaker = creem_client.get_breaker()
+    assert breaker.state == breaker.OPEN
+
+    with pytest.raises(creem_client.CreemUnavailable) as e:
+        await _checkout()
+    assert 0 < e.value.retry_after <= 0.2
+    assert len(creem.requests) == 2
+    assert _count("create_checkout", "short_circuited") == short_circuited + 1
+
+    time.sleep(0.25)
+    creem.fail(500)
+    with pytest.raises(creem_client.CreemUnavailable):
+        await _checkout()  # failed trial re-opens
+    assert breaker.state == breaker.OPEN
+
+    time.sleep(0.25)
+    assert (await _checkout())["status"] == "pending"
+    assert breaker.state == breaker.CLOSED
+    assert REGISTRY.get_sample_value(
+        "creem_circuit_breaker_state", {"tool": "resume-builder"}
+    ) == breaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_create_checkout_endpoint(client: AsyncClient, creem):
+    """Test the endpoint returns the checkout, then 503 with Retry-After when Creem is down."""
+    body = {"product_sku": "starter_30", "device_id": "device-1", "success_url": "https://example.com/ok"}
+    response = await client.post("/api/v1/payment/create-checkout", json=body)
+    assert response.status_code == 200
+    assert response.json() == {"checkout_url": "https://checkout.example/ch_1", "session_id": "ch_1"}
+
+    creem.fail(500, 500)
+    for _ in range(2):
+        response = await client.post("/api/v1/payment/create-checkout", json=body)
+        assert response.status_code == 503
+    response = await client.post("/api/v1/payment/create-checkout", json=body)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    response = await client.post(
+        "/api/v1/payment/create-checkout", json={**body, "product_sku": "pro_100"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Product not configured in Creem"
@@ -0,0 +1,73 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from app.core.database import TimedQueuePool, create_engine_for, engine_options
+from app.metrics import TOOL_NAME
+
+
+def checkout_count() -> float:
+    return REGISTRY.get_sample_value("db_pool_checkout_seconds_count", {"tool": TOOL_NAME}) or 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_file_profile_applies_pragmas(tmp_path):
+    """Test new SQLite connections get WAL, busy_timeout and the cache settings."""
+    engine = create_engine_for(f"sqlite+aiosqlite:///{tmp_path / 'tuned.db'}")
+    before = checkout_count()
+
+    async with engine.connect() as conn:
+        pragmas = {
+            name: (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size")
+        }
+    await engine.dispose()
+
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000, "cache_size": -64000}
+    assert isinstance(engine.pool, TimedQueuePool)
+    assert checkout_count() == before + 1
+
+
+def test_profiles_by_url_scheme():
+    """Test the engine profile is chosen from the database URL."""
+    sqlite = engine_options("sqlite+aiosqlite:///./data/app.db")
+    postgres = engine_options("postgresql+asyncpg://app:secret@db/resume")
+
+    assert engine_options("sqlite+aiosqlite:///:memory:") == {}
+    assert (sqlite["pool_size"], sqlite["max_overflow"]) == (5, 0)
+    assert postgres["pool_pre_ping"] is True
+    assert postgres["max_overflow"] == 20
+
+
+@pytest.mark.asyncio
+async def test_init_db_merges_duplicate_daily_usage(tmp_path, monkeypatch):
+    """Test an old database with duplicate daily_usage rows is merged before the unique index."""
+    from app.core import database
+
+    engine = create_engine_for(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE daily_usage (id INTEGER PRIMARY KEY, device_id VARCHAR(255) NOT NULL,"
+            " date VARCHAR(10) NOT NULL, generations_used INTEGER)"
+        ))
+        await conn.execute(text(
+            "INSERT INTO daily_usage (device_id, date, generations_used) VALUES"
+            " ('dup', '2026-01-01', 1), ('dup', '2026-01-01', 2), ('dup', '2026-01-02', 1),"
+            " ('other', '2026-01-01', 1), ('dup', '2026-01-01', NULL)"
+        ))
+    monkeypatch.setattr(database, "engine", engine)
+
+    await database.init_db()
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text(
+            "SELECT id, device_id, date, generations_used, reserved FROM daily_usage ORDER BY id"
+        ))).all()
+        indexes = (await conn.execute(text("PRAGMA index_list(daily_usage)"))).all()
+    await engine.dispose()
+
+    assert [tuple(row) for row in rows] == [
+        (1, "dup", "2026-01-01", 3, 0),
+        (3, "dup", "2026-01-02", 1, 0),
+        (4, "other", "2026-01-01", 1, 0),
+    ]
+    assert any(index[1] == "uq_daily_usage_device_date" and index[2] == 1 for index in indexes)
@@ -0,0 +1,119 @@
+import pytest
+from httpx import AsyncClient
+
+DEVICE = {"X-Device-Id": "doc-device"}
+PATCH = "application/json-patch+json"
+
+
+async def create(client: AsyncClient, **body) -> dict:
+    response = await client.post("/api/v1/resume/documents", json=body, headers=DEVICE)
+    assert response.status_code == 201
+    return response.json()
+
+
+async def save(client: AsyncClient, document_id: int, version, patch: list):
+    return await client.patch(
+        f"/api/v1/resume/documents/{document_id}",
+        json=patch,
+        headers={**DEVICE, "If-Match": f'"{version}"', "Content-Type": PATCH},
+    )
+
+
+@pytest.mark.asyncio
+async def test_document_crud(client: AsyncClient):
+    """Test create, list, get, patch and delete of a document."""
+    doc = await create(client, title="Mine", data={"personalInfo": {"name": "Ada"}, "skills": []})
+    assert doc["version"] == 1
+
+    saved = await save(client, doc["id"], 1, [
+        {"op": "replace", "path": "/data/personalInfo/name", "value": "Ada Lovelace"},
+        {"op": "add", "path": "/data/skills/-", "value": "Math"},
+        {"op": "replace", "path": "/template_id", "value": "creative"},
+    ])
+    assert saved.status_code == 200
+    assert saved.json() == {"id": doc["id"], "version": 2}
+    assert saved.headers["etag"] == '"2"'
+
+    fetched = (await client.get(f"/api/v1/resume/documents/{doc['id']}", headers=DEVICE)).json()
+    assert fetched["data"] == {"personalInfo": {"name": "Ada Lovelace"}, "skills": ["Math"]}
+    assert fetched["template_id"] == "creative"
+
+    listed = (await client.get("/api/v1/resume/documents", headers=DEVICE)).json()
+    assert [d["id"] for d in listed] == [doc["id"]]
+    assert "data" not in listed[0]
+
+    assert (await client.delete(f"/api/v1/resume/documents/{doc['id']}", headers=DEVICE)).status_code == 204
+    assert (await client.get(f"/api/v1/resume/documents/{doc['id']}", headers=DEVICE)).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_stale_version_is_rejected(client: AsyncClient):
+    """Test optimistic concurrency: a save based on an old version gets 412."""
+    doc = await create(client, data={"skills": []})
+    first = await save(client, doc["id"], 1, [{"op": "add", "path": "/data/skills/-", "value": "A"}])
+    stale = await save(client, doc["id"], 1, [{"op": "add", "path": "/data/skills/-", "value": "B"}])
+
+    assert first.status_code == 200
+    assert stale.status_code == 412
+    assert stale.json()["detail"]["current_version"] == 2
+    assert stale.headers["etag"] == '"2"'
+
+
+@pytest.mark.asyncio
+async def test_invalid_saves(client: AsyncClient):
+    """Test missing If-Match, bad patches, bad documents and other devices."""
+    doc = await create(client)
+    url = f"/api/v1/resume/documents/{doc['id']}"
+
+    missing = await client.patch(url, json=[], headers={**DEVICE, "Content-Type": PATCH})
+    bad_op = await save(client, doc["id"], 1, [{"op": "remove", "path": "/data/nope"}])
+    bad_doc = await save(client, doc["id"], 1, [{"op": "remove", "path": "/title"}])
+    other = await client.patch(url, json=[], headers={"X-Device-Id": "other", "If-Match": '"1"', "Content-Type": PATCH})
+
+    assert missing.status_code == 428
+    assert bad_op.status_code == 422
+    assert bad_doc.status_code == 422
+    assert other.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_patch_saves_are_smaller_than_full_saves(client: AsyncClient):
+    """Benchmark keystroke autosaves: bytes sent per save and saves per second.
+
+    Run with ``pytest -s`` to print the numbers.
+    """
+    import json
+    import time
+
+    data = {
+        "personalInfo": {"name": "Alex Example", "title": "Engineer", "email": "alex@example.com",
+                         "summary": "Engineer with a track record of shipping reliable products. " * 4},
+        "experience": [
+            {"title": f"Engineer {i}", "company": f"Company {i}", "startDate": "2018", "endDate": "2020",
+             "description": "• Built and operated services used by millions of people\n" * 6}
+            for i in range(6)
+        ],
+        "education": [{"degree": "BSc", "field": "Computer Science", "school": "State University"}],
+        "skills": [f"Skill {i}" for i in range(30)],
+    }
+    doc = await create(client, title="Benchmark", data=data)
+    text = "Led a migration that cut p99 latency in half"
+    version, patch_bytes, full_bytes = doc["version"], 0, 0
+
+    start = time.perf_counter()
+    for i in range(1, len(text) + 1):
+        patch = [{"op": "replace", "path": "/data/experience/0/title", "value": text[:i]}]
+        data["experience"][0]["title"] = text[:i]
+        patch_bytes += len(json.dumps(patch))
+        full_bytes += len(json.dumps({"title": "Benchmark", "template_id": "modern", "data": data}))
+        response = await save(client, doc["id"], version, patch)
+        assert response.status_code == 200
+        version = response.json()["version"]
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{len(text)} saves: {patch_bytes / len(text):.0f} B/save as patches vs "
+        f"{full_bytes / len(text):.0f} B/save as full documents, {len(text) / elapsed:.0f} saves/s"
+    )
+    assert version == 1 + len(text)
+    assert patch_bytes * 20 < full_bytes
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+from app.core.jsonpatch import JsonPatchError, apply_patch, make_patch
+
+
+def test_rfc6902_operations():
+    """Test each operation against examples from RFC 6902 appendix A."""
+    doc = {"foo": ["bar", "baz"], "a/b": 1, "m~n": 2}
+
+    assert apply_patch(doc, [{"op": "add", "path": "/foo/1", "value": "qux"}])["foo"] == ["bar", "qux", "baz"]
+    assert apply_patch(doc, [{"op": "add", "path": "/foo/-", "value": "end"}])["foo"][-1] == "end"
+    assert "a/b" not in apply_patch(doc, [{"op": "remove", "path": "/a~1b"}])
+    assert apply_patch(doc, [{"op": "replace", "path": "/m~0n", "value": 3}])["m~n"] == 3
+    moved = apply_patch(doc, [{"op": "move", "from": "/foo/0", "path": "/first"}])
+    assert moved["first"] == "bar" and moved["foo"] == ["baz"]
+    copied = apply_patch(doc, [{"op": "copy", "from": "/foo", "path": "/bar"}])
+    assert copied["bar"] == ["bar", "baz"] and copied["bar"] is not copied["foo"]
+    assert apply_patch(doc, [{"op": "test", "path": "/foo/1", "value": "baz"}]) == doc
+    assert doc == {"foo": ["bar", "baz"], "a/b": 1, "m~n": 2}
+
+
+@pytest.mark.parametrize("patch", [
+    [{"op": "test", "path": "/foo/0", "value": "nope"}],
+    [{"op": "replace", "path": "/missing", "value": 1}],
+    [{"op": "remove", "path": "/foo/2"}],
+    [{"op": "add", "path": "/foo/01", "value": 1}],
+    [{"op": "move", "from": "/foo", "path": "/foo/0"}],
+    [{"op": "add", "path": "/x"}],
+    [{"op": "frobnicate", "path": "/foo"}],
+    {"op": "add", "path": "/x", "value": 1},
+])
+def test_invalid_patches_are_rejected(patch):
+    """Test malformed or inapplicable operations raise and leave the input alone."""
+    doc = {"foo": ["bar", "baz"]}
+
+    with pytest.raises(JsonPatchError):
+        apply_patch(doc, patch)
+    assert doc == {"foo": ["bar", "baz"]}
+
+
+def test_failed_patch_is_atomic():
+    """Test a later failing operation discards earlier ones."""
+    doc = {"a": 1}
+
+    with pytest.raises(JsonPatchError):
+        apply_patch(doc, [{"op": "replace", "path": "/a", "value": 2}, {"op": "remove", "path": "/b"}])
+    assert doc == {"a": 1}
+
+
+@pytest.mark.parametrize("source,target", [
+    ({"a": 1, "b": [1, 2, 3]}, {"a": 2, "b": [1, 3], "c/d": {"e~": None}}),
+    ({"list": [1, 2]}, {"list": [0, 1, 2, 3]}),
+    ({"list": [{"x": 1}, {"x": 2}]}, {"list": [{"x": 1}, {"x": 3}, {"x": 4}]}),
+    ({"flag": 1}, {"flag": True}),
+    ({"a": [1]}, {"a": "now a string"}),
+])
+def test_make_patch_round_trips(source, target):
+    """Test a computed patch turns the source into exactly the target."""
+    patch = make_patch(source, target)
+
+    result = apply_patch(source, patch)
+    # json.dumps also tells true from 1, which == does not.
+    assert json.dumps(result, sort_keys=True) == json.dumps(target, sort_keys=True)
+    assert make_patch(target, target) == []
+
+
+def test_make_patch_is_minimal_for_list_edits():
+    """Test inserting or removing one list item is a single operation."""
+    items = [{"id": str(i)} for i in range(10)]
+
+    assert make_patch({"l": items}, {"l": items[:4] + items[5:]}) == [{"op": "remove", "path": "/l/4"}]
+    assert make_patch({"l": items}, {"l": [{"id": "new"}] + items}) == [
+        {"op": "add", "path": "/l/0", "value": {"id": "new"}}
+    ]
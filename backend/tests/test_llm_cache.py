@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import pytest
+from app.services import llm_cache
+from app.services.llm_cache import CacheEntry, MemoryCache, SQLiteCache, TieredCache
+
+
+@pytest.fixture(autouse=True)
+async def fresh_cache(monkeypatch):
+    """Use an empty in-memory cache for every test."""
+    monkeypatch.setattr(llm_cache, "_backend", MemoryCache(max_entries=100, max_bytes=1024 * 1024))
+    llm_cache._cursors.clear()
+    yield
+    llm_cache._cursors.clear()
+
+
+def test_make_key_normalizes_input():
+    """Test keys ignore whitespace in the job title and language case, but not title case."""
+    key1 = llm_cache.make_key("skills", "Software  Engineer", "en", "", "gpt-4o-mini", 0.7)
+    key2 = llm_cache.make_key("skills", " Software Engineer ", "EN", "", "gpt-4o-mini", 0.7)
+    key3 = llm_cache.make_key("skills", "Software Engineer", "de", "", "gpt-4o-mini", 0.7)
+    key4 = llm_cache.make_key("skills", "software engineer", "en", "", "gpt-4o-mini", 0.7)
+
+    assert key1 == key2
+    assert key1 != key3
+    assert key1 != key4
+
+
+def test_make_key_ignores_inputs_the_prompt_does_not_use():
+    """Test skills keys ignore context and improve keys ignore the job title."""
+    skills = llm_cache.make_key("skills", "Engineer", "en", "", "gpt-4o-mini", 0.7)
+    assert skills == llm_cache.make_key("skills", "Engineer", "en", "Led a team", "gpt-4o-mini", 0.7)
+    improve = llm_cache.make_key("improve", "Engineer", "en", "Did things", "gpt-4o-mini", 0.7)
+    assert improve == llm_cache.make_key("improve", "Designer", "en", "Did things", "gpt-4o-mini", 0.7)
+    summary = llm_cache.make_key("summary", "Engineer", "en", "", "gpt-4o-mini", 0.7)
+    assert summary != llm_cache.make_key("summary", "Engineer", "en", "Led a team", "gpt-4o-mini", 0.7)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_stores_keep_every_variant(monkeypatch):
+    """Test variants stored concurrently for one key are all kept."""
+    monkeypatch.setattr(llm_cache.settings, "LLM_CACHE_VARIANTS", 3)
+    backend = llm_cache.get_backend()
+    unyielding_get = backend.get
+
+    async def slow_get(key):
+        entry = await unyielding_get(key)
+        await asyncio.sleep(0.01)
+        return entry
+
+    monkeypatch.setattr(backend, "get", slow_get)
+
+    await asyncio.gather(*(llm_cache.store("k", text) for text in ("one", "two", "three")))
+
+    assert sorted((await backend.get("k")).variants) == ["one", "three", "two"]
+
+
+@pytest.mark.asyncio
+async def test_lookup_misses_until_variants_collected(monkeypatch):
+    """Test lookups miss until N variants exist, then rotate round-robin."""
+    monkeypatch.setattr(llm_cache.settings, "LLM_CACHE_VARIANTS", 2)
+
+    assert await llm_cache.lookup("skills", "k") is None
+    await llm_cache.store("k", "first")
+    assert await llm_cache.lookup("skills", "k") is None
+    await llm_cache.store("k", "second")
+
+    served = [await llm_cache.lookup("skills", "k") for _ in range(4)]
+    assert served == ["first", "second", "first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_by_size_and_ttl():
+    """Test LRU eviction by byte size and expiry by TTL."""
+    cache = MemoryCache(max_entries=10, max_bytes=10)
+    future = time.time() + 60
+
+    await cache.set("a", CacheEntry(["12345"], future))
+    await cache.set("b", CacheEntry(["12345"], future))
+    await cache.get("a")
+    await cache.set("c", CacheEntry(["12345"], future))
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+
+    await cache.set("d", CacheEntry(["1"], time.time() - 1))
+    assert await cache.get("d") is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_tier_survives_restart(tmp_path):
+    """Test entries written through the tiered cache are read back after reopening."""
+    path = str(tmp_path / "cache.db")
+    cache = TieredCache(MemoryCache(10, 1024), SQLiteCache(path, max_entries=10))
+    await cache.set("k", CacheEntry(["persisted"], time.time() + 60))
+    await cache.close()
+
+    reopened = TieredCache(MemoryCache(10, 1024), SQLiteCache(path, max_entries=10))
+    entry = await reopened.get("k")
+    await reopened.close()
+
+    assert entry.variants == ["persisted"]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_tier_reads_entries_across_codecs(tmp_path):
+    """Test compressed entries round-trip and plain entries stay readable after switching."""
+    path = str(tmp_path / "cache.db")
+    plain = SQLiteCache(path, max_entries=10)
+    await plain.set("old", CacheEntry(["written before compression"], time.time() + 60))
+    await plain.close()
+
+    compressed = SQLiteCache(path, max_entries=10, storage_codec="zlib")
+    await compressed.set("new", CacheEntry(["• Led a team"] * 3, time.time() + 60))
+    old, new = await compressed.get("old"), await compressed.get("new")
+    await compressed.close()
+
+    assert old.variants == ["written before compression"]
+    assert new.variants == ["• Led a team"] * 3
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_bounds_entry_count(tmp_path):
+    """Test the on-disk tier drops least recently used rows past its limit."""
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=2)
+    future = time.time() + 60
+
+    for key in ("a", "b", "c"):
+        await cache.set(key, CacheEntry([key], future))
+        time.sleep(0.01)
+
+    assert await cache.get("a") is None
+    assert (await cache.get("c")).variants == ["c"]
+    await cache.close()
@@ -0,0 +1,307 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+from app.services import llm_service
+
+
+def completion(content: str) -> dict:
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+@pytest.fixture
+async def upstream(monkeypatch):
+    """Point the shared LLM client at an in-process fake proxy."""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, json=completion(f"• Shipped things #{len(calls)}"))
+
+    client = httpx.AsyncClient(base_url="http://llm-proxy.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_service, "_client", client)
+    yield calls
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_client_is_reused_across_calls(upstream):
+    """Test every generation goes through the same pooled client."""
+    client = llm_service.get_client()
+
+    await llm_service.generate_resume_content("Engineer", section="skills")
+    await llm_service.generate_cover_letter("Engineer", "Acme", "Summary")
+
+    assert llm_service.get_client() is client
+    assert len(upstream) == 2
+    assert upstream[1]["max_tokens"] == 800
+
+
+@pytest.mark.asyncio
+async def test_in_flight_counter_returns_to_zero(upstream):
+    """Test pool usage tracking is released after each call."""
+    content = await llm_service.generate_resume_content("Engineer")
+
+    assert content == "• Shipped things #1"
+    assert llm_service._in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_close_and_reinit_client():
+    """Test lifespan shutdown closes the client and startup recreates it."""
+    client = await llm_service.init_client()
+    await llm_service.close_client()
+
+    assert client.is_closed
+    new_client = await llm_service.init_client()
+    assert new_client is not client
+    assert not new_client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_cached_sections_stop_hitting_upstream(upstream, monkeypatch):
+    """Test opted-in sections are served from cache once variants are collected."""
+    monkeypatch.setattr(llm_service.llm_cache, "_backend", llm_service.llm_cache.MemoryCache(100, 1024 * 1024))
+    monkeypatch.setattr(llm_service.settings, "LLM_CACHE_VARIANTS", 2)
+
+    for _ in range(5):
+        await llm_service.generate_resume_content("Data Analyst", section="summary")
+    await llm_service.generate_resume_content("Data Analyst", section="experience")
+    await llm_service.generate_resume_content("Data Analyst", section="experience")
+
+    assert len(upstream) == 4
+
+
+@pytest.mark.asyncio
+async def test_requests_sharing_a_cache_key_send_the_same_prompt(upstream, monkeypatch):
+    """Test the prompt is built from the same normalized inputs as the cache key."""
+    monkeypatch.setattr(llm_service.llm_cache, "_backend", llm_service.llm_cache.MemoryCache(100, 1024 * 1024))
+    monkeypatch.setattr(llm_service.settings, "LLM_CACHE_VARIANTS", 3)
+
+    await llm_service.generate_resume_content("SAP  Consultant ", section="skills", language="EN")
+    await llm_service.generate_resume_content("SAP Consultant", section="skills", language="en")
+    await llm_service.generate_resume_content("sap consultant", section="skills", language="en")
+
+    prompts = [call["messages"][1]["content"] for call in upstream]
+    assert prompts[0] == prompts[1] != prompts[2]
+    assert "for a SAP Consultant." in prompts[0] and "Language: en" in prompts[0]
+    entry = await llm_service.llm_cache.get_backend().get(
+        llm_service.llm_cache.make_key("skills", "SAP Consultant", "en", "", llm_service.MODEL, llm_service.TEMPERATURE)
+    )
+    assert len(entry.variants) == 2
+
+
+@pytest.fixture
+async def gated_upstream(monkeypatch):
+    """Fake proxy that holds every request until the test releases it."""
+    state = {"calls": 0, "cancelled": 0, "release": asyncio.Event()}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["calls"] += 1
+        try:
+            await state["release"].wait()
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        return httpx.Response(200, json=completion("• Coalesced"))
+
+    client = httpx.AsyncClient(base_url="http://llm-proxy.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_service, "_client", client)
+    monkeypatch.setattr(llm_service.settings, "LLM_CACHE_ENABLED", False)
+    yield state
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_calls_share_one_upstream_call(gated_upstream):
+    """Test concurrent identical prompts are coalesced into a single request."""
+    tasks = [
+        asyncio.create_task(llm_service.generate_resume_content("Nurse", section="skills"))
+        for _ in range(5)
+    ]
+    await asyncio.sleep(0.01)
+    gated_upstream["release"].set()
+    results = await asyncio.gather(*tasks)
+
+    assert results == ["• Coalesced"] * 5
+    assert gated_upstream["calls"] == 1
+    assert llm_service._flights == {}
+
+
+@pytest.mark.asyncio
+async def test_leader_cancellation_still_serves_followers(gated_upstream):
+    """Test a disconnecting leader does not cancel the shared call for others."""
+    leader = asyncio.create_task(llm_service.generate_resume_content("Chef"))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(llm_service.generate_resume_content("Chef"))
+    await asyncio.sleep(0.01)
+
+    leader.cancel()
+    await asyncio.sleep(0.01)
+    gated_upstream["release"].set()
+
+    assert await follower == "• Coalesced"
+    assert gated_upstream["calls"] == 1
+    assert gated_upstream["cancelled"] == 0
+
+
+@pytest.mark.asyncio
+async def test_upstream_cancelled_when_all_waiters_leave(gated_upstream):
+    """Test the shared call is cancelled once nobody is waiting for it."""
+    task = asyncio.create_task(llm_service.generate_resume_content("Pilot"))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.sleep(0.01)
+
+    assert gated_upstream["cancelled"] == 1
+    assert llm_service._flights == {}
+
+
+@pytest.mark.asyncio
+async def test_caller_after_all_waiters_left_gets_a_new_call(gated_upstream):
+    """Test a caller arriving right after the last waiter left doesn't join the cancelled call."""
+    task = asyncio.create_task(llm_service.generate_resume_content("Baker"))
+    await asyncio.sleep(0.01)
+    # The retry first runs right after the cancelled waiter leaves, before
+    # the cancelled upstream task has finished.
+    task.cancel()
+    retry = asyncio.create_task(llm_service.generate_resume_content("Baker"))
+    await asyncio.sleep(0.01)
+    gated_upstream["release"].set()
+
+    assert await retry == "• Coalesced"
+    assert gated_upstream["calls"] == 2
+    assert gated_upstream["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_full_waiter_queue_bypasses_coalescing(gated_upstream, monkeypatch):
+    """Test callers beyond the waiter bound issue their own upstream call."""
+    monkeypatch.setattr(llm_service.settings, "LLM_COALESCE_MAX_WAITERS", 2)
+    tasks = [asyncio.create_task(llm_service.generate_resume_content("Pilot")) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    gated_upstream["release"].set()
+    await asyncio.gather(*tasks)
+
+    assert gated_upstream["calls"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_cover_letter_parses_sse_chunks(monkeypatch):
+    """Test upstream SSE deltas are yielded in order until [DONE]."""
+    body = "".join(
+        f"data: {json.dumps({'choices': [{'delta': {'content': part}}]})}\n\n"
+        for part in ["Dear ", "Hiring ", "Manager"]
+    ) + "data: [DONE]\n\n"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    client = httpx.AsyncClient(base_url="http://llm-proxy.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_service, "_client", client)
+
+    chunks = [chunk async for chunk in llm_service.stream_cover_letter("Engineer", "Acme", "Summary")]
+    await client.aclose()
+
+    assert chunks == ["Dear ", "Hiring ", "Manager"]
+    assert llm_service._in_flight == 0
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, {"tool": "resume-builder", **labels}) or 0
+
+
+@pytest.mark.asyncio
+async def test_call_metrics_by_section(monkeypatch):
+    """Test latency, token and cost metrics are recorded under the call's section."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={
+            **completion("Python, SQL"), "usage": {"prompt_tokens": 1200, "completion_tokens": 300},
+        })
+
+    client = httpx.AsyncClient(base_url="http://llm-proxy.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_service, "_client", client)
+    monkeypatch.setattr(llm_service.settings, "LLM_CACHE_ENABLED", False)
+    model = {"section": "skills", "model": "gpt-4o-mini"}
+    before = (
+        sample("llm_request_duration_seconds_count", section="skills"),
+        sample("llm_time_to_first_byte_seconds_count", section="skills"),
+        sample("llm_tokens_total", kind="prompt", **model),
+        sample("llm_tokens_total", kind="completion", **model),
+        sample("llm_cost_usd_total", **model),
+        sample("llm_request_duration_seconds_count", section="experience"),
+    )
+
+    assert await llm_service.generate_resume_content("Engineer", section="skills") == "Python, SQL"
+    await llm_service.generate_resume_content("Engineer", section="skills", context="backend")
+    await client.aclose()
+
+    after = (
+        sample("llm_request_duration_seconds_count", section="skills"),
+        sample("llm_time_to_first_byte_seconds_count", section="skills"),
+        sample("llm_tokens_total", kind="prompt", **model),
+        sample("llm_tokens_total", kind="completion", **model),
+        sample("llm_cost_usd_total", **model),
+        sample("llm_request_duration_seconds_count", section="experience"),
+    )
+    deltas = [b - a for a, b in zip(before, after)]
+    assert deltas[:4] == [2, 2, 2400, 600]
+    assert deltas[4] == pytest.approx((2400 * 0.15 + 600 * 0.60) / 1e6)
+    assert deltas[5] == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_counted_by_status_class(monkeypatch):
+    """Test failed calls are counted as 4xx, 5xx or timeout, and unknown sections are bucketed."""
+    responses = iter([httpx.Response(429), httpx.Response(502), httpx.ReadTimeout("slow")])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    client = httpx.AsyncClient(base_url="http://llm-proxy.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_service, "_client", client)
+    monkeypatch.setattr(llm_service.settings, "LLM_CACHE_ENABLED", False)
+    classes = ("4xx", "5xx", "timeout")
+    before = [sample("llm_errors_total", section="experience", status_class=c) for c in classes]
+
+    for _ in classes:
+        with pytest.raises(httpx.HTTPError):
+            await llm_service.generate_resume_content("Engineer", section="not-a-section")
+    await client.aclose()
+
+    after = [sample("llm_errors_total", section="experience", status_class=c) for c in classes]
+    assert [b - a for a, b in zip(before, after)] == [1, 1, 1]
+    assert llm_service._in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_records_usage_from_final_chunk(monkeypatch):
+    """Test streamed calls request usage and count it under cover_letter."""
+    body = (
+        f"data: {json.dumps({'choices': [{'delta': {'content': 'Dear'}}]})}\n\n"
+        f"data: {json.dumps({'choices': [], 'usage': {'prompt_tokens': 90, 'completion_tokens': 10}})}\n\n"
+        "data: [DONE]\n\n"
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream_options"] == {"include_usage": True}
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    client = httpx.AsyncClient(base_url="http://llm-proxy.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_service, "_client", client)
+    labels = {"section": "cover_letter", "model": "gpt-4o-mini", "kind": "prompt"}
+    before = sample("llm_tokens_total", **labels), sample("llm_time_to_first_byte_seconds_count", section="cover_letter")
+
+    chunks = [chunk async for chunk in llm_service.stream_cover_letter("Engineer", "Acme", "Summary")]
+    await client.aclose()
+
+    assert chunks == ["Dear"]
+    assert sample("llm_tokens_total", **labels) == before[0] + 90
+    assert sample("llm_time_to_first_byte_seconds_count", section="cover_letter") == before[1] + 1
@@ -0,0 +1,98 @@
+"""
+HTTP metrics middleware tests: route-template labels, bounded
+cardinality, bot detection and per-request overhead.
+"""
+import time
+
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from app.metrics import MetricsMiddleware
+
+
+def _requests(endpoint: str, method: str = "GET", status: str = "200") -> float:
+    return REGISTRY.get_sample_value(
+        "http_requests_total",
+        {"tool": "resume-builder", "endpoint": endpoint, "method": method, "status": status},
+    ) or 0
+
+
+def _endpoints() -> set[str]:
+    return {
+        sample.labels["endpoint"]
+        for metric in REGISTRY.collect() if metric.name == "http_requests"
+        for sample in metric.samples
+    }
+
+
+@pytest.mark.asyncio
+async def test_labels_by_route_template(client: AsyncClient):
+    """Test parameterized paths share the route template's series."""
+    template = "/api/v1/resume/documents/{document_id}"
+    before = _requests(template, status="404")
+    for document_id in (101, 202, 303):
+        response = await client.get(f"/api/v1/resume/documents/{document_id}", headers={"X-Device-ID": "metrics"})
+        assert response.status_code == 404
+    assert _requests(template, status="404") == before + 3
+    assert not any(endpoint.endswith(("/101", "/202", "/303")) for endpoint in _endpoints())
+
+
+@pytest.mark.asyncio
+async def test_unmatched_paths_and_methods_bucketed(client: AsyncClient):
+    """Test scanner paths and odd methods do not create new series."""
+    before = _requests("unmatched", status="404")
+    for path in ("/wp-login.php", "/.env", "/admin/../etc/passwd"):
+        assert (await client.get(path)).status_code == 404
+    assert _requests("unmatched", status="404") == before + 3
+
+    before = _requests("/health", method="OTHER", status="405")
+    assert (await client.request("PROPFIND", "/health")).status_code == 405
+    assert _requests("/health", method="OTHER", status="405") == before + 1
+    assert not any("wp-login" in endpoint or ".env" in endpoint for endpoint in _endpoints())
+
+
+@pytest.mark.asyncio
+async def test_bot_visits_counted(client: AsyncClient):
+    """Test crawlers are recognised case-insensitively and counted once."""
+    def visits(bot: str) -> float:
+        return REGISTRY.get_sample_value("crawler_visits_total", {"tool": "resume-builder", "bot": bot}) or 0
+
+    before = visits("bingbot"), visits("Googlebot")
+    await client.get("/health", headers={"User-Agent": "Mozilla/5.0 (compatible; BingBot/2.0)"})
+    await client.get("/health", headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0) Firefox/120.0"})
+    assert (visits("bingbot"), visits("Googlebot")) == (before[0] + 1, before[1])
+
+
+@pytest.mark.asyncio
+async def test_middleware_overhead_benchmark():
+    """Benchmark the middleware's per-request cost over a bare ASGI app."""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def send(message):
+        pass
+
+    class Route:
+        path = "/benchmark/{item_id}"
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/benchmark/1", "route": Route(),
+        "headers": [(b"host", b"test"), (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0")],
+    }
+    wrapped = MetricsMiddleware(app)
+
+    async def run(handler, requests: int) -> float:
+        start = time.perf_counter()
+        for _ in range(requests):
+            await handler(scope, None, send)
+        return (time.perf_counter() - start) / requests
+
+    requests = 20000
+    bare = await run(app, requests)
+    measured = await run(wrapped, requests)
+    overhead = measured - bare
+    print(f"\nmetrics middleware: {overhead * 1e6:.1f} us/request over a bare app ({bare * 1e6:.1f} us)")
+    assert _requests("/benchmark/{item_id}") >= requests
+    assert overhead < 100e-6
@@ -0,0 +1,108 @@
+"""
+Multi-process metrics test: several worker processes write to a shared
+PROMETHEUS_MULTIPROC_DIR and /metrics reports their sums, before and
+after exited workers' files are archived.
+"""
+import asyncio
+import multiprocessing
+import os
+
+import pytest
+from httpx import AsyncClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from app import metrics
+
+TOOL = {"tool": "resume-builder"}
+
+
+def _worker(index: int, ready, done) -> None:
+    # Spawned with PROMETHEUS_MULTIPROC_DIR set, so this import uses mmap files.
+    from app import metrics
+
+    metrics.payment_revenue.labels(**TOOL).inc(100 * (index + 1))
+    metrics.http_requests.labels(endpoint="/health", method="GET", status=200, **TOOL).inc(index + 1)
+    metrics.http_request_duration.labels(endpoint="/health", method="GET", **TOOL).observe(0.01 * (index + 1))
+    metrics.autosave_pending.labels(**TOOL).set(index + 1)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def _run_workers(indexes: range):
+    context = multiprocessing.get_context("spawn")
+    ready, done = context.Queue(), context.Event()
+    processes = [context.Process(target=_worker, args=(i, ready, done)) for i in indexes]
+    for process in processes:
+        process.start()
+    pids = {ready.get(timeout=60) for _ in processes}
+
+    def stop():
+        done.set()
+        for process in processes:
+            process.join(timeout=30)
+            assert process.exitcode == 0
+
+    return pids, stop
+
+
+def _samples(text: str) -> dict:
+    return {
+        (sample.name, tuple(sorted((k, v) for k, v in sample.labels.items() if k != "tool"))): sample.value
+        for family in text_string_to_metric_families(text)
+        for sample in family.samples
+    }
+
+
+def _collect(path) -> dict:
+    return _samples(metrics.collect_multiprocess(str(path)).decode("utf-8"))
+
+
+HEALTH = (("endpoint", "/health"), ("method", "GET"))
+REVENUE = ("payment_revenue_cents_total", ())
+REQUESTS = ("http_requests_total", (*HEALTH, ("status", "200")))
+DURATION_COUNT = ("http_request_duration_seconds_count", HEALTH)
+DURATION_SUM = ("http_request_duration_seconds_sum", HEALTH)
+PENDING = ("autosave_pending_documents", ())
+
+
+@pytest.mark.asyncio
+async def test_workers_aggregated_and_archived(tmp_path, monkeypatch, client: AsyncClient):
+    """Test counters sum across workers and survive archiving of exited workers."""
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    pids, stop = await asyncio.to_thread(_run_workers, range(4))
+    live = _collect(tmp_path)
+    assert live[REVENUE] == 100 + 200 + 300 + 400
+    assert live[REQUESTS] == 10
+    assert live[DURATION_COUNT] == 4
+    assert live[DURATION_SUM] == pytest.approx(0.1)
+    assert live[PENDING] == 10  # livesum of the running workers
+    assert metrics.cleanup_dead_workers(str(tmp_path)) == set()
+
+    await asyncio.to_thread(stop)
+    assert metrics.cleanup_dead_workers(str(tmp_path)) == pids
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".db")) == [
+        "counter_archive.db", "histogram_archive.db",
+    ]
+    archived = _collect(tmp_path)
+    assert {key: archived[key] for key in (REVENUE, REQUESTS, DURATION_COUNT)} == {
+        REVENUE: 1000, REQUESTS: 10, DURATION_COUNT: 4,
+    }
+    assert archived[DURATION_SUM] == pytest.approx(0.1)
+    assert {k: v for k, v in archived.items() if k[0].endswith("_bucket")} == {
+        k: v for k, v in live.items() if k[0].endswith("_bucket")
+    }
+    assert PENDING not in archived
+
+    # A second generation of workers adds to the archive rather than replacing it.
+    pids, stop = await asyncio.to_thread(_run_workers, range(2))
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    response = await client.get("/metrics")
+    scraped = _samples(response.text)
+    assert scraped[REVENUE] == 1000 + 100 + 200
+    assert scraped[PENDING] == 3
+
+    await asyncio.to_thread(stop)
+    assert metrics.cleanup_dead_workers(str(tmp_path)) == pids
+    final = _collect(tmp_path)
+    assert (final[REVENUE], final[REQUESTS], final[DURATION_COUNT]) == (1300, 13, 6)
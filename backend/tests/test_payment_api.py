@@ -1,6 +1,8 @@
 import pytest
 from httpx import AsyncClient
 
+from app.api.v1 import payment
+
 
 @pytest.mark.asyncio
 async def test_get_products(client: AsyncClient):
@@ -19,6 +21,41 @@ async def test_get_products(client: AsyncClient):
     assert "generations" in product
 
 
+@pytest.mark.asyncio
+async def test_products_revalidated_with_etag(client: AsyncClient):
+    """Test the catalog carries a strong ETag and answers If-None-Match with 304."""
+    response = await client.get("/api/v1/payment/products")
+    etag = response.headers["ETag"]
+    assert not etag.startswith("W/")
+    assert "max-age" in response.headers["Cache-Control"]
+    discounts = {product["sku"]: product["discount_percent"] for product in response.json()}
+    assert discounts == {"starter_30": None, "pro_100": 29, "unlimited_monthly": 89}
+
+    cached = await client.get("/api/v1/payment/products", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    stale = await client.get("/api/v1/payment/products", headers={"If-None-Match": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == response.content
+
+
+@pytest.mark.asyncio
+async def test_products_reload(client: AsyncClient, monkeypatch):
+    """Test a reloaded catalog gets a new body and ETag."""
+    before = (await client.get("/api/v1/payment/products")).headers["ETag"]
+    monkeypatch.setitem(payment.PRODUCTS, "team_500", {"price": 1999, "generations": 500, "name": "Team Pack"})
+    try:
+        payment.reload_catalog()
+        response = await client.get("/api/v1/payment/products")
+        assert response.headers["ETag"] != before
+        assert response.json()[-1]["sku"] == "team_500"
+    finally:
+        monkeypatch.undo()
+        payment.reload_catalog()
+
+
 @pytest.mark.asyncio
 async def test_create_checkout_invalid_sku(client: AsyncClient):
     """Test checkout with invalid SKU."""
@@ -0,0 +1,118 @@
+import os
+import pytest
+from app.core.http import etag_matches
+from app.services import pdf_cache
+from app.services.pdf_cache import PDFCache, PDFFileResponse
+
+
+def test_make_key_is_canonical():
+    """Test keys ignore JSON key order but not template or watermark."""
+    key = pdf_cache.make_key({"a": 1, "b": [1, 2]}, "modern", "v1", False)
+
+    assert key == pdf_cache.make_key({"b": [1, 2], "a": 1}, "modern", "v1", False)
+    assert key != pdf_cache.make_key({"a": 1, "b": [1, 2]}, "modern", "v1", True)
+    assert key != pdf_cache.make_key({"a": 1, "b": [1, 2]}, "modern", "v2", False)
+
+
+def test_etag_weak_comparison():
+    """Test If-None-Match matching, including lists and weak validators."""
+    etag = pdf_cache.etag_for("abc")
+
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('W/"zzz", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abd"', etag)
+    assert not etag_matches(None, etag)
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_by_size(tmp_path):
+    """Test the least recently served files are evicted past the byte bound."""
+    cache = PDFCache(str(tmp_path), max_bytes=250)
+    await cache.put("a", b"x" * 100)
+    await cache.put("b", b"x" * 100)
+    assert cache.get("a") is not None  # "b" is now least recent
+
+    await cache.put("c", b"x" * 100)
+
+    assert cache.get("b") is None
+    assert not os.path.exists(cache.path_for("b"))
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.total_bytes == 200
+
+
+@pytest.mark.asyncio
+async def test_load_restores_index(tmp_path):
+    """Test files from a previous run are indexed on startup."""
+    await PDFCache(str(tmp_path), max_bytes=1000).put("kept", b"%PDF")
+
+    cache = PDFCache(str(tmp_path), max_bytes=1000)
+    cache.load()
+
+    assert cache.get("kept") == cache.path_for("kept")
+    assert cache.total_bytes == 4
+
+
+@pytest.mark.asyncio
+async def test_edited_resume_invalidates_previous_render(tmp_path):
+    """Test editing a resume drops the file rendered for the old version."""
+    cache = PDFCache(str(tmp_path), max_bytes=10_000)
+    old = cache.key_for(1, {"v": 1}, "modern", False)
+    await cache.put(old, b"%PDF old")
+    shared = cache.key_for(2, {"v": 2}, "modern", False)
+
+    assert cache.key_for(1, {"v": 1}, "modern", False) == old
+    new = cache.key_for(1, {"v": 2}, "modern", False)
+
+    assert new == shared != old
+    assert cache.get(old) is None
+    assert not os.path.exists(cache.path_for(old))
+
+
+def test_tracked_versions_are_bounded(tmp_path, monkeypatch):
+    """Test the per-resume version map forgets the least recently exported resumes."""
+    monkeypatch.setattr(PDFCache, "MAX_TRACKED_VERSIONS", 3)
+    cache = PDFCache(str(tmp_path), max_bytes=10_000)
+    for resume_id in range(10):
+        cache.key_for(resume_id, {"same": True}, "modern", False)
+
+    assert list(cache._versions) == [(7, False), (8, False), (9, False)]
+    assert dict(cache._current) == {cache.key_for(9, {"same": True}, "modern", False): 3}
+
+
+@pytest.mark.asyncio
+async def test_file_response_uses_pathsend_when_supported(tmp_path):
+    """Test the server's pathsend extension is used instead of chunked reads."""
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-1.7")
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "extensions": {"http.response.pathsend": {}}}
+    await PDFFileResponse(str(path), media_type="application/pdf", headers={"ETag": 'W/"k"'})(scope, None, send)
+
+    assert messages[1] == {"type": "http.response.pathsend", "path": str(path)}
+    headers = dict(messages[0]["headers"])
+    assert headers[b"etag"] == b'W/"k"'
+    assert headers[b"content-length"] == b"8"
+
+
+@pytest.mark.asyncio
+async def test_opened_file_response_survives_eviction(tmp_path):
+    """Test a response opened before the file is removed still sends it."""
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-1.7")
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    response = PDFFileResponse.open(str(path), media_type="application/pdf")
+    os.remove(path)
+    await response({"type": "http", "method": "GET", "extensions": {"http.response.pathsend": {}}}, None, send)
+
+    assert dict(messages[0]["headers"])[b"content-length"] == b"8"
+    assert messages[1] == {"type": "http.response.body", "body": b"%PDF-1.7", "more_body": False}
+    assert response.file.closed
@@ -0,0 +1,103 @@
+import os
+import time
+
+import pytest
+from app.services import pdf_service
+from app.services.pdf_templates import TEMPLATES, TemplateRegistry
+
+RESUME = {
+    "personalInfo": {"name": "Ada Lovelace", "title": "Engineer", "email": "ada@example.com"},
+    "experience": [{"title": "Analyst", "company": "<Engines>", "description": "• Wrote programs\n• Shipped notes"}],
+    "skills": ["Python", "Math"],
+}
+
+
+def _fake_job(template_id: str, data: dict, watermark: bool, title: str) -> bytes:
+    return f"%PDF {template_id} {data['personalInfo']['name']} {watermark}".encode()
+
+
+def _init_fake_worker(warm_up: bool) -> None:
+    pass
+
+
+def _slow_job(template_id: str, data: dict, watermark: bool, title: str) -> bytes:
+    time.sleep(10)
+    return b"%PDF"
+
+
+@pytest.fixture
+async def render_pool(monkeypatch):
+    """A single-worker pool running a stand-in for WeasyPrint."""
+    monkeypatch.setattr(pdf_service.settings, "PDF_RENDER_WORKERS", 1)
+    monkeypatch.setattr(pdf_service, "_init_worker", _init_fake_worker)
+    monkeypatch.setattr(pdf_service, "_render_job", _fake_job)
+    yield
+    await pdf_service.close_pool()
+
+
+def test_render_html_escapes_and_watermarks():
+    """Test resume JSON is rendered through the template with escaping."""
+    html = pdf_service.render_html("creative", RESUME, watermark=True)
+
+    assert "Ada Lovelace" in html
+    assert "&lt;Engines&gt;" in html
+    assert "<li>Shipped notes</li>" in html
+    assert 'class="watermark"' in html
+    assert 'class="template-creative"' in html
+    assert 'class="watermark"' not in pdf_service.render_html("unknown", RESUME, watermark=False)
+
+
+@pytest.mark.asyncio
+async def test_render_pdf_runs_in_process_pool(render_pool):
+    """Test jobs run in the pool and the queue depth returns to zero."""
+    pdf = await pdf_service.render_pdf("professional", RESUME, watermark=True)
+
+    assert pdf == b"%PDF professional Ada Lovelace True"
+    assert pdf_service._queued == 0
+
+
+@pytest.mark.asyncio
+async def test_render_pdf_timeout_replaces_pool(render_pool, monkeypatch):
+    """Test a stuck job times out and its pool is torn down."""
+    monkeypatch.setattr(pdf_service, "_render_job", _slow_job)
+    monkeypatch.setattr(pdf_service.settings, "PDF_RENDER_TIMEOUT_SECONDS", 3.0)
+    pool = pdf_service.get_pool()
+
+    with pytest.raises(pdf_service.RenderTimeout):
+        await pdf_service.render_pdf("modern", RESUME)
+
+    assert pdf_service._pool is None
+    assert pdf_service.get_pool() is not pool
+
+
+@pytest.mark.asyncio
+async def test_render_pdf_rejects_when_queue_full(render_pool, monkeypatch):
+    """Test jobs beyond the queue bound fail fast instead of piling up."""
+    monkeypatch.setattr(pdf_service.settings, "PDF_RENDER_MAX_QUEUE", 0)
+
+    with pytest.raises(pdf_service.RenderQueueFull):
+        await pdf_service.render_pdf("modern", RESUME)
+
+
+def test_registry_hot_reload(tmp_path):
+    """Test DEBUG hot reload recompiles a template whose files changed."""
+    for name in ("base.html", "base.css", "modern.html", "modern.css"):
+        (tmp_path / name).write_text("")
+    (tmp_path / "modern.html").write_text("v1 {{ resume.name }}")
+    registry = TemplateRegistry(str(tmp_path), auto_reload=True)
+    registry._templates["modern"] = registry._compile("modern")
+    version = registry.get("modern").version
+
+    (tmp_path / "modern.html").write_text("v2 {{ resume.name }}")
+    os.utime(tmp_path / "modern.html", (time.time() + 5, time.time() + 5))
+
+    assert registry.render_html("modern", {"name": "Ada"}, watermark=False) == "v2 Ada"
+    assert registry.get("modern").version != version
+
+
+def test_template_versions_are_stable():
+    """Test each template has a version the PDF cache can key on."""
+    versions = {template_id: pdf_service.template_version(template_id) for template_id in TEMPLATES}
+
+    assert len(set(versions.values())) == len(TEMPLATES)
+    assert pdf_service.template_version("unknown") == versions["modern"]
@@ -0,0 +1,137 @@
+"""
+Admin profiling tests: access control, CPU sampling, event loop stall
+detection and heap snapshot diffs.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from app.services import profiler
+
+ADMIN = {"Authorization": "Bearer admin-secret"}
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(profiler.settings, "ADMIN_TOKEN", "admin-secret")
+    yield
+    profiler.get_heap_profiler().stop()
+
+
+@pytest.mark.asyncio
+async def test_admin_token_required(client: AsyncClient, monkeypatch):
+    """Test the endpoints are hidden without a token and reject a wrong one."""
+    assert (await client.get("/api/v1/admin/profile/loop", headers=ADMIN)).status_code == 404
+
+    monkeypatch.setattr(profiler.settings, "ADMIN_TOKEN", "admin-secret")
+    response = await client.get("/api/v1/admin/profile/loop", headers={"Authorization": "Bearer guess"})
+    assert response.status_code == 401
+    assert (await client.get("/api/v1/admin/profile/loop")).status_code == 401
+    response = await client.get("/api/v1/admin/profile/cpu?seconds=3600", headers=ADMIN)
+    assert response.status_code == 400
+
+
+def _spin_for_profile(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+@pytest.mark.asyncio
+async def test_cpu_profile_collapsed_stacks(client: AsyncClient, admin):
+    """Test a busy thread shows up in the collapsed-stack profile."""
+    stop = threading.Event()
+    busy = threading.Thread(target=_spin_for_profile, args=(stop,), name="busy-worker")
+    busy.start()
+    try:
+        response = await client.get("/api/v1/admin/profile/cpu?seconds=0.3&hz=200", headers=ADMIN)
+    finally:
+        stop.set()
+        busy.join()
+
+    assert response.status_code == 200
+    samples = [line.rsplit(" ", 1) for line in response.text.splitlines()]
+    assert all(count.isdigit() for _, count in samples)
+    busy_samples = [int(count) for stack, count in samples if stack.startswith("busy-worker;")]
+    assert sum(busy_samples) > 10
+    assert all(
+        "_spin_for_profile (tests/test_profiler.py:" in stack
+        for stack, _ in samples if stack.startswith("busy-worker;")
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cpu_profile_rejected(client: AsyncClient, admin):
+    """Test only one CPU profile runs at a time."""
+    first = asyncio.create_task(client.get("/api/v1/admin/profile/cpu?seconds=0.3", headers=ADMIN))
+    await asyncio.sleep(0.05)
+    second = await client.get("/api/v1/admin/profile/cpu?seconds=0.1", headers=ADMIN)
+
+    assert second.status_code == 409
+    assert (await first).status_code == 200
+
+
+async def _blocking_handler() -> None:
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_loop_stall_logged_with_task(client: AsyncClient, admin, monkeypatch, caplog):
+    """Test a blocking coroutine is reported with its stack while it blocks."""
+    def stalls() -> float:
+        return REGISTRY.get_sample_value("event_loop_stalls_total", {"tool": "resume-builder"}) or 0
+
+    def lag_count() -> float:
+        return REGISTRY.get_sample_value("event_loop_lag_seconds_count", {"tool": "resume-builder"}) or 0
+
+    monkeypatch.setattr(profiler.settings, "LOOP_MONITOR_INTERVAL_SECONDS", 0.02)
+    monkeypatch.setattr(profiler.settings, "SLOW_CALLBACK_SECONDS", 0.1)
+    before = stalls(), lag_count()
+    monitor = await profiler.start_monitor()
+    try:
+        await asyncio.sleep(0.1)
+        with caplog.at_level(logging.WARNING, logger="app.services.profiler"):
+            await asyncio.create_task(_blocking_handler(), name="slow-request")
+            await asyncio.sleep(0.05)
+        response = await client.get("/api/v1/admin/profile/loop", headers=ADMIN)
+    finally:
+        await profiler.stop_monitor()
+
+    assert stalls() == before[0] + 1
+    assert lag_count() > before[1]
+    [stall] = monitor.stalls
+    assert "slow-request" in stall.task and "_blocking_handler" in stall.task
+    assert "time.sleep(0.3)" in stall.stack
+    assert any("Event loop blocked" in record.message for record in caplog.records)
+    assert response.json()["stalls"][0]["task"] == stall.task
+
+
+def _allocate_for_profile() -> list:
+    return [bytearray(1024) for _ in range(2000)]
+
+
+@pytest.mark.asyncio
+async def test_heap_snapshot_diff(client: AsyncClient, admin):
+    """Test a diff between snapshots points at the allocating line."""
+    base = (await client.post("/api/v1/admin/profile/heap/snapshots", headers=ADMIN)).json()
+    retained = _allocate_for_profile()
+    target = (await client.post("/api/v1/admin/profile/heap/snapshots?top=5", headers=ADMIN)).json()
+
+    assert target["id"] == base["id"] + 1
+    assert len(target["top"]) == 5
+    response = await client.get(
+        f"/api/v1/admin/profile/heap/snapshots/{base['id']}/diff/{target['id']}?top=3", headers=ADMIN
+    )
+    top = response.json()["stats"][0]
+    assert top["site"].endswith(f"test_profiler.py:{_allocate_for_profile.__code__.co_firstlineno + 1}")
+    assert top["size_diff_bytes"] >= 2000 * 1024
+    assert top["count_diff"] >= 2000
+    del retained
+
+    missing = await client.get(f"/api/v1/admin/profile/heap/snapshots/{base['id']}/diff/999", headers=ADMIN)
+    assert missing.status_code == 404
+    assert (await client.delete("/api/v1/admin/profile/heap", headers=ADMIN)).status_code == 204
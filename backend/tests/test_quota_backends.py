@@ -0,0 +1,187 @@
+"""
+Quota backend tests, including a multi-process load test of the Redis
+backend against the fake RESP server.
+"""
+import asyncio
+import multiprocessing
+import random
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.database import Base, create_engine_for
+from app.core.redis import create_client
+from app.models.token import GenerationToken
+from app.services import quota, token_service
+from tests.conftest import test_async_session
+from tests.fake_redis import FakeRedisServer
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+async def redis_backend(redis_server, monkeypatch):
+    backend = quota.RedisQuotaBackend(create_client(redis_server.url))
+    monkeypatch.setattr(quota, "_backend", backend)
+    yield backend
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_sql_grant_keeps_concurrent_debit(db_session: AsyncSession):
+    """Test a purchase doesn't overwrite a reservation taken after the balance was loaded."""
+    await token_service.add_tokens(db_session, "racing", 5)
+    token = await token_service.get_or_create_token(db_session, "racing")
+    assert token.tokens_remaining == 5
+
+    async with test_async_session() as other:
+        assert (await token_service.reserve_generations(other, "racing")).paid == 1
+
+    assert await token_service.add_tokens(db_session, "racing", 10) == 14
+    assert await token_service.get_balance(db_session, "racing") == 14
+
+
+@pytest.mark.asyncio
+async def test_redis_grant_survives_redis_failure(db_session: AsyncSession, redis_server, redis_backend, monkeypatch):
+    """Test a grant committed to the DB reaches Redis exactly once after a failed sync."""
+    assert await token_service.get_balance(db_session, "flaky") == 0
+    pipeline = redis_backend.client.pipeline
+
+    def broken():
+        raise ConnectionError("Redis went away")
+
+    monkeypatch.setattr(redis_backend.client, "pipeline", broken)
+    with pytest.raises(ConnectionError):
+        await token_service.add_tokens(db_session, "flaky", 5)
+    monkeypatch.setattr(redis_backend.client, "pipeline", pipeline)
+
+    token = await token_service.get_or_create_token(db_session, "flaky")
+    assert (token.tokens_remaining, token.total_purchased) == (5, 5)
+    assert await token_service.get_balance(db_session, "flaky") == 5
+
+    # Another process syncing the same device doesn't apply it again.
+    other = quota.RedisQuotaBackend(create_client(redis_server.url))
+    assert await other.get_balance(db_session, "flaky") == 5
+    await other.close()
+    assert await token_service.add_tokens(db_session, "flaky", 2) == 7
+
+
+@pytest.mark.asyncio
+async def test_redis_balance_seeded_from_database(db_session: AsyncSession, redis_backend):
+    """Test existing DB balances carry over when switching to Redis."""
+    db_session.add(GenerationToken(device_id="seeded", tokens_remaining=7))
+    await db_session.commit()
+
+    assert await token_service.get_balance(db_session, "seeded") == 7
+    balance = await token_service.add_tokens(db_session, "seeded", 3)
+
+    assert balance == 10
+    token = await token_service.get_or_create_token(db_session, "seeded")
+    assert token.total_purchased == 3
+
+
+@pytest.mark.asyncio
+async def test_redis_reserve_paid_then_free(db_session: AsyncSession, redis_backend):
+    """Test Redis reservations drain paid tokens first and stop at the free limit."""
+    await token_service.add_tokens(db_session, "mixed", 2)
+
+    reservation = await token_service.reserve_generations(db_session, "mixed", 4)
+    assert (reservation.paid, reservation.free, reservation.source) == (2, 2, "mixed")
+    await token_service.confirm_generations(db_session, reservation)
+
+    assert await token_service.reserve_generations(db_session, "mixed", 4) is None
+    assert await token_service.get_balance(db_session, "mixed") == 0
+    assert await token_service.get_daily_usage(db_session, "mixed") == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_partial_release_and_expiry(db_session: AsyncSession, redis_backend, monkeypatch):
+    """Test released units are refunded once, and the remainder still expires."""
+    monkeypatch.setattr(quota.settings, "RESERVATION_TTL_SECONDS", -1)
+    await token_service.add_tokens(db_session, "held", 3)
+    reservation = await token_service.reserve_generations(db_session, "held", 3)
+
+    await token_service.release_generations(db_session, reservation, 1)
+    assert await token_service.get_balance(db_session, "held") == 1
+    assert await token_service.expire_reservations(db_session) == 1
+    assert await token_service.get_balance(db_session, "held") == 3
+
+    # The request finishing late must not refund the expired units again.
+    await token_service.release_generations(db_session, reservation)
+    assert await token_service.get_balance(db_session, "held") == 3
+
+
+DEVICES = [f"load-{i}" for i in range(3)]
+PAID = 20
+WORKERS = 4
+ATTEMPTS = 15
+
+
+async def _load(db_url: str, redis_url: str, seed: int) -> dict[str, int]:
+    engine = create_engine_for(db_url)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    backend = quota.RedisQuotaBackend(create_client(redis_url))
+    rng = random.Random(seed)
+    confirmed = dict.fromkeys(DEVICES, 0)
+
+    async def generate(device_id: str):
+        async with session_factory() as db:
+            reservation = await backend.reserve(db, device_id, 1)
+            if reservation is None:
+                return
+            await asyncio.sleep(rng.random() / 100)
+            if rng.random() < 0.25:
+                await backend.release(db, reservation, reservation.paid, reservation.free)
+            else:
+                await backend.confirm(db, reservation)
+                confirmed[device_id] += 1
+
+    await asyncio.gather(*(generate(device) for device in DEVICES for _ in range(ATTEMPTS)))
+    await backend.close()
+    await engine.dispose()
+    return confirmed
+
+
+def _worker(db_url: str, redis_url: str, seed: int) -> dict[str, int]:
+    return asyncio.run(_load(db_url, redis_url, seed))
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_multi_process_load(redis_server, tmp_path):
+    """Test several worker processes sharing Redis never overspend a quota."""
+    db_url = f"sqlite+aiosqlite:///{tmp_path / 'quota.db'}"
+    engine = create_async_engine(db_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add_all(GenerationToken(device_id=d, tokens_remaining=PAID) for d in DEVICES)
+        await db.commit()
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(WORKERS) as pool:
+        results = await asyncio.to_thread(
+            pool.starmap, _worker, [(db_url, redis_server.url, seed) for seed in range(WORKERS)]
+        )
+
+    backend = quota.RedisQuotaBackend(create_client(redis_server.url))
+    limit = quota.settings.FREE_DAILY_GENERATIONS
+    async with session_factory() as db:
+        for device in DEVICES:
+            confirmed = sum(result[device] for result in results)
+            balance = await backend.get_balance(db, device)
+            used = await backend.get_daily_usage(db, device)
+            assert 0 <= balance and used <= limit
+            assert confirmed == (PAID - balance) + used
+        stored = (await db.execute(select(GenerationToken.tokens_remaining))).scalars().all()
+    await backend.close()
+    await engine.dispose()
+
+    assert stored == [PAID] * len(DEVICES)
+    assert redis_server.zsets.get(quota.RedisQuotaBackend.RESERVATIONS, {}) == {}
@@ -0,0 +1,87 @@
+"""
+Concurrency stress test for generation quota accounting.
+"""
+import asyncio
+from typing import AsyncGenerator
+from unittest.mock import patch, AsyncMock
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.main import app
+from app.core.database import Base, create_engine_for, get_db
+from app.models import GenerationToken, DailyUsage
+from app.services import token_service
+
+PAID_TOKENS = 50
+REQUESTS = 200
+
+
+@pytest.fixture
+async def file_db(tmp_path):
+    """A file-backed database so each request gets its own connection and transaction."""
+    engine = create_engine_for(f"sqlite+aiosqlite:///{tmp_path / 'stress.db'}")
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async def override() -> AsyncGenerator[AsyncSession, None]:
+        async with session_factory() as session:
+            yield session
+
+    previous = app.dependency_overrides[get_db]
+    app.dependency_overrides[get_db] = override
+    yield session_factory
+    app.dependency_overrides[get_db] = previous
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+@patch("app.services.llm_service.generate_resume_content", new_callable=AsyncMock)
+async def test_parallel_generations_account_exactly(mock_generate, file_db):
+    """Test hundreds of parallel generations for one device never overspend."""
+    device_id = "stress-device"
+    calls = {"n": 0}
+
+    async def generate(**kwargs):
+        calls["n"] += 1
+        await asyncio.sleep(0.001)
+        if calls["n"] % 7 == 0:
+            raise Exception("upstream error")
+        return "• Content"
+    mock_generate.side_effect = generate
+
+    async with file_db() as db:
+        await token_service.add_tokens(db, device_id, PAID_TOKENS)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(*(
+            client.post(
+                "/api/v1/resume/generate",
+                headers={"X-Device-Id": device_id},
+                json={"job_title": "Engineer", "section": "experience"}
+            )
+            for _ in range(REQUESTS)
+        ))
+
+    statuses = [r.status_code for r in responses]
+    assert set(statuses) <= {200, 402, 500}
+    succeeded = statuses.count(200)
+
+    async with file_db() as db:
+        token = (await db.execute(
+            select(GenerationToken).where(GenerationToken.device_id == device_id)
+        )).scalar_one()
+        usage = (await db.execute(
+            select(DailyUsage).where(DailyUsage.device_id == device_id)
+        )).scalar_one()
+
+    free_limit = token_service.settings.FREE_DAILY_GENERATIONS
+    assert token.tokens_remaining >= 0
+    assert token.reserved == 0 and usage.reserved == 0
+    assert 0 <= usage.generations_used <= free_limit
+    assert succeeded == (PAID_TOKENS - token.tokens_remaining) + usage.generations_used
+    assert succeeded <= PAID_TOKENS + free_limit
@@ -1,6 +1,10 @@
+import os
 import pytest
 from httpx import AsyncClient
 from unittest.mock import patch, AsyncMock
+from app.models import Resume
+from app.services import pdf_cache, pdf_service
+from tests.conftest import test_async_session as session_factory
 
 
 @pytest.mark.asyncio
@@ -89,3 +93,257 @@ async def test_generate_cover_letter(mock_generate, client: AsyncClient):
     assert response.status_code == 200
     data = response.json()
     assert "content" in data
+
+
+async def fake_stream(*args, **kwargs):
+    for chunk in ["• Led ", "a team ", "of 5"]:
+        yield chunk
+
+
+async def failing_stream(*args, **kwargs):
+    yield "• Partial"
+    raise Exception("upstream reset")
+
+
+@pytest.mark.asyncio
+@patch("app.services.llm_service.stream_resume_content", new=fake_stream)
+async def test_generate_content_stream(client: AsyncClient):
+    """Test streaming generation relays chunks and charges once on completion."""
+    response = await client.post(
+        "/api/v1/resume/generate/stream",
+        headers={"X-Device-Id": "test-device-stream"},
+        json={"job_title": "Engineer", "section": "experience", "language": "en"}
+    )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert 'data: {"content": "• Led "}' in response.text
+    assert "event: done" in response.text
+    
+    status = await client.get("/api/v1/resume/tokens", headers={"X-Device-Id": "test-device-stream"})
+    assert status.json()["daily_used"] == 1
+
+
+@pytest.mark.asyncio
+@patch("app.services.llm_service.stream_cover_letter", new=failing_stream)
+async def test_cover_letter_stream_failure_is_not_charged(client: AsyncClient):
+    """Test a failed stream emits an error event and consumes no generation."""
+    response = await client.post(
+        "/api/v1/resume/cover-letter/stream",
+        headers={"X-Device-Id": "test-device-stream-fail"},
+        json={
+            "job_title": "Engineer",
+            "company": "Tech Corp",
+            "resume_summary": "Experienced engineer...",
+            "language": "en"
+        }
+    )
+    
+    assert response.status_code == 200
+    assert "event: error" in response.text
+    assert "event: done" not in response.text
+    
+    status = await client.get("/api/v1/resume/tokens", headers={"X-Device-Id": "test-device-stream-fail"})
+    assert status.json()["daily_used"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_disconnect_closes_upstream_without_charging(db_session):
+    """Test closing the SSE body early closes the LLM stream and refunds the generation."""
+    from app.api.v1.resume import _stream_generation
+    from app.services import token_service
+    
+    closed = []
+    
+    async def upstream():
+        try:
+            yield "first"
+            yield "second"
+        finally:
+            closed.append(True)
+    
+    reservation = await token_service.reserve_generations(db_session, "test-device-disconnect")
+    assert await token_service.get_daily_usage(db_session, "test-device-disconnect") == 1
+    
+    body = _stream_generation(upstream(), "generate", reservation, session_factory)
+    assert "first" in await body.__anext__()
+    await body.aclose()
+    
+    assert closed == [True]
+    assert await token_service.get_daily_usage(db_session, "test-device-disconnect") == 0
+
+
+@pytest.mark.asyncio
+@patch("app.services.llm_service.generate_resume_content", new_callable=AsyncMock)
+async def test_generate_batch_partial_failure(mock_generate, client: AsyncClient):
+    """Test batch generation returns partial results and charges only successes."""
+    async def generate(job_title, section, context, language):
+        if section == "skills":
+            raise Exception("upstream timeout")
+        return f"{section} content"
+    mock_generate.side_effect = generate
+    
+    response = await client.post(
+        "/api/v1/resume/generate-batch",
+        headers={"X-Device-Id": "test-device-batch"},
+        json={"job_title": "Engineer", "sections": ["experience", "summary", "skills"]}
+    )
+    
+    assert response.status_code == 200
+    results = {r["section"]: r for r in response.json()["results"]}
+    assert results["summary"]["content"] == "summary content"
+    assert results["skills"]["content"] is None
+    assert "upstream timeout" in results["skills"]["error"]
+    
+    status = await client.get("/api/v1/resume/tokens", headers={"X-Device-Id": "test-device-batch"})
+    assert status.json()["daily_used"] == 2
+
+
+@pytest.mark.asyncio
+@patch("app.services.llm_service.generate_resume_content", new_callable=AsyncMock)
+async def test_generate_batch_respects_concurrency_cap(mock_generate, client: AsyncClient, monkeypatch):
+    """Test sections are fanned out but never above the configured cap."""
+    import asyncio
+    from app.api.v1 import resume
+    monkeypatch.setattr(resume.settings, "LLM_BATCH_CONCURRENCY", 2)
+    active = {"now": 0, "peak": 0}
+    
+    async def generate(**kwargs):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return "content"
+    mock_generate.side_effect = generate
+    
+    response = await client.post(
+        "/api/v1/resume/generate-batch",
+        headers={"X-Device-Id": "test-device-batch-cap"},
+        json={"job_title": "Engineer", "sections": ["experience", "summary", "skills", "improve"]}
+    )
+    
+    assert response.status_code == 200
+    assert active["peak"] == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_batch_insufficient_generations(client: AsyncClient):
+    """Test batch larger than the remaining allowance is rejected up front."""
+    response = await client.post(
+        "/api/v1/resume/generate-batch",
+        headers={"X-Device-Id": "test-device-batch-402"},
+        json={"job_title": "Engineer", "sections": ["experience"] * 6}
+    )
+    
+    assert response.status_code == 402
+    assert isinstance(response.json()["detail"], str)
+
+
+@pytest.fixture
+def pdf_cache_dir(tmp_path, monkeypatch):
+    """Keep rendered PDFs in a temporary cache directory."""
+    monkeypatch.setattr(pdf_cache, "_cache", pdf_cache.PDFCache(str(tmp_path), 1024 * 1024))
+    return tmp_path
+
+
+async def _save_resume(device_id: str) -> int:
+    async with session_factory() as db:
+        resume = Resume(device_id=device_id, template_id="minimalist", data={"personalInfo": {"name": "Ada"}})
+        db.add(resume)
+        await db.commit()
+        return resume.id
+
+
+@pytest.mark.asyncio
+@patch("app.services.pdf_service.render_pdf", new_callable=AsyncMock)
+async def test_export_pdf(mock_render, client: AsyncClient, pdf_cache_dir):
+    """Test a saved resume is rendered with its template, watermarked for free users."""
+    mock_render.return_value = b"%PDF-1.7 fake"
+    resume_id = await _save_resume("pdf-device")
+
+    response = await client.get(f"/api/v1/resume/{resume_id}/export.pdf", headers={"X-Device-Id": "pdf-device"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content == b"%PDF-1.7 fake"
+    args, kwargs = mock_render.call_args
+    assert args == ("minimalist", {"personalInfo": {"name": "Ada"}})
+    assert kwargs["watermark"] is True
+
+
+@pytest.mark.asyncio
+async def test_export_pdf_other_device_not_found(client: AsyncClient):
+    """Test a resume cannot be exported by another device."""
+    resume_id = await _save_resume("owner-device")
+
+    response = await client.get(f"/api/v1/resume/{resume_id}/export.pdf", headers={"X-Device-Id": "someone-else"})
+
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+@patch("app.services.pdf_service.render_pdf", new_callable=AsyncMock)
+async def test_export_pdf_busy(mock_render, client: AsyncClient, pdf_cache_dir):
+    """Test a full render queue maps to 503 with Retry-After."""
+    mock_render.side_effect = pdf_service.RenderQueueFull("full")
+    resume_id = await _save_resume("busy-device")
+
+    response = await client.get(f"/api/v1/resume/{resume_id}/export.pdf", headers={"X-Device-Id": "busy-device"})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+
+@pytest.mark.asyncio
+@patch("app.services.pdf_service.render_pdf", new_callable=AsyncMock)
+async def test_export_pdf_served_from_cache(mock_render, client: AsyncClient, pdf_cache_dir):
+    """Test repeat downloads skip rendering and honour If-None-Match."""
+    mock_render.return_value = b"%PDF-1.7 cached"
+    resume_id = await _save_resume("cache-device")
+    url = f"/api/v1/resume/{resume_id}/export.pdf"
+    headers = {"X-Device-Id": "cache-device"}
+
+    first = await client.get(url, headers=headers)
+    second = await client.get(url, headers=headers)
+    revalidated = await client.get(url, headers={**headers, "If-None-Match": first.headers["etag"]})
+
+    assert mock_render.await_count == 1
+    assert second.content == b"%PDF-1.7 cached"
+    assert second.headers["etag"] == first.headers["etag"]
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+    async with session_factory() as db:
+        resume = await db.get(Resume, resume_id)
+        resume.data = {"personalInfo": {"name": "Ada L."}}
+        await db.commit()
+
+    edited = await client.get(url, headers={**headers, "If-None-Match": first.headers["etag"]})
+    assert edited.status_code == 200
+    assert edited.headers["etag"] != first.headers["etag"]
+    assert mock_render.await_count == 2
+
+
+@pytest.mark.asyncio
+@patch("app.services.pdf_service.render_pdf", new_callable=AsyncMock)
+async def test_export_pdf_rerenders_file_evicted_after_lookup(mock_render, client: AsyncClient, pdf_cache_dir, monkeypatch):
+    """Test a cached file removed between the lookup and the send is rendered again."""
+    mock_render.return_value = b"%PDF-1.7 evicted"
+    resume_id = await _save_resume("evicted-device")
+    url = f"/api/v1/resume/{resume_id}/export.pdf"
+    headers = {"X-Device-Id": "evicted-device"}
+    await client.get(url, headers=headers)
+    cache = pdf_cache.get_cache()
+    lookup = cache.get
+
+    def get_then_evict(key):
+        path = lookup(key)
+        os.remove(path)
+        return path
+
+    monkeypatch.setattr(cache, "get", get_then_evict)
+    response = await client.get(url, headers=headers)
+
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1.7 evicted"
+    assert mock_render.await_count == 2
@@ -0,0 +1,133 @@
+"""
+Queries-per-generation benchmark for the token service hot path.
+
+Run with ``pytest -s`` to print the before/after statement counts.
+"""
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.resume import DailyUsage
+from app.models.token import GenerationToken
+from app.services import token_service
+from tests.conftest import test_engine
+
+
+@contextmanager
+def count_statements():
+    """Count SQL statements (including COMMIT) issued on the test engine."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def on_commit(conn):
+        statements.append("COMMIT")
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(test_engine.sync_engine, "commit", on_commit)
+    try:
+        yield statements
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(test_engine.sync_engine, "commit", on_commit)
+
+
+async def legacy_generation(db: AsyncSession, device_id: str):
+    """The pre-reservation flow: can_generate, use_generation, get_or_create_token.
+    
+    Spelled out with ORM queries as the old service issued them, since those
+    helpers now go through the quota backend.
+    """
+    today = date.today().isoformat()
+
+    async def load_token():
+        return await token_service.get_or_create_token(db, device_id)
+
+    async def load_usage():
+        result = await db.execute(
+            select(DailyUsage).where(DailyUsage.device_id == device_id, DailyUsage.date == today)
+        )
+        return result.scalar_one_or_none()
+
+    # can_generate
+    if (await load_token()).tokens_remaining <= 0:
+        await load_usage()
+    # use_generation
+    token = await load_token()
+    if token.tokens_remaining > 0:
+        token.tokens_remaining -= 1
+        await db.commit()
+    else:
+        await load_usage()
+        usage = await load_usage()
+        if usage:
+            usage.generations_used += 1
+        else:
+            db.add(DailyUsage(device_id=device_id, date=today, generations_used=1))
+        await db.commit()
+    await load_token()
+
+
+def queries(statements: list[str]) -> int:
+    return sum(1 for s in statements if s != "COMMIT")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("paid", [True, False], ids=["paid", "free"])
+async def test_queries_per_generation(db_session: AsyncSession, paid: bool):
+    """Benchmark DB round trips per generation before and after the redesign."""
+    label = "paid" if paid else "free"
+    legacy, device = f"bench-legacy-{label}", f"bench-reserve-{label}"
+    if paid:
+        await token_service.add_tokens(db_session, legacy, 10)
+        await token_service.add_tokens(db_session, device, 10)
+    else:
+        await token_service.get_or_create_token(db_session, legacy)
+
+    with count_statements() as before:
+        await legacy_generation(db_session, legacy)
+    with count_statements() as after:
+        reservation = await token_service.reserve_generations(db_session, device)
+    with count_statements() as settle:
+        await token_service.confirm_generations(db_session, reservation)
+
+    assert reservation is not None and reservation.source == label
+    print(
+        f"\n[{label}] queries/generation: before={queries(before)} "
+        f"(+{before.count('COMMIT')} commits), after={queries(after)} "
+        f"(+{after.count('COMMIT')} commits), confirm={queries(settle)}"
+    )
+    assert queries(after) + queries(settle) <= 2
+    assert after.count("COMMIT") == 1
+    assert queries(after) + queries(settle) < queries(before)
+
+
+@pytest.mark.asyncio
+async def test_batch_reserves_paid_units_in_one_statement(db_session: AsyncSession):
+    """Test a batch costs one statement when paid tokens cover it, and stays bounded when they don't."""
+    await token_service.add_tokens(db_session, "bench-batch", 12)
+
+    with count_statements() as covered:
+        full = await token_service.reserve_generations(db_session, "bench-batch", 10)
+    with count_statements() as partial:
+        mixed = await token_service.reserve_generations(db_session, "bench-batch", 5)
+
+    assert (full.paid, full.free, full.tokens_remaining) == (10, 0, 2)
+    assert (mixed.paid, mixed.free, mixed.tokens_remaining) == (2, 3, 0)
+    assert queries(covered) == 1
+    assert queries(partial) <= 4
+
+
+@pytest.mark.asyncio
+async def test_unhinted_paid_device_still_spends_paid_first(db_session: AsyncSession):
+    """Test a device whose tokens were granted elsewhere is charged paid tokens, not free ones."""
+    db_session.add(GenerationToken(device_id="granted-elsewhere", tokens_remaining=2))
+    await db_session.commit()
+
+    reservation = await token_service.reserve_generations(db_session, "granted-elsewhere")
+
+    assert (reservation.paid, reservation.free) == (1, 0)
+    assert await token_service.get_daily_usage(db_session, "granted-elsewhere") == 0
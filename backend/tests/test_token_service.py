@@ -103,3 +103,110 @@ async def test_use_generation_free(db_session: AsyncSession):
     # Check daily usage
     usage = await token_service.get_daily_usage(db_session, device_id)
     assert usage == 1
+
+
+@pytest.mark.asyncio
+async def test_reserve_generations_paid_then_free(db_session: AsyncSession):
+    """Test reservations use paid tokens first, then the free tier."""
+    device_id = "batch-debit-device"
+    await token_service.add_tokens(db_session, device_id, 2)
+    
+    reservation = await token_service.reserve_generations(db_session, device_id, 3)
+    
+    assert (reservation.paid, reservation.free) == (2, 1)
+    assert reservation.source == "mixed"
+    token = await token_service.get_or_create_token(db_session, device_id)
+    assert token.tokens_remaining == 0
+    assert await token_service.get_daily_usage(db_session, device_id) == 1
+
+
+@pytest.mark.asyncio
+async def test_reserve_generations_is_all_or_nothing(db_session: AsyncSession):
+    """Test a reservation larger than the allowance debits nothing."""
+    device_id = "over-reserve-device"
+    
+    reservation = await token_service.reserve_generations(db_session, device_id, 6)
+    
+    assert reservation is None
+    assert await token_service.get_daily_usage(db_session, device_id) == 0
+
+
+@pytest.mark.asyncio
+async def test_release_generations_refunds(db_session: AsyncSession):
+    """Test releasing a reservation restores paid and free allowances."""
+    device_id = "release-device"
+    await token_service.add_tokens(db_session, device_id, 1)
+    reservation = await token_service.reserve_generations(db_session, device_id, 2)
+    
+    await token_service.release_generations(db_session, reservation)
+    
+    assert await token_service.get_daily_usage(db_session, device_id) == 0
+    token = await token_service.get_or_create_token(db_session, device_id)
+    await db_session.refresh(token)
+    assert token.tokens_remaining == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_reservations_are_refunded(db_session: AsyncSession, monkeypatch):
+    """Test reservations never confirmed (e.g. crashed worker) are refunded after the TTL."""
+    monkeypatch.setattr(token_service.settings, "RESERVATION_TTL_SECONDS", -1)
+    await token_service.add_tokens(db_session, "crashed-device", 1)
+    await token_service.reserve_generations(db_session, "crashed-device", 2)
+    confirmed = await token_service.reserve_generations(db_session, "confirmed-device")
+    await token_service.confirm_generations(db_session, confirmed)
+    
+    expired = await token_service.expire_reservations(db_session)
+    
+    assert expired == 2
+    assert await token_service.get_daily_usage(db_session, "crashed-device") == 0
+    assert await token_service.get_daily_usage(db_session, "confirmed-device") == 1
+    token = await token_service.get_or_create_token(db_session, "crashed-device")
+    await db_session.refresh(token)
+    assert token.tokens_remaining == 1
+    assert token.reserved == 0
+
+
+@pytest.mark.asyncio
+async def test_late_confirm_after_expiry_is_ignored(db_session: AsyncSession, monkeypatch):
+    """Test settling an expired reservation does not touch units held by a newer one."""
+    device_id = "late-confirm-device"
+    await token_service.add_tokens(db_session, device_id, 1)
+    monkeypatch.setattr(token_service.settings, "RESERVATION_TTL_SECONDS", -1)
+    stale = await token_service.reserve_generations(db_session, device_id, 2)
+    await token_service.expire_reservations(db_session)
+    monkeypatch.setattr(token_service.settings, "RESERVATION_TTL_SECONDS", 600)
+    current = await token_service.reserve_generations(db_session, device_id, 2)
+    assert (current.paid, current.free) == (1, 1)
+
+    await token_service.confirm_generations(db_session, stale)
+    await token_service.release_generations(db_session, current)
+
+    assert await token_service.get_daily_usage(db_session, device_id) == 0
+    token = await token_service.get_or_create_token(db_session, device_id)
+    await db_session.refresh(token)
+    assert (token.tokens_remaining, token.reserved) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_compact_daily_usage(db_session: AsyncSession):
+    """Test old per-device rows are folded into daily totals and removed."""
+    from datetime import date, timedelta
+    from sqlalchemy import select
+    from app.models.resume import DailyUsage, DailyUsageArchive
+    
+    old = (date.today() - timedelta(days=40)).isoformat()
+    db_session.add_all([
+        DailyUsage(device_id="old-1", date=old, generations_used=2),
+        DailyUsage(device_id="old-2", date=old, generations_used=3),
+    ])
+    await db_session.commit()
+    await token_service.increment_daily_usage(db_session, "recent-device")
+    
+    removed = await token_service.compact_daily_usage(db_session, keep_days=30)
+    
+    assert removed == 2
+    archive = (await db_session.execute(
+        select(DailyUsageArchive).where(DailyUsageArchive.date == old)
+    )).scalar_one()
+    assert (archive.devices, archive.generations_used) == (2, 5)
+    assert await token_service.get_daily_usage(db_session, "recent-device") == 1
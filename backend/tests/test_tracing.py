@@ -0,0 +1,131 @@
+"""
+Request tracing tests: the Server-Timing breakdown of /resume/generate,
+JSONL and OTLP export, and the cost of spans when tracing is off.
+"""
+import json
+import time
+
+import httpx
+import pytest
+from httpx import AsyncClient
+
+from app.core import tracing
+from app.services import llm_service
+
+GENERATE = {"job_title": "Engineer", "section": "experience", "language": "en"}
+
+
+@pytest.fixture
+async def llm_upstream(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": "• Shipped"}}]})
+
+    client = httpx.AsyncClient(base_url="http://llm-proxy.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_service, "_client", client)
+    yield
+    await client.aclose()
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    monkeypatch.setattr(tracing.settings, "TRACING_ENABLED", True)
+    monkeypatch.setattr(tracing.settings, "TRACING_EXPORTER", "")
+    tracing._queue.clear()
+    yield
+    tracing._queue.clear()
+
+
+def _timings(header: str) -> dict[str, float]:
+    entries = (entry.strip().split(";dur=") for entry in header.split(","))
+    return {name: float(duration) for name, duration in entries}
+
+
+@pytest.mark.asyncio
+async def test_generate_server_timing(client: AsyncClient, llm_upstream, traced):
+    """Test /resume/generate reports its reserve, LLM and confirm phases."""
+    response = await client.post("/api/v1/resume/generate", headers={"X-Device-Id": "traced"}, json=GENERATE)
+
+    assert response.status_code == 200
+    timings = _timings(response.headers["Server-Timing"])
+    assert list(timings) == ["reserve", "llm", "confirm", "total"]
+    assert timings["total"] >= timings["reserve"] + timings["llm"] + timings["confirm"]
+
+
+@pytest.mark.asyncio
+async def test_disabled_tracing_adds_nothing(client: AsyncClient, llm_upstream):
+    """Test no header or spans are produced with tracing off."""
+    response = await client.post("/api/v1/resume/generate", headers={"X-Device-Id": "untraced"}, json=GENERATE)
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert tracing.span("llm") is tracing._NOOP
+    assert not tracing._queue
+
+
+@pytest.mark.asyncio
+async def test_jsonl_export(client: AsyncClient, llm_upstream, traced, tmp_path, monkeypatch):
+    """Test a request's spans are written as one linked trace."""
+    path = tmp_path / "traces" / "spans.jsonl"
+    monkeypatch.setattr(tracing.settings, "TRACING_EXPORTER", "jsonl")
+    monkeypatch.setattr(tracing.settings, "TRACING_JSONL_PATH", str(path))
+
+    await client.post("/api/v1/resume/generate", headers={"X-Device-Id": "exported"}, json=GENERATE)
+    assert await tracing.export_pending() == 4
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    root = next(span for span in spans if span["parent_id"] is None)
+    assert root["name"] == "POST /api/v1/resume/generate"
+    assert root["attributes"] == {"http.method": "POST", "http.status_code": 200}
+    assert {span["trace_id"] for span in spans} == {root["trace_id"]}
+    children = {span["name"]: span for span in spans if span is not root}
+    assert set(children) == {"reserve", "llm", "confirm"}
+    assert {span["parent_id"] for span in children.values()} == {root["span_id"]}
+    assert children["llm"]["attributes"] == {"section": "experience"}
+    assert root["start_unix_nano"] <= children["reserve"]["start_unix_nano"]
+
+
+@pytest.mark.asyncio
+async def test_otlp_export(client: AsyncClient, llm_upstream, traced, monkeypatch):
+    """Test spans are posted to the collector as OTLP/HTTP JSON."""
+    received = []
+
+    def collector(request: httpx.Request) -> httpx.Response:
+        received.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(200, json={})
+
+    monkeypatch.setattr(tracing.settings, "TRACING_EXPORTER", "otlp")
+    monkeypatch.setattr(tracing, "_client", httpx.AsyncClient(transport=httpx.MockTransport(collector)))
+
+    await client.post("/api/v1/resume/generate", headers={"X-Device-Id": "otlp"}, json=GENERATE)
+    await tracing.shutdown()
+
+    url, payload = received[0]
+    assert url == "http://localhost:4318/v1/traces"
+    resource = payload["resourceSpans"][0]
+    assert resource["resource"]["attributes"][0]["value"] == {"stringValue": "resume-builder"}
+    spans = resource["scopeSpans"][0]["spans"]
+    server = [span for span in spans if span["kind"] == 2]
+    assert len(server) == 1 and "parentSpanId" not in server[0]
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in server[0]["attributes"]
+    assert all(len(span["traceId"]) == 32 and len(span["spanId"]) == 16 for span in spans)
+    assert all(int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"]) for span in spans)
+    assert tracing._client is None
+
+
+def test_disabled_span_overhead_benchmark():
+    """Benchmark a span when tracing is off against an empty block."""
+    iterations = 200000
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    empty = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with tracing.span("llm", section="skills"):
+            pass
+    disabled = (time.perf_counter() - start) / iterations
+
+    print(f"\ndisabled span: {(disabled - empty) * 1e9:.0f} ns per span")
+    assert disabled - empty < 2e-6
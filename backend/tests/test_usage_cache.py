@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.resume import DailyUsage
+from app.services import token_service, usage_cache
+from app.services.usage_cache import DailyUsageCache
+from tests.conftest import test_async_session as session_factory
+
+
+@pytest.fixture
+def cache(monkeypatch) -> DailyUsageCache:
+    """Enable the write-behind cache against the test database."""
+    cache = DailyUsageCache(session_factory, max_pending=100)
+    monkeypatch.setattr(usage_cache.settings, "DAILY_USAGE_CACHE_ENABLED", True)
+    monkeypatch.setattr(usage_cache, "_cache", cache)
+    return cache
+
+
+async def stored_usage(db: AsyncSession, device_id: str, day: str = None) -> int:
+    result = await db.execute(
+        select(DailyUsage.generations_used).where(
+            DailyUsage.device_id == device_id,
+            DailyUsage.date == (day or date.today().isoformat())
+        )
+    )
+    return result.scalar_one_or_none() or 0
+
+
+@pytest.mark.asyncio
+async def test_usage_served_from_memory_and_flushed(cache, db_session: AsyncSession):
+    """Test increments are visible immediately and written on flush."""
+    await token_service.increment_daily_usage(db_session, "cached-device")
+    await token_service.increment_daily_usage(db_session, "cached-device")
+    
+    assert await token_service.get_daily_usage(db_session, "cached-device") == 2
+    assert await stored_usage(db_session, "cached-device") == 0
+    
+    assert await cache.flush() == 1
+    assert await stored_usage(db_session, "cached-device") == 2
+    assert cache.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_free_reservations_respect_limit_in_memory(cache, db_session: AsyncSession):
+    """Test the in-memory path enforces the daily limit and refunds releases."""
+    limit = token_service.settings.FREE_DAILY_GENERATIONS
+    reservations = [
+        await token_service.reserve_generations(db_session, "limit-device")
+        for _ in range(limit + 1)
+    ]
+    
+    assert reservations[-1] is None
+    await token_service.release_generations(db_session, reservations[0])
+    assert await token_service.get_daily_usage(db_session, "limit-device") == limit - 1
+    
+    await cache.flush()
+    assert await stored_usage(db_session, "limit-device") == limit - 1
+
+
+@pytest.mark.asyncio
+async def test_day_rollover_flushes_under_original_date(cache, db_session: AsyncSession):
+    """Test deltas recorded before midnight are written to yesterday's row."""
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    cache.day = yesterday
+    cache.counts["rollover-device"] = 3
+    cache.pending[(yesterday, "rollover-device")] = 3
+    
+    assert await token_service.get_daily_usage(db_session, "rollover-device") == 0
+    await cache.flush()
+    
+    assert await stored_usage(db_session, "rollover-device", yesterday) == 3
+    assert await stored_usage(db_session, "rollover-device") == 0
+
+
+@pytest.mark.asyncio
+async def test_max_pending_bounds_loss_window(cache, db_session: AsyncSession):
+    """Test reaching the pending bound triggers a flush without waiting for the interval."""
+    cache.max_pending = 3
+    for device in ("a", "b", "c"):
+        await cache.add(db_session, f"bound-{device}", 1)
+    await asyncio.sleep(0.05)
+    
+    assert cache.pending == {}
+    assert await stored_usage(db_session, "bound-c") == 1
+
+
+@pytest.mark.asyncio
+async def test_cold_load_waits_for_in_flight_flush(cache, db_session: AsyncSession):
+    """Test a cold read during a slow flush sees the deltas being written."""
+    limit = token_service.settings.FREE_DAILY_GENERATIONS
+    entered, proceed = asyncio.Event(), asyncio.Event()
+
+    @asynccontextmanager
+    async def slow_session():
+        entered.set()
+        await proceed.wait()
+        async with session_factory() as db:
+            yield db
+
+    cache.session_factory = slow_session
+    await cache.add(db_session, "flushing-device", limit)
+    cache.counts.clear()  # e.g. evicted while its delta is still pending
+    flush = asyncio.create_task(cache.flush())
+    await entered.wait()
+    
+    used = asyncio.create_task(cache.get(db_session, "flushing-device"))
+    added = asyncio.create_task(cache.add(db_session, "flushing-device", 1, limit=limit))
+    await asyncio.sleep(0.01)
+    proceed.set()
+    
+    assert await flush == 1
+    assert await used == limit
+    assert await added is False
+    assert await stored_usage(db_session, "flushing-device") == limit
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.resume import ResumeVersion
+from app.services import autosave, version_history
+from app.services.autosave import AutosaveBuffer
+from tests.conftest import test_async_session as session_factory
+from tests.test_documents_api import DEVICE, create, save
+from tests.test_token_queries import count_statements
+
+
+@pytest.fixture(autouse=True)
+def snapshot_every(monkeypatch):
+    monkeypatch.setattr(version_history.settings, "RESUME_HISTORY_SNAPSHOT_EVERY", 4)
+
+
+async def edit_history(client: AsyncClient, saves: int) -> tuple[int, dict[int, list]]:
+    """Create a document and save `saves` edits; returns its id and skills per version."""
+    doc = await create(client, data={"skills": []})
+    states = {1: []}
+    for version in range(1, saves + 1):
+        patch = [{"op": "add", "path": "/data/skills/-", "value": f"skill {version}"}]
+        if version % 3 == 0:
+            patch = [{"op": "remove", "path": "/data/skills/0"}]
+        assert (await save(client, doc["id"], version, patch)).status_code == 200
+        states[version + 1] = (await client.get(
+            f"/api/v1/resume/documents/{doc['id']}", headers=DEVICE
+        )).json()["data"]["skills"]
+    return doc["id"], states
+
+
+async def kinds(db: AsyncSession, document_id: int) -> dict[int, str]:
+    result = await db.execute(
+        select(ResumeVersion.version, ResumeVersion.kind)
+        .where(ResumeVersion.resume_id == document_id)
+        .order_by(ResumeVersion.version)
+    )
+    return dict(result.all())
+
+
+@pytest.mark.asyncio
+async def test_versions_are_deltas_between_snapshots(client: AsyncClient, db_session: AsyncSession):
+    """Test every save is recorded, with a snapshot every K versions, and each reconstructs."""
+    document_id, states = await edit_history(client, 9)
+    url = f"/api/v1/resume/documents/{document_id}/versions"
+
+    listed = (await client.get(url, headers=DEVICE)).json()
+    assert [v["version"] for v in listed] == list(range(10, 0, -1))
+    assert [v for v, kind in (await kinds(db_session, document_id)).items() if kind == "snapshot"] == [1, 5, 9]
+    for version, skills in states.items():
+        response = await client.get(f"{url}/{version}", headers=DEVICE)
+        assert response.json()["data"]["skills"] == skills
+    assert (await client.get(f"{url}/11", headers=DEVICE)).status_code == 404
+    assert (await client.get(url, headers={"X-Device-Id": "other"})).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_reconstruction_cost_is_bounded(client: AsyncClient, db_session: AsyncSession):
+    """Test a version is rebuilt from one query over at most K rows, however long the history."""
+    document_id, states = await edit_history(client, 30)
+
+    with count_statements() as statements:
+        document, _ = await version_history.get_version(db_session, document_id, 31)
+    snapshot = max(v for v, kind in (await kinds(db_session, document_id)).items() if kind == "snapshot")
+
+    assert document["data"]["skills"] == states[31]
+    assert len(statements) == 1
+    assert 31 - snapshot + 1 <= 4
+
+
+@pytest.mark.asyncio
+async def test_restore_saves_a_new_version(client: AsyncClient):
+    """Test restoring an old version makes it current without rewriting history."""
+    document_id, states = await edit_history(client, 4)
+    url = f"/api/v1/resume/documents/{document_id}"
+
+    stale = await client.post(f"{url}/versions/2/restore", headers={**DEVICE, "If-Match": '"1"'})
+    restored = await client.post(f"{url}/versions/2/restore", headers={**DEVICE, "If-Match": '"5"'})
+    current = (await client.get(url, headers=DEVICE)).json()
+
+    assert stale.status_code == 412
+    assert restored.json() == {"id": document_id, "version": 6}
+    assert current["data"]["skills"] == states[2]
+    assert (await client.get(f"{url}/versions/5", headers=DEVICE)).json()["data"]["skills"] == states[5]
+
+
+@pytest.mark.asyncio
+async def test_compaction_prunes_and_keeps_versions_readable(
+    client: AsyncClient, db_session: AsyncSession, monkeypatch
+):
+    """Test pruning by count and by age turns the oldest kept version into a snapshot."""
+    document_id, states = await edit_history(client, 11)
+    monkeypatch.setattr(version_history.settings, "RESUME_HISTORY_MAX_VERSIONS", 6)
+
+    assert await version_history.compact_history(db_session) == 6
+    assert await kinds(db_session, document_id) == {
+        7: "snapshot", 8: "delta", 9: "snapshot", 10: "delta", 11: "delta", 12: "delta"
+    }
+    for version in range(7, 13):
+        document, _ = await version_history.get_version(db_session, document_id, version)
+        assert document["data"]["skills"] == states[version]
+
+    await db_session.execute(
+        update(ResumeVersion)
+        .where(ResumeVersion.resume_id == document_id, ResumeVersion.version < 11)
+        .values(created_at=datetime.utcnow() - timedelta(days=365))
+    )
+    await db_session.commit()
+    assert await version_history.compact_history(db_session) == 4
+    assert await kinds(db_session, document_id) == {11: "snapshot", 12: "delta"}
+    assert await version_history.compact_history(db_session) == 0
+
+
+@pytest.mark.asyncio
+async def test_buffered_saves_record_flushed_versions(client: AsyncClient, db_session: AsyncSession, monkeypatch):
+    """Test coalesced autosaves are recorded as one delta per flush."""
+    monkeypatch.setattr(autosave.settings, "AUTOSAVE_BUFFER_ENABLED", True)
+    monkeypatch.setattr(autosave, "_buffer", AutosaveBuffer(session_factory, window=60.0, max_pending=100))
+    doc = await create(client, data={"skills": []})
+    for version in range(1, 4):
+        await save(client, doc["id"], version, [{"op": "add", "path": "/data/skills/-", "value": str(version)}])
+    await autosave.get_buffer().flush()
+    await save(client, doc["id"], 4, [{"op": "remove", "path": "/data/skills/0"}])
+    await autosave.get_buffer().flush()
+
+    assert await kinds(db_session, doc["id"]) == {1: "snapshot", 4: "delta", 5: "delta"}
+    document, _ = await version_history.get_version(db_session, doc["id"], 4)
+    assert document["data"]["skills"] == ["1", "2", "3"]
+
+
+@pytest.mark.asyncio
+async def test_delete_removes_history(client: AsyncClient, db_session: AsyncSession):
+    """Test deleting a document deletes its versions."""
+    document_id, _ = await edit_history(client, 2)
+
+    await client.delete(f"/api/v1/resume/documents/{document_id}", headers=DEVICE)
+    assert await kinds(db_session, document_id) == {}
@@ -0,0 +1,138 @@
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.metrics import TOOL_NAME
+from app.models.token import PaymentTransaction, WebhookEvent
+from app.services import token_service, webhook_inbox
+from tests.conftest import test_async_session as session_factory
+
+URL = "/api/v1/payment/webhooks/creem"
+
+
+def checkout_event(event_id: str = "evt_1", checkout_id: str = "ch_1", device_id="buyer", generations="30") -> dict:
+    return {
+        "id": event_id,
+        "eventType": "checkout.completed",
+        "object": {
+            "id": checkout_id,
+            "metadata": {"product_sku": "starter_30", "device_id": device_id, "generations": generations},
+            "order": {"amount": 299, "currency": "USD"},
+        },
+    }
+
+
+async def inbox(db: AsyncSession) -> list[WebhookEvent]:
+    db.expire_all()
+    return list((await db.execute(select(WebhookEvent).order_by(WebhookEvent.id))).scalars())
+
+
+async def make_due(db: AsyncSession) -> None:
+    await db.execute(update(WebhookEvent).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_webhook_is_stored_and_processed_once(client: AsyncClient, db_session: AsyncSession):
+    """Test events are acknowledged before processing and redeliveries grant nothing more."""
+    first = await client.post(URL, json=checkout_event())
+    redelivered = await client.post(URL, json=checkout_event())
+    assert first.status_code == redelivered.status_code == 200
+    assert len(await inbox(db_session)) == 1
+    assert await token_service.get_balance(db_session, "buyer") == 0
+
+    assert await webhook_inbox.process_due(session_factory) == 1
+    await client.post(URL, json=checkout_event(event_id="evt_2"))
+    assert await webhook_inbox.process_due(session_factory) == 1
+
+    events = await inbox(db_session)
+    assert [event.status for event in events] == ["done", "done"]
+    assert await token_service.get_balance(db_session, "buyer") == 30
+    transactions = (await db_session.execute(select(PaymentTransaction))).scalars().all()
+    assert [(t.checkout_id, t.tokens_granted) for t in transactions] == [("ch_1", 30)]
+    assert REGISTRY.get_sample_value(
+        "webhook_events_total", {"tool": TOOL_NAME, "event_type": "checkout.completed", "result": "duplicate"}
+    ) >= 1
+
+
+@pytest.mark.asyncio
+async def test_failures_are_retried_then_dead_lettered(
+    client: AsyncClient, db_session: AsyncSession, monkeypatch
+):
+    """Test a failing event backs off between attempts and is dead-lettered at the limit."""
+    monkeypatch.setattr(webhook_inbox.settings, "WEBHOOK_MAX_ATTEMPTS", 3)
+
+    async def failing_add_tokens(db, device_id, amount):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(token_service, "add_tokens", failing_add_tokens)
+    await client.post(URL, json=checkout_event())
+
+    await webhook_inbox.process_due(session_factory)
+    (event,) = await inbox(db_session)
+    assert (event.status, event.attempts) == ("pending", 1)
+    assert event.next_attempt_at > datetime.utcnow()
+    assert "database is locked" in event.last_error
+    assert await webhook_inbox.process_due(session_factory) == 0
+
+    for _ in range(2):
+        await make_due(db_session)
+        await webhook_inbox.process_due(session_factory)
+    (event,) = await inbox(db_session)
+    assert (event.status, event.attempts) == ("dead", 3)
+    assert (await db_session.execute(select(PaymentTransaction))).scalars().all() == []
+
+
+@pytest.mark.asyncio
+async def test_invalid_events_are_dead_lettered_immediately(client: AsyncClient, db_session: AsyncSession):
+    """Test events that can never succeed skip the retries; unknown types are ignored."""
+    await client.post(URL, json={"eventType": "checkout.completed", "object": {}})
+    await client.post(URL, json=checkout_event(event_id="evt_bad", checkout_id="ch_2", generations="many"))
+    await client.post(URL, json={"id": "evt_sub", "eventType": "subscription.active", "object": {}})
+
+    assert await webhook_inbox.process_due(session_factory) == 3
+    assert [(e.status, e.attempts) for e in await inbox(db_session)] == [("dead", 1), ("dead", 1), ("done", 1)]
+
+
+@pytest.mark.asyncio
+async def test_lag_metrics(client: AsyncClient, db_session: AsyncSession):
+    """Test the pending count and oldest age reflect unprocessed events."""
+    await client.post(URL, json=checkout_event())
+    await db_session.execute(update(WebhookEvent).values(received_at=datetime.utcnow() - timedelta(seconds=90)))
+    await db_session.commit()
+
+    await webhook_inbox.update_lag_metrics(db_session)
+    assert REGISTRY.get_sample_value("webhook_inbox_pending", {"tool": TOOL_NAME}) == 1
+    assert REGISTRY.get_sample_value("webhook_inbox_oldest_pending_seconds", {"tool": TOOL_NAME}) >= 90
+
+    await webhook_inbox.process_due(session_factory)
+    assert REGISTRY.get_sample_value("webhook_inbox_pending", {"tool": TOOL_NAME}) == 0
+
+
+@pytest.mark.asyncio
+async def test_signed_webhooks(client: AsyncClient, db_session: AsyncSession, monkeypatch):
+    """Test a bad signature is rejected before anything is stored."""
+    monkeypatch.setattr(webhook_inbox.settings, "CREEM_WEBHOOK_SECRET", "whsec")
+    body = json.dumps(checkout_event()).encode()
+    signature = hmac.new(b"whsec", body, hashlib.sha256).hexdigest()
+
+    rejected = await client.post(URL, content=body, headers={"creem-signature": "bad"})
+    accepted = await client.post(URL, content=body, headers={"creem-signature": signature})
+
+    assert (rejected.status_code, accepted.status_code) == (400, 200)
+    assert len(await inbox(db_session)) == 1
+
+
+def test_retry_delay_grows_with_jitter():
+    """Test backoff doubles per attempt up to the cap."""
+    delays = [webhook_inbox.retry_delay(attempt) for attempt in range(1, 30)]
+
+    assert 2.5 <= delays[0] <= 5
+    assert 20 <= delays[3] <= 40
+    assert max(delays) <= webhook_inbox.settings.WEBHOOK_RETRY_MAX_SECONDS